@@ -4,12 +4,21 @@ import shutil
 import os
 import traceback
 
-client = Client("multimodalart/Ip-Adapter-FaceID", hf_token=os.getenv("HUGGINGFACE_TOKEN"))
+_client = None
+
+def get_client() -> Client:
+    # Created on first use rather than at import, so importing the app never
+    # touches the network; the same client is reused by later requests
+    global _client
+    if _client is None:
+        _client = Client("multimodalart/Ip-Adapter-FaceID", hf_token=os.getenv("HUGGINGFACE_TOKEN"))
+    return _client
 
 def generate_ai_image(selfie_path: Path, prompt: str) -> list[str]:
+    global _client
     try:
         print("\U0001F4E1 Sending request to Hugging Face...")
-        result = client.predict(
+        result = get_client().predict(
             images=[handle_file(str(selfie_path))],
             prompt=prompt,
             negative_prompt="",
@@ -52,4 +61,6 @@ def generate_ai_image(selfie_path: Path, prompt: str) -> list[str]:
     except Exception as e:
         print("\u274C generate_ai_image FAILED:")
         traceback.print_exc()
+        # Start the next request with a fresh session
+        _client = None
         raise e
@@ -0,0 +1,162 @@
+"""
+Micro-benchmark: llm_json extraction vs. the regex pipelines it replaced.
+
+Builds large synthetic completions (markdown fences, trailing commas,
+truncation at max_tokens) and times both approaches on each. Run with:
+
+    python benchmark_llm_json.py [--repeat 200]
+"""
+
+import argparse
+import json
+import re
+import timeit
+
+from llm_json import extract_json, salvage_objects
+
+
+def legacy_destinations(content):
+    """The markdown-strip / re.sub / re.search / re.findall pipeline from generate_destinations_with_openai"""
+    cleaned_content = content.strip()
+    if cleaned_content.startswith('```json'):
+        cleaned_content = cleaned_content[7:]
+    if cleaned_content.startswith('```'):
+        cleaned_content = cleaned_content[3:]
+    if cleaned_content.endswith('```'):
+        cleaned_content = cleaned_content[:-3]
+    cleaned_content = cleaned_content.strip()
+    cleaned_content = re.sub(r',\s*}', '}', cleaned_content)
+    cleaned_content = re.sub(r',\s*]', ']', cleaned_content)
+    json_match = re.search(r'\[.*\]', cleaned_content, re.DOTALL)
+    if json_match:
+        try:
+            return json.loads(json_match.group())
+        except json.JSONDecodeError:
+            pass
+    results = []
+    for match in re.findall(r'\{[^{}]*(?:"name"[^{}]*)[^{}]*\}', cleaned_content, re.DOTALL):
+        try:
+            results.append(json.loads(re.sub(r',\s*}', '}', match)))
+        except json.JSONDecodeError:
+            continue
+    return results
+
+
+def legacy_itinerary(content):
+    """The re.search / re.sub retry pipeline from generate_detailed_itinerary"""
+    json_match = re.search(r'\{.*\}', content, re.DOTALL)
+    if not json_match:
+        return None
+    json_content = json_match.group()
+    try:
+        return json.loads(json_content)
+    except json.JSONDecodeError:
+        json_content = re.sub(r',(\s*[}\]])', r'\1', json_content)
+        json_content = re.sub(r',\s*,', ',', json_content)
+        json_content = re.sub(r',\s*}', '}', json_content)
+        json_content = re.sub(r',\s*]', ']', json_content)
+        try:
+            return json.loads(json_content)
+        except json.JSONDecodeError:
+            return None
+
+
+def new_destinations(content):
+    data = extract_json(content, expect="array")
+    if not isinstance(data, list):
+        data = salvage_objects(content, required_key="name")
+    return data
+
+
+def new_itinerary(content):
+    return extract_json(content, expect="object")
+
+
+def make_destinations(count):
+    return [
+        {
+            "name": f"Destination {i}",
+            "country": "Country",
+            "continent": "Asia",
+            "description": "A vibrant city with temples, markets, {curly} text and \"quoted\" words. " * 4,
+            "highlights": ["Temples", "Street food", "Night markets", "Museums"],
+            "rating": 4.6,
+            "price": "$$",
+            "bestTime": "November to March",
+            "coordinates": {"lat": 13.75, "lng": 100.5},
+        }
+        for i in range(count)
+    ]
+
+
+def make_itinerary(days):
+    return {
+        "destination": "Bangkok, Thailand",
+        "duration": f"{days} days",
+        "overview": "An itinerary covering the city's highlights. " * 5,
+        "dailyItinerary": [
+            {
+                "day": d,
+                "title": f"Day {d}",
+                "activities": [
+                    {"time": f"{h:02d}:00", "activity": "Visit a landmark", "location": "Old Town",
+                     "cost": "$20", "duration": "2 hours", "tips": "Go early, bring water"}
+                    for h in range(8, 20, 3)
+                ],
+                "meals": {"breakfast": "Hotel", "lunch": "Market", "dinner": "Riverside"},
+                "accommodation": "Central hotel",
+                "transportation": "BTS Skytrain",
+            }
+            for d in range(1, days + 1)
+        ],
+        "budgetBreakdown": {"accommodation": "$600", "food": "$300", "activities": "$250"},
+        "travelTips": ["Carry cash", "Dress modestly at temples", "Use the river boats"],
+    }
+
+
+def with_trailing_commas(text):
+    return text.replace('"\n', '",\n').replace("}\n", "},\n").replace("]\n", "],\n")
+
+
+def fenced(text):
+    return f"Here is your result:\n```json\n{text}\n```\nEnjoy!"
+
+
+def cases():
+    destinations = json.dumps(make_destinations(60), indent=2)
+    itinerary = json.dumps(make_itinerary(14), indent=2)
+    return [
+        ("destinations clean", legacy_destinations, new_destinations, fenced(destinations)),
+        ("destinations trailing commas", legacy_destinations, new_destinations, fenced(with_trailing_commas(destinations))),
+        ("destinations truncated", legacy_destinations, new_destinations, fenced(destinations[: int(len(destinations) * 0.8)])),
+        ("itinerary clean", legacy_itinerary, new_itinerary, fenced(itinerary)),
+        ("itinerary trailing commas", legacy_itinerary, new_itinerary, fenced(with_trailing_commas(itinerary))),
+        ("itinerary truncated", legacy_itinerary, new_itinerary, fenced(itinerary[: int(len(itinerary) * 0.8)])),
+    ]
+
+
+def summarize(value):
+    if isinstance(value, list):
+        return f"{len(value)} items"
+    if isinstance(value, dict):
+        return f"{len(value.get('dailyItinerary', []))} days"
+    return "failed"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'case':32} {'size':>8} {'legacy ms':>10} {'new ms':>8} {'speedup':>8}  legacy / new result")
+    for name, legacy, new, text in cases():
+        legacy_ms = min(timeit.repeat(lambda: legacy(text), number=args.repeat, repeat=3)) / args.repeat * 1000
+        new_ms = min(timeit.repeat(lambda: new(text), number=args.repeat, repeat=3)) / args.repeat * 1000
+        print(
+            f"{name:32} {len(text):>8} {legacy_ms:>10.3f} {new_ms:>8.3f} {legacy_ms / new_ms:>7.1f}x  "
+            f"{summarize(legacy(text))} / {summarize(new(text))}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+"""
+Benchmark: example-JSON prompts vs. schema outlines with JSON mode.
+
+Sends the legacy prompts (long example JSON blobs, free-form output parsed
+with extract_json) and the schema prompts (llm_schemas outline, JSON mode,
+TypeAdapter validation) through LLMGateway to a local stub of the OpenAI
+chat completions API. The stub answers with the same payload for both (minus
+the ids the schema no longer asks for) and sleeps according to a simple
+token-based latency model, so differences come from prompt size, the prose
+and fences a model adds outside JSON mode, and parsing. Token counts are
+approximate (words, punctuation and indentation runs). Run with:
+
+    python benchmark_llm_schemas.py [--repeat 5] [--ms-per-prompt-token 0.05] [--ms-per-completion-token 0.5]
+"""
+
+import argparse
+import asyncio
+import json
+import re
+import statistics
+import time
+import timeit
+
+import httpx
+from openai import AsyncOpenAI
+
+from llm_gateway import LLMGateway
+from llm_json import extract_json
+from llm_schemas import BOOKING_RESULTS, DETAILED_ITINERARY, PERSONALIZED_RECOMMENDATIONS
+
+# Words, punctuation, and a newline with its indentation, roughly as a BPE tokenizer splits JSON
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]|\n\s*")
+
+LEGACY_RECOMMENDATIONS_FORMAT = """Format the response as a valid JSON object with this exact structure:
+{
+    "destinations": [ ... ],
+    "itinerary": [ ... ],
+    "travelTips": [ ... ],
+    "budgetBreakdown": { ... }
+}
+
+For each destination, include:
+- id (unique identifier)
+- name (destination name)
+- country
+- description (2-3 sentences)
+- image_url (use high-quality Unsplash URLs like: https://images.unsplash.com/photo-[ID]?w=800&h=600&fit=crop)
+- rating (4.0-5.0)
+- price ($, $$, or $$$)
+- highlights (array of 4 key attractions)"""
+
+LEGACY_ITINERARY_EXAMPLE = {
+    "tripOverview": {
+        "title": "Trip title", "destination": "Bali", "duration": "5 days", "travelers": 2,
+        "bestTime": "Best time to visit", "weather": "Typical weather", "summary": "Brief trip summary"
+    },
+    "dailyItinerary": [{
+        "day": 1, "title": "Day title", "morning": ["Activity 1", "Activity 2"],
+        "afternoon": ["Activity 3", "Activity 4"], "evening": ["Activity 5", "Activity 6"],
+        "accommodation": "Hotel name", "meals": ["Breakfast", "Lunch", "Dinner"], "transportation": "Transport method"
+    }],
+    "budgetBreakdown": {
+        "accommodation": {"total": 350, "perNight": 50, "type": "3-star hotel", "description": "Comfortable accommodation in city center"},
+        "meals": {"total": 210, "perDay": 30, "breakdown": {"breakfast": 8, "lunch": 12, "dinner": 10}},
+        "activities": {"total": 180, "breakdown": {"sightseeing": 45, "adventures": 80, "cultural": 55}},
+        "transportation": {"total": 120, "breakdown": {"airport_transfer": 25, "daily_transport": 95}},
+        "miscellaneous": {"total": 50, "breakdown": {"tips": 20, "souvenirs": 30}},
+        "totalTripCost": 910, "costPerPerson": 455, "currency": "USD"
+    },
+    "travelTips": [
+        {"category": "Packing", "tips": ["Tip 1", "Tip 2", "Tip 3"]},
+        {"category": "Local Customs", "tips": ["Tip 1", "Tip 2", "Tip 3"]},
+        {"category": "Safety", "tips": ["Tip 1", "Tip 2", "Tip 3"]}
+    ],
+    "accommodations": [{
+        "name": "Hotel name", "type": "3-star", "location": "Location", "amenities": ["WiFi", "Pool", "Restaurant"],
+        "price": "50/night", "rating": 4.2, "pros": ["Pro 1", "Pro 2"], "cons": ["Con 1", "Con 2"]
+    }],
+    "restaurants": [{
+        "name": "Restaurant name", "cuisine": "Local cuisine", "specialty": "Famous dish", "priceRange": "$$",
+        "location": "Location", "rating": 4.5, "bestDishes": ["Dish 1", "Dish 2"], "reservationRequired": False
+    }]
+}
+
+LEGACY_FLIGHTS_FORMAT = """Return as JSON array with these exact fields:
+```json
+[
+  {
+    "id": "unique_id",
+    "airline": "Airline Name",
+    "flightNumber": "XX1234",
+    "from": "Departure City",
+    "to": "Destination City",
+    "departureTime": "HH:MM AM/PM",
+    "departureDate": "YYYY-MM-DD",
+    "duration": "Xh Ym",
+    "price": 123,
+    "aircraft": "Boeing 737/Airbus A320/etc",
+    "stops": 0,
+    "class": "economy"
+  }
+]```"""
+
+LEGACY_HOTELS_FORMAT = """Return as JSON array with these exact fields:
+```json
+[
+  {
+    "id": "unique_id",
+    "name": "Hotel Name",
+    "location": "City, Country",
+    "rating": 4.5,
+    "price": 123,
+    "amenities": ["WiFi", "Pool", "Spa"],
+    "description": "Brief description",
+    "image": "https://images.unsplash.com/photo-...",
+    "distance": "0.5 km from center"
+  }
+]```"""
+
+ITINERARY_GUIDELINES = """IMPORTANT GUIDELINES:
+1. Make all prices realistic for the destination and budget level
+2. For budget level: "budget" = 60% of normal prices, "mid-range" = normal prices, "luxury" = 150% of normal prices
+3. Adjust prices based on number of travelers
+4. Include specific, realistic activities for the destination
+5. Provide practical travel tips
+6. Make accommodation and restaurant recommendations specific to the destination
+7. Ensure all costs are in USD and realistic for the destination
+8. Include seasonal considerations in pricing and recommendations"""
+
+
+def count_tokens(text):
+    return len(_TOKEN_RE.findall(text))
+
+
+def recommendations_payload():
+    return {
+        "destinations": [
+            {"id": f"d{i}", "name": f"Destination {i}", "country": "Indonesia",
+             "description": "Volcanic peaks, rice terraces and temples. Great food and beaches.",
+             "image_url": "https://images.unsplash.com/photo-1537996194471-e657df975ab4?w=800&h=600&fit=crop",
+             "rating": 4.7, "price": "$$", "highlights": ["Temples", "Rice terraces", "Beaches", "Markets"]}
+            for i in range(10)
+        ],
+        "itinerary": [{"day": d, "title": f"Day {d}", "activities": ["Morning hike", "Temple visit", "Sunset dinner"]} for d in range(1, 6)],
+        "travelTips": ["Carry cash", "Respect temple dress codes", "Use ride-hailing apps"],
+        "budgetBreakdown": {"accommodation": 600, "food": 300, "activities": 250, "transport": 150},
+    }
+
+
+def itinerary_payload():
+    day = LEGACY_ITINERARY_EXAMPLE["dailyItinerary"][0]
+    return {**LEGACY_ITINERARY_EXAMPLE, "dailyItinerary": [{**day, "day": d, "title": f"Day {d}"} for d in range(1, 6)]}
+
+
+def flights_payload():
+    return {"results": [
+        {"id": f"f{i}", "airline": "Emirates", "flightNumber": f"EK50{i}", "from": "Mumbai", "to": "Bangalore",
+         "departureTime": "09:30 AM", "departureDate": "2026-12-01", "duration": "1h 45m", "price": 120 + i * 15,
+         "aircraft": "Airbus A320", "stops": 0, "class": "economy"}
+        for i in range(6)
+    ]}
+
+
+def hotels_payload():
+    return {"results": [
+        {"id": f"h{i}", "name": f"Hotel {i}", "location": "Bangalore, India", "rating": 4.4, "price": 90 + i * 20,
+         "amenities": ["WiFi", "Pool", "Spa"], "description": "Business hotel near MG Road.",
+         "image": "https://images.unsplash.com/photo-1566073771259-6a8506099945", "distance": "1.2 km from center"}
+        for i in range(6)
+    ]}
+
+
+def legacy_required_keys(data, keys):
+    if not isinstance(data, dict) or any(key not in data for key in keys):
+        return None
+    return data
+
+
+def cases():
+    base_recommendations = ("Generate personalized travel recommendations for a 25-34 age group traveling as couple "
+                            "with a budget of $3000 for a 5-day trip. The user's selected interests are: beaches, food, culture.\n\n")
+    base_itinerary = "Generate a comprehensive travel itinerary for Bali for 5 days with 2 travelers on a mid-range budget.\n\n"
+    base_flights = "Generate 6 realistic flight options from Mumbai to Bangalore for 1 passenger(s) in economy class.\n\n"
+    base_hotels = "Generate 6 realistic hotel options in Bangalore for 2 guest(s).\n\n"
+    return [
+        (
+            "personalized-recommendations", recommendations_payload(),
+            base_recommendations + LEGACY_RECOMMENDATIONS_FORMAT,
+            lambda content: legacy_required_keys(extract_json(content, expect="object"), ["destinations", "itinerary", "travelTips", "budgetBreakdown"]),
+            base_recommendations + PERSONALIZED_RECOMMENDATIONS.instructions(), PERSONALIZED_RECOMMENDATIONS,
+        ),
+        (
+            "detailed-itinerary", itinerary_payload(),
+            base_itinerary + "Please provide a detailed response in this exact JSON format:\n\n"
+            + json.dumps(LEGACY_ITINERARY_EXAMPLE, indent=4) + "\n\n" + ITINERARY_GUIDELINES,
+            lambda content: extract_json(content, expect="object"),
+            base_itinerary + DETAILED_ITINERARY.instructions() + "\n\n" + ITINERARY_GUIDELINES, DETAILED_ITINERARY,
+        ),
+        (
+            "search-bookings flights", flights_payload(),
+            base_flights + LEGACY_FLIGHTS_FORMAT,
+            lambda content: extract_json(content, expect="array"),
+            base_flights + BOOKING_RESULTS["flights"].instructions(), BOOKING_RESULTS["flights"],
+        ),
+        (
+            "search-bookings hotels", hotels_payload(),
+            base_hotels + LEGACY_HOTELS_FORMAT,
+            lambda content: extract_json(content, expect="array"),
+            base_hotels + BOOKING_RESULTS["hotels"].instructions(), BOOKING_RESULTS["hotels"],
+        ),
+    ]
+
+
+def without_ids(payload, schema):
+    stripped = dict(payload)
+    for key in ("results", "destinations"):
+        if key in payload and '"id"' not in schema.outline:
+            stripped[key] = [{k: v for k, v in item.items() if k != "id"} for item in payload[key]]
+    return stripped
+
+
+def legacy_completion(payload):
+    """What the model tends to write without JSON mode: prose, a fence and indented JSON"""
+    body = payload["results"] if set(payload) == {"results"} else payload
+    return f"Here are the results you asked for:\n\n```json\n{json.dumps(body, indent=2)}\n```\n\nLet me know if you need anything else!"
+
+
+def stub_transport(args, completions):
+    """Local stand-in for /v1/chat/completions with latency driven by token counts"""
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        prompt = "".join(message["content"] for message in body["messages"])
+        content = completions[prompt]
+        seconds = (args.ms_overhead
+                   + count_tokens(prompt) * args.ms_per_prompt_token
+                   + count_tokens(content) * args.ms_per_completion_token) / 1000
+        await asyncio.sleep(seconds)
+        return httpx.Response(200, json={
+            "id": "chatcmpl-stub", "object": "chat.completion", "created": int(time.time()), "model": body["model"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": count_tokens(prompt), "completion_tokens": count_tokens(content), "total_tokens": 0},
+        })
+
+    return httpx.MockTransport(handler)
+
+
+async def run(args):
+    items = cases()
+    completions = {}
+    for _, payload, legacy_prompt, _, new_prompt, schema in items:
+        completions[legacy_prompt] = legacy_completion(payload)
+        # The schema outline does not ask for server-filled ids
+        completions[new_prompt] = json.dumps(without_ids(payload, schema), indent=2)
+
+    gateway = LLMGateway(api_key="sk-stub", cache=None)
+    gateway.client = AsyncOpenAI(
+        api_key="sk-stub",
+        base_url="http://stub.local/v1",
+        http_client=httpx.AsyncClient(transport=stub_transport(args, completions)),
+        max_retries=0,
+    )
+
+    async def timed(prompt, parse, response_format=None):
+        samples = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            result = await gateway.complete(
+                messages=[{"role": "user", "content": prompt}], response_format=response_format
+            )
+            assert parse(result.content) is not None
+            samples.append((time.perf_counter() - start) * 1000)
+        return statistics.median(samples)
+
+    print(f"{'endpoint':30} {'prompt tok':>16} {'completion tok':>16} {'latency ms':>18} {'parse ms':>14}")
+    print(f"{'':30} {'before':>7} {'after':>8} {'before':>7} {'after':>8} {'before':>8} {'after':>9} {'before':>6} {'after':>7}")
+    for name, _, legacy_prompt, legacy_parse, new_prompt, schema in items:
+        legacy_ms = await timed(legacy_prompt, legacy_parse)
+        new_ms = await timed(new_prompt, schema.parse, schema.response_format)
+        legacy_parse_ms = min(timeit.repeat(lambda: legacy_parse(completions[legacy_prompt]), number=200, repeat=3)) / 200 * 1000
+        new_parse_ms = min(timeit.repeat(lambda: schema.parse(completions[new_prompt]), number=200, repeat=3)) / 200 * 1000
+        print(
+            f"{name:30} {count_tokens(legacy_prompt):>7} {count_tokens(new_prompt):>8} "
+            f"{count_tokens(completions[legacy_prompt]):>7} {count_tokens(completions[new_prompt]):>8} "
+            f"{legacy_ms:>8.0f} {new_ms:>9.0f} {legacy_parse_ms:>6.3f} {new_parse_ms:>7.3f}"
+        )
+    await gateway.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--ms-overhead", type=float, default=20.0)
+    parser.add_argument("--ms-per-prompt-token", type=float, default=0.05)
+    parser.add_argument("--ms-per-completion-token", type=float, default=0.5)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
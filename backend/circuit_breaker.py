@@ -0,0 +1,192 @@
+"""
+Circuit breakers for upstream providers.
+
+Each upstream (Amadeus, OpenAI, Hugging Face, Supabase) gets one breaker.
+While a provider keeps failing the breaker opens and callers go straight to
+their fallback instead of waiting for another timeout or 500. After a
+cool-down a limited number of probe calls are let through; a successful probe
+closes the breaker again.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+FAILURE_RATE_THRESHOLD = float(os.getenv("CIRCUIT_FAILURE_RATE", "0.5"))
+MINIMUM_CALLS = int(os.getenv("CIRCUIT_MINIMUM_CALLS", "5"))
+WINDOW_SECONDS = float(os.getenv("CIRCUIT_WINDOW_SECONDS", "60"))
+OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))
+HALF_OPEN_PROBES = int(os.getenv("CIRCUIT_HALF_OPEN_PROBES", "1"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose breaker is open"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} circuit is open, retry in {retry_after:.0f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker driven by the failure rate over a sliding time window"""
+
+    def __init__(
+        self,
+        name: str,
+        failure_rate_threshold: float = FAILURE_RATE_THRESHOLD,
+        minimum_calls: int = MINIMUM_CALLS,
+        window_seconds: float = WINDOW_SECONDS,
+        open_seconds: float = OPEN_SECONDS,
+        half_open_probes: int = HALF_OPEN_PROBES,
+        is_failure: Optional[Callable[[BaseException], bool]] = None,
+    ):
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.minimum_calls = minimum_calls
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self.half_open_probes = max(1, half_open_probes)
+        # Errors that say nothing about provider health (e.g. a 400 for bad input) do not count
+        self.is_failure = is_failure or (lambda e: True)
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._window: deque = deque()  # (timestamp, succeeded)
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._counters = {"calls": 0, "successes": 0, "failures": 0, "rejected": 0, "opened": 0}
+        self._last_error: Optional[str] = None
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def before_call(self):
+        """Reserve permission for one call; raises CircuitOpenError when the call must not go out"""
+        with self._lock:
+            now = time.monotonic()
+            state = self._current_state(now)
+            if state == CLOSED:
+                self._counters["calls"] += 1
+                return
+            if state == HALF_OPEN and self._probes_in_flight < self.half_open_probes:
+                self._probes_in_flight += 1
+                self._counters["calls"] += 1
+                logger.info(f"Circuit {self.name}: sending probe request")
+                return
+            self._counters["rejected"] += 1
+            retry_after = max(0.0, self._opened_at + self.open_seconds - now)
+        raise CircuitOpenError(self.name, retry_after)
+
+    def record_success(self):
+        with self._lock:
+            now = time.monotonic()
+            self._counters["successes"] += 1
+            if self._state == HALF_OPEN or self._current_state(now) == HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                self._state = CLOSED
+                self._window.clear()
+                logger.info(f"Circuit {self.name}: probe succeeded, closing")
+                return
+            self._add(now, True)
+
+    def record_failure(self, error: Optional[BaseException] = None):
+        if error is not None and not self.is_failure(error):
+            # The call reached a healthy provider; it just did not like the request
+            self.record_success()
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._counters["failures"] += 1
+            self._last_error = str(error)[:200] if error is not None else None
+            if self._current_state(now) == HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                self._open(now, "probe failed")
+                return
+            self._add(now, False)
+            calls = len(self._window)
+            failures = sum(1 for _, ok in self._window if not ok)
+            if self._state == CLOSED and calls >= self.minimum_calls and failures / calls >= self.failure_rate_threshold:
+                self._open(now, f"{failures}/{calls} calls failed")
+
+    def release(self):
+        """Give back a probe slot for a call that ended without an outcome (e.g. cancelled)"""
+        with self._lock:
+            if self._probes_in_flight:
+                self._probes_in_flight -= 1
+
+    async def call(self, factory: Callable[[], Awaitable[T]]) -> T:
+        """Await ``factory()`` through the breaker"""
+        self.before_call()
+        try:
+            result = await factory()
+        except asyncio.CancelledError:
+            self.release()
+            raise
+        except Exception as e:
+            self.record_failure(e)
+            raise
+        self.record_success()
+        return result
+
+    async def call_sync(self, fn: Callable[[], T]) -> T:
+        """Run blocking ``fn()`` in a worker thread through the breaker"""
+        return await self.call(lambda: asyncio.to_thread(fn))
+
+    def stats(self) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            state = self._current_state(now)
+            self._trim(now)
+            calls = len(self._window)
+            failures = sum(1 for _, ok in self._window if not ok)
+            return {
+                "state": state,
+                "window_calls": calls,
+                "window_failure_rate": round(failures / calls, 4) if calls else 0.0,
+                "retry_after_seconds": round(max(0.0, self._opened_at + self.open_seconds - now), 1) if state == OPEN else 0.0,
+                "last_error": self._last_error,
+                **self._counters,
+                "config": {
+                    "failure_rate_threshold": self.failure_rate_threshold,
+                    "minimum_calls": self.minimum_calls,
+                    "window_seconds": self.window_seconds,
+                    "open_seconds": self.open_seconds,
+                    "half_open_probes": self.half_open_probes,
+                },
+            }
+
+    def _current_state(self, now: float) -> str:
+        if self._state == OPEN and now - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._probes_in_flight = 0
+        return self._state
+
+    def _open(self, now: float, reason: str):
+        self._state = OPEN
+        self._opened_at = now
+        self._window.clear()
+        self._counters["opened"] += 1
+        logger.warning(f"Circuit {self.name} opened ({reason}); failing fast for {self.open_seconds:.0f}s")
+
+    def _add(self, now: float, succeeded: bool):
+        self._window.append((now, succeeded))
+        self._trim(now)
+
+    def _trim(self, now: float):
+        cutoff = now - self.window_seconds
+        while self._window and self._window[0][0] < cutoff:
+            self._window.popleft()
@@ -0,0 +1,52 @@
+"""
+Per-continent destination counts for /api/continents.
+
+The endpoint used to read every destination row and then run one more
+Supabase query per continent to count it. The continent filter now applies
+to the destination catalog, so the counts are computed from the catalog
+instead. They are materialized once per catalog generation: every publish of
+a new pool (including the stored Supabase rows merged on refresh)
+invalidates them, and every other request is a dictionary read with no
+upstream call.
+"""
+
+import logging
+from collections import Counter
+from typing import List, Optional
+
+from destination_catalog import DestinationCatalog
+
+logger = logging.getLogger(__name__)
+
+
+class ContinentStats:
+    """Destination counts per continent, rebuilt only when the catalog publishes a new pool"""
+
+    def __init__(self, catalog: DestinationCatalog):
+        self.catalog = catalog
+        self._generation: Optional[int] = None
+        self._counts: List[dict] = []
+        self._rebuilds = 0
+
+    def counts(self) -> List[dict]:
+        """[{"name": ..., "count": ...}] sorted by name"""
+        if self._generation != self.catalog.generation:
+            self._rebuild()
+        return self._counts
+
+    def _rebuild(self):
+        generation = self.catalog.generation
+        counts = []
+        for destinations in self.catalog.groups().values():
+            # Generated rows may spell a continent differently ("north america"); show the most common spelling
+            spellings = Counter(str(dest.get("continent", "")).strip() for dest in destinations)
+            name = spellings.most_common(1)[0][0] if spellings else ""
+            if name:
+                counts.append({"name": name, "count": len(destinations)})
+        self._counts = sorted(counts, key=lambda item: item["name"])
+        self._generation = generation
+        self._rebuilds += 1
+        logger.info(f"Continent counts rebuilt for catalog generation {generation}: {len(counts)} continents")
+
+    def stats(self) -> dict:
+        return {"generation": self._generation, "rebuilds": self._rebuilds, "continents": len(self._counts)}
@@ -0,0 +1,127 @@
+"""
+Request-level deadlines for provider fallback chains.
+
+A Deadline is created once per request and handed to every provider call in
+the chain. Each step only gets the time that is left, so a slow first
+provider eats into the budget of the next one instead of adding to it, and
+the report shows where the time went.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, List, Optional, TypeVar
+
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a step has no budget left or runs out of it"""
+
+
+class Deadline:
+    """Time budget shared by every step of one request"""
+
+    def __init__(self, budget_seconds: float):
+        self.budget = budget_seconds
+        self._start = time.monotonic()
+        self.steps: List[dict] = []
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self._start
+
+    def remaining(self) -> float:
+        return max(0.0, self.budget - self.elapsed())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def timeout_for(self, cap: Optional[float] = None, reserve: float = 0.0) -> float:
+        """Seconds a step may take: what is left after ``reserve``, at most ``cap``"""
+        timeout = self.remaining() - reserve
+        if cap is not None:
+            timeout = min(timeout, cap)
+        return max(0.0, timeout)
+
+    async def run(
+        self,
+        step: str,
+        factory: Callable[[float], Awaitable[T]],
+        cap: Optional[float] = None,
+        reserve: float = 0.0,
+        breaker: Optional[CircuitBreaker] = None,
+    ) -> T:
+        """Await ``factory(timeout)`` within the remaining budget.
+
+        ``reserve`` keeps time back for the fallbacks after this step. Raises
+        DeadlineExceeded if there is no time for the step or it runs out;
+        other errors from the step propagate unchanged. With a ``breaker`` the
+        step is skipped (CircuitOpenError) while the provider's circuit is
+        open, and timeouts count as provider failures.
+        """
+        timeout = self.timeout_for(cap, reserve)
+        if timeout <= 0:
+            self.record(step, "skipped", 0.0)
+            raise DeadlineExceeded(f"No time left for {step}")
+        if breaker:
+            try:
+                breaker.before_call()
+            except CircuitOpenError as e:
+                self.record(step, "circuit_open", 0.0, str(e))
+                raise
+        started = time.monotonic()
+        try:
+            result = await asyncio.wait_for(factory(timeout), timeout)
+        except asyncio.TimeoutError as e:
+            self.record(step, "timeout", time.monotonic() - started)
+            if breaker:
+                breaker.record_failure(e)
+            raise DeadlineExceeded(f"{step} did not finish within {timeout:.1f}s")
+        except asyncio.CancelledError:
+            if breaker:
+                breaker.release()
+            raise
+        except Exception as e:
+            self.record(step, "error", time.monotonic() - started, str(e))
+            if breaker:
+                breaker.record_failure(e)
+            raise
+        self.record(step, "ok", time.monotonic() - started)
+        if breaker:
+            breaker.record_success()
+        return result
+
+    async def run_sync(
+        self,
+        step: str,
+        fn: Callable[[float], T],
+        cap: Optional[float] = None,
+        reserve: float = 0.0,
+        breaker: Optional[CircuitBreaker] = None,
+    ) -> T:
+        """Run blocking ``fn(timeout)`` in a worker thread within the remaining budget.
+
+        The thread cannot be interrupted; on timeout the request moves on and
+        the thread's result is discarded when it finishes.
+        """
+        return await self.run(step, lambda timeout: asyncio.to_thread(fn, timeout), cap, reserve, breaker)
+
+    def record(self, step: str, status: str, seconds: float, error: Optional[str] = None):
+        entry = {"step": step, "status": status, "elapsed_ms": round(seconds * 1000)}
+        if error:
+            entry["error"] = error[:200]
+        self.steps.append(entry)
+        logger.info(f"Step {step} {status} after {entry['elapsed_ms']} ms ({self.remaining():.1f}s left)")
+
+    def report(self) -> dict:
+        return {
+            "budget_ms": round(self.budget * 1000),
+            "elapsed_ms": round(self.elapsed() * 1000),
+            "remaining_ms": round(self.remaining() * 1000),
+            "steps": list(self.steps),
+        }
@@ -0,0 +1,381 @@
+"""
+In-memory destination catalog.
+
+/api/destinations used to ask OpenAI for 50 destinations on every page load.
+The catalog instead keeps a pool of destinations in memory, and a background
+task fills and refreshes it from Supabase and from small per-continent
+OpenAI batches. Requests only sample from the pool and never wait on the
+LLM or the database.
+
+Each refresh asks for destinations not already in the pool, so the pool
+grows more varied over time. Once it is full, the entries that were least
+recently seen are evicted first. A new pool is built off to the side and
+swapped in with a single assignment, so readers never see a half-built pool.
+Pooled destinations are read-only DestinationRecords (see destination_store).
+
+Until the pool is half full, the loop retries sooner than the refresh
+interval, but only for continents still below their share of that half, and
+with exponential backoff from DESTINATION_CATALOG_RETRY_SECONDS up to the
+refresh interval. A continent that cannot supply its share (a small pool, a
+sparse region, a failing key) therefore costs a few calls an hour rather than
+one per minute forever. Antarctica is capped at CONTINENT_LIMITS so it is
+neither padded with repeats nor retried once it holds a handful of entries.
+
+Listings are paged with opaque cursors. A page is ordered by a seeded hash of
+each destination (or alphabetically without a seed) and the cursor holds the
+seed and the last rank served, so a session keeps one shuffle across pages
+and a refresh between pages cannot repeat or shift entries.
+"""
+
+import asyncio
+import base64
+import bisect
+import hashlib
+import json
+import logging
+import os
+import random
+import time
+from collections import OrderedDict
+from collections.abc import Mapping
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from destination_store import DestinationRecord
+
+logger = logging.getLogger(__name__)
+
+POOL_SIZE = int(os.getenv("DESTINATION_CATALOG_SIZE", "500"))
+BATCH_SIZE = int(os.getenv("DESTINATION_CATALOG_BATCH", "15"))
+REFRESH_SECONDS = float(os.getenv("DESTINATION_CATALOG_REFRESH_SECONDS", "1800"))
+RETRY_SECONDS = float(os.getenv("DESTINATION_CATALOG_RETRY_SECONDS", "60"))
+# Backoff for the fill retries doubles from RETRY_SECONDS up to this (default: the refresh interval)
+MAX_RETRY_SECONDS = float(os.getenv("DESTINATION_CATALOG_MAX_RETRY_SECONDS", str(REFRESH_SECONDS)))
+# Names of pooled destinations passed to OpenAI as "do not repeat" per batch
+EXCLUDE_LIMIT = 60
+# Shuffled orderings kept per (seed, continent); one per active browsing session
+ORDER_CACHE_SIZE = int(os.getenv("DESTINATION_CATALOG_ORDER_CACHE", "256"))
+
+CONTINENTS = ["Africa", "Asia", "Europe", "North America", "South America", "Oceania", "Antarctica"]
+# Most destinations a continent may hold in the pool; there are only a few places to visit in Antarctica
+CONTINENT_LIMITS = {"Antarctica": 10}
+
+Generator = Callable[[Optional[str], int, List[str]], Awaitable[List[dict]]]
+Loader = Callable[[], Awaitable[List[dict]]]
+
+
+def destination_key(dest: dict) -> Tuple[str, str]:
+    return (str(dest.get("name", "")).strip().lower(), str(dest.get("country", "")).strip().lower())
+
+
+def new_seed() -> str:
+    return f"{random.getrandbits(48):012x}"
+
+
+def encode_cursor(seed: str, after: str) -> str:
+    raw = json.dumps({"s": seed, "a": after}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """Seed and last rank served; raises ValueError for a malformed cursor"""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        seed, after = data["s"], data["a"]
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(seed, str) or not isinstance(after, str):
+        raise ValueError("Invalid cursor")
+    return seed, after
+
+
+class DestinationCatalog:
+    """Pool of destinations served from memory and refreshed in the background"""
+
+    def __init__(
+        self,
+        generate: Generator,
+        load_stored: Optional[Loader] = None,
+        seed: Optional[List[dict]] = None,
+        pool_size: int = POOL_SIZE,
+        batch_size: int = BATCH_SIZE,
+        refresh_seconds: float = REFRESH_SECONDS,
+        retry_seconds: float = RETRY_SECONDS,
+        continents: Optional[List[str]] = None,
+        max_retry_seconds: float = MAX_RETRY_SECONDS,
+        continent_limits: Optional[Dict[str, int]] = None,
+    ):
+        self.generate = generate
+        self.load_stored = load_stored
+        self.pool_size = pool_size
+        self.batch_size = batch_size
+        self.refresh_seconds = refresh_seconds
+        self.retry_seconds = retry_seconds
+        self.max_retry_seconds = max(retry_seconds, max_retry_seconds)
+        self.continents = continents or CONTINENTS
+        self.continent_limits = CONTINENT_LIMITS if continent_limits is None else continent_limits
+        # key -> (destination, source); insertion order is least recently seen first
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[DestinationRecord, str]]" = OrderedDict()
+        self._all: List[dict] = []
+        self._by_continent: Dict[str, List[dict]] = {}
+        self._sources: Dict[str, int] = {}
+        self._generation = 0
+        self._orders: "OrderedDict[Tuple[str, Optional[str]], Tuple[int, List[str], List[dict]]]" = OrderedDict()
+        self._listeners: List[Callable[[List[dict]], None]] = []
+        self._refreshed_at: Optional[str] = None
+        self._refreshes = 0
+        self._refresh_errors = 0
+        self._last_refresh_ms: Optional[float] = None
+        self._retry_attempt = 0
+        self._next_refresh_in: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        if seed:
+            self._merge(seed, "mock")
+            self._publish()
+
+    @property
+    def size(self) -> int:
+        return len(self._all)
+
+    @property
+    def source(self) -> str:
+        """Where most of the pool came from: openai, database or mock"""
+        for source in ("openai", "database"):
+            if self._sources.get(source):
+                return source
+        return "mock"
+
+    @property
+    def refreshed_at(self) -> Optional[str]:
+        return self._refreshed_at
+
+    @property
+    def generation(self) -> int:
+        """Bumped every time a new pool is published"""
+        return self._generation
+
+    def subscribe(self, listener: Callable[[List[dict]], None]):
+        """Call ``listener(destinations)`` now and after every publish of a new pool"""
+        self._listeners.append(listener)
+        listener(self._all)
+
+    def entries(self) -> List[Tuple[DestinationRecord, str]]:
+        """(destination, source) pairs, least recently seen first"""
+        return list(self._entries.values())
+
+    def restore(self, entries: List[Tuple[DestinationRecord, str]]) -> int:
+        """Replace the pool with saved (destination, source) pairs, e.g. from a snapshot"""
+        if not entries:
+            return 0
+        self._entries.clear()
+        for dest, source in entries:
+            self._merge([dest], source)
+        self._publish()
+        return self.size
+
+    def groups(self) -> Dict[str, List[dict]]:
+        """Pooled destinations by lower-cased continent (treat as read-only)"""
+        return self._by_continent
+
+    def page(
+        self, continent: Optional[str] = None, limit: int = 50, seed: str = "", after: Optional[str] = None
+    ) -> Tuple[List[dict], Optional[str]]:
+        """One page of destinations and the rank to continue after (None on the last page).
+
+        ``seed`` picks the shuffle; an empty seed lists alphabetically.
+        ``after`` is the rank returned with the previous page.
+        """
+        ranks, destinations = self._ordered(continent, seed)
+        start = bisect.bisect_right(ranks, after) if after is not None else 0
+        end = start + max(0, limit)
+        return destinations[start:end], ranks[end - 1] if end < len(ranks) else None
+
+    def _ordered(self, continent: Optional[str], seed: str) -> Tuple[List[str], List[dict]]:
+        key = (seed, continent.strip().lower() if continent else None)
+        cached = self._orders.get(key)
+        if cached and cached[0] == self._generation:
+            self._orders.move_to_end(key)
+            return cached[1], cached[2]
+        pool = self._by_continent.get(key[1], []) if continent else self._all
+        ranked = [(self._rank(dest, seed), dest) for dest in pool]
+        if seed:
+            # Without a seed the pool is already in rank (alphabetical) order
+            ranked.sort(key=lambda item: item[0])
+        ranks, destinations = [rank for rank, _ in ranked], [dest for _, dest in ranked]
+        self._orders[key] = (self._generation, ranks, destinations)
+        while len(self._orders) > ORDER_CACHE_SIZE:
+            self._orders.popitem(last=False)
+        return ranks, destinations
+
+    @staticmethod
+    def _rank(dest: dict, seed: str) -> str:
+        name, country = destination_key(dest)
+        if not seed:
+            return f"{name}\x00{country}"
+        return hashlib.blake2b(f"{seed}\x00{name}\x00{country}".encode(), digest_size=8).hexdigest()
+
+    def _limit(self, continent: str) -> Optional[int]:
+        return self.continent_limits.get(continent)
+
+    def _count(self, continent: str) -> int:
+        return len(self._by_continent.get(continent.lower(), []))
+
+    def _room(self, continent: str) -> int:
+        """How many more destinations ``continent`` may take; a full batch unless it has a limit"""
+        limit = self._limit(continent)
+        return self.batch_size if limit is None else max(0, min(self.batch_size, limit - self._count(continent)))
+
+    def short_continents(self) -> List[str]:
+        """Continents below their share of a half-full pool (or below their limit, if smaller)"""
+        count = len(self.continents)
+        share = (self.pool_size // 2 + count - 1) // count if count else 0
+        short = []
+        for continent in self.continents:
+            limit = self._limit(continent)
+            target = share if limit is None else min(share, limit)
+            if self._count(continent) < target:
+                short.append(continent)
+        return short
+
+    async def refresh(self, continents: Optional[List[str]] = None) -> int:
+        """Pull stored and newly generated destinations into the pool; returns how many arrived.
+
+        Only ``continents`` (default: all) are generated, and a continent at its limit is skipped.
+        """
+        async with self._lock:
+            start = time.perf_counter()
+            received = 0
+            if self.load_stored:
+                try:
+                    stored = await self.load_stored()
+                    received += self._merge(stored, "database")
+                except Exception as e:
+                    self._refresh_errors += 1
+                    logger.warning(f"Destination catalog could not load stored destinations: {e}")
+
+            rooms = {continent: self._room(continent) for continent in (continents or self.continents)}
+            targets = [continent for continent, room in rooms.items() if room > 0]
+            batches = await asyncio.gather(
+                *(self.generate(continent, rooms[continent], self._names(continent)) for continent in targets),
+                return_exceptions=True,
+            )
+            for continent, batch in zip(targets, batches):
+                if isinstance(batch, Exception):
+                    self._refresh_errors += 1
+                    logger.warning(f"Destination catalog batch for {continent} failed: {batch}")
+                    continue
+                for dest in batch:
+                    if isinstance(dest, dict) and not dest.get("continent"):
+                        dest["continent"] = continent
+                if self._limit(continent) is not None:
+                    batch = batch[:rooms[continent]]
+                received += self._merge(batch, "openai")
+
+            if received:
+                self._publish()
+            self._refreshes += 1
+            self._last_refresh_ms = (time.perf_counter() - start) * 1000
+            logger.info(
+                f"Destination catalog refreshed: {received} received, {self.size} pooled "
+                f"in {self._last_refresh_ms:.0f} ms"
+            )
+            return received
+
+    def start(self, delay: float = 0):
+        """Start the background refresh loop (idempotent); the first refresh waits ``delay`` seconds"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(delay))
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self, delay: float = 0):
+        if delay > 0:
+            await asyncio.sleep(delay)
+        continents: Optional[List[str]] = None
+        while True:
+            try:
+                await self.refresh(continents)
+            except Exception as e:
+                self._refresh_errors += 1
+                logger.error(f"Destination catalog refresh failed: {e}")
+            # Refill sooner until the pool holds real destinations, backing off and asking only the
+            # continents still short, then settle into the refresh interval
+            short = self.short_continents()
+            if self.source != "mock" and (self.size >= self.pool_size // 2 or not short):
+                self._retry_attempt, continents = 0, None
+                delay = self.refresh_seconds
+            else:
+                delay = min(self.max_retry_seconds, self.retry_seconds * 2 ** min(self._retry_attempt, 16))
+                self._retry_attempt += 1
+                continents = short or None
+                logger.info(f"Destination catalog retrying {', '.join(continents or self.continents)} in {delay:.0f}s")
+            self._next_refresh_in = delay
+            await asyncio.sleep(delay)
+
+    def _names(self, continent: str) -> List[str]:
+        names = [dest.get("name", "") for dest in self._by_continent.get(continent.lower(), [])]
+        return random.sample(names, min(EXCLUDE_LIMIT, len(names)))
+
+    def _merge(self, destinations: List[dict], source: str) -> int:
+        merged = 0
+        for dest in destinations:
+            if not isinstance(dest, Mapping) or not dest.get("name"):
+                continue
+            dest = DestinationRecord.from_dict(dest)
+            key = destination_key(dest)
+            existing = self._entries.pop(key, None)
+            if existing and existing[1] == "database" and source != "database":
+                # Keep the stored row (stable id); just mark it as recently seen
+                dest, source_of_entry = existing
+            else:
+                source_of_entry = source
+            self._entries[key] = (dest, source_of_entry)
+            merged += 1
+        # Generated entries displace the seed data once real destinations arrive
+        if merged and source != "mock":
+            for key in [key for key, (_, src) in self._entries.items() if src == "mock"]:
+                del self._entries[key]
+        while len(self._entries) > self.pool_size:
+            self._entries.popitem(last=False)
+        return merged
+
+    def _publish(self):
+        destinations = sorted((dest for dest, _ in self._entries.values()), key=lambda d: self._rank(d, ""))
+        by_continent: Dict[str, List[dict]] = {}
+        for dest in destinations:
+            by_continent.setdefault(str(dest.get("continent", "")).strip().lower(), []).append(dest)
+        sources: Dict[str, int] = {}
+        for _, source in self._entries.values():
+            sources[source] = sources.get(source, 0) + 1
+        self._all, self._by_continent, self._sources = destinations, by_continent, sources
+        self._generation += 1
+        for listener in self._listeners:
+            try:
+                listener(destinations)
+            except Exception as e:
+                logger.warning(f"Destination catalog listener failed: {e}")
+        self._refreshed_at = datetime.now().isoformat()
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "pool_size": self.pool_size,
+            "sources": dict(self._sources),
+            "by_continent": {continent: len(dests) for continent, dests in self._by_continent.items()},
+            "refreshed_at": self._refreshed_at,
+            "refreshes": self._refreshes,
+            "refresh_errors": self._refresh_errors,
+            "last_refresh_ms": round(self._last_refresh_ms) if self._last_refresh_ms is not None else None,
+            "short_continents": self.short_continents(),
+            "retry_attempt": self._retry_attempt,
+            "next_refresh_seconds": self._next_refresh_in,
+            "running": bool(self._task and not self._task.done()),
+        }
@@ -0,0 +1,302 @@
+"""
+Columnar filter engine for /api/filter-destinations.
+
+The endpoint used to send the filter criteria to gpt-4 just to pick rows out
+of a list. This module evaluates structured criteria locally instead, over a
+columnar copy of the destination catalog:
+
+* rating and price level are NumPy arrays;
+* continent and country are categorical codes;
+* best-time-to-visit is a 12-bit month mask per destination;
+* highlight and description words are bitsets (one packed bit array per word).
+
+Each criterion becomes a boolean mask, the masks are ANDed, and the matches
+are ranked by how many requested tags they hit, then by rating. The columns
+are rebuilt whenever the catalog publishes a new pool, off the request path.
+"""
+
+import logging
+import re
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 200
+
+MONTHS = ["january", "february", "march", "april", "may", "june", "july", "august", "september", "october", "november", "december"]
+MONTH_INDEX = {**{name: i for i, name in enumerate(MONTHS)}, **{name[:3]: i for i, name in enumerate(MONTHS)}, "sept": 8}
+ALL_MONTHS = (1 << 12) - 1
+SEASONS = {
+    "spring": (2, 4),
+    "summer": (5, 7),
+    "autumn": (8, 10),
+    "fall": (8, 10),
+    "winter": (11, 1),
+}
+
+# Budget words -> highest acceptable price level ($ = 1 ... $$$ = 3)
+BUDGET_LEVELS = {
+    "budget": 1, "low": 1, "cheap": 1, "economy": 1,
+    "moderate": 2, "medium": 2, "mid": 2, "mid-range": 2, "standard": 2,
+    "high": 3, "luxury": 3, "premium": 3, "any": 3,
+}
+
+# Moods expand to the highlight/description words that signal them
+MOOD_TAGS = {
+    "adventure": ["adventure", "hiking", "trekking", "safari", "diving", "climbing", "rafting", "surfing", "trail"],
+    "adventurous": ["adventure", "hiking", "trekking", "safari", "diving", "climbing", "rafting", "surfing", "trail"],
+    "relax": ["beach", "spa", "hot", "spring", "thermal", "resort", "relax", "island", "lagoon"],
+    "relaxing": ["beach", "spa", "hot", "spring", "thermal", "resort", "relax", "island", "lagoon"],
+    "romantic": ["romantic", "sunset", "wine", "gondola", "cruise", "honeymoon", "couple"],
+    "cultural": ["culture", "cultural", "temple", "museum", "history", "historic", "cathedral", "palace", "art", "ruin"],
+    "culture": ["culture", "cultural", "temple", "museum", "history", "historic", "cathedral", "palace", "art", "ruin"],
+    "nature": ["nature", "park", "lake", "mountain", "waterfall", "wildlife", "forest", "glacier", "national"],
+    "foodie": ["food", "cuisine", "wine", "market", "tasting", "restaurant", "street"],
+    "food": ["food", "cuisine", "wine", "market", "tasting", "restaurant", "street"],
+    "nightlife": ["nightlife", "bar", "club", "party", "music"],
+    "party": ["nightlife", "bar", "club", "party", "music"],
+    "family": ["family", "zoo", "theme", "aquarium", "beach", "park"],
+    "relaxation": ["beach", "spa", "hot", "spring", "thermal", "resort", "relax", "island", "lagoon"],
+    "history": ["history", "historic", "ruin", "castle", "palace", "ancient", "museum", "old", "medieval"],
+    "shopping": ["shopping", "market", "bazaar", "boutique", "mall", "fashion"],
+    "luxury": ["luxury", "resort", "spa", "fine", "yacht", "villa"],
+    "photography": ["sunset", "view", "landscape", "skyline", "scenic", "photography"],
+    "sports": ["surfing", "skiing", "diving", "golf", "hiking", "climbing", "sport"],
+}
+
+STOPWORDS = {"and", "the", "with", "for", "from", "its", "this", "that", "perfect", "famous", "local", "of", "in", "a", "an", "to"}
+
+RECOGNIZED = {
+    "continent", "continents", "country", "countries", "min_rating", "minRating", "rating", "max_rating", "maxRating",
+    "price", "budget", "max_price", "maxPrice", "month", "months", "time", "travel_month", "season",
+    "tags", "highlights", "mood", "interests", "limit",
+}
+
+
+def words(text: str) -> List[str]:
+    """Lower-case word tokens with a crude plural strip, so "temples" matches "temple\""""
+    tokens = []
+    for token in re.findall(r"[a-z]+", text.lower()):
+        if len(token) > 4 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        if len(token) > 2 and token not in STOPWORDS:
+            tokens.append(token)
+    return tokens
+
+
+def month_mask(text: str) -> int:
+    """Parse "May-October", "March-May, October-November", "Year-round" into a 12-bit month mask"""
+    text = (text or "").lower()
+    if not text.strip() or {"year", "any", "all"} & set(re.findall(r"[a-z]+", text)):
+        return ALL_MONTHS
+    mask = 0
+    for part in re.split(r"[,;/&]| and ", text):
+        tokens = re.findall(r"[a-z]+", part)
+        found = [MONTH_INDEX[token] for token in tokens if token in MONTH_INDEX]
+        seasons = [SEASONS[token] for token in tokens if token in SEASONS]
+        if len(found) >= 2 and ("-" in part or " to " in part):
+            mask |= _month_range(found[0], found[-1])
+        else:
+            for month in found:
+                mask |= 1 << month
+        for start, end in seasons:
+            mask |= _month_range(start, end)
+    return mask or ALL_MONTHS
+
+
+def _month_range(start: int, end: int) -> int:
+    mask, month = 0, start
+    while True:
+        mask |= 1 << month
+        if month == end:
+            return mask
+        month = (month + 1) % 12
+
+
+def price_level(price) -> int:
+    if isinstance(price, (int, float)):
+        return int(price)
+    text = str(price or "").strip()
+    if text.isdigit():
+        return int(text)
+    if text.startswith("$"):
+        return min(3, text.count("$"))
+    return BUDGET_LEVELS.get(text.lower(), 0)
+
+
+def _as_list(value) -> List[str]:
+    if value is None or value == "":
+        return []
+    if isinstance(value, (list, tuple, set)):
+        return [str(v) for v in value if v not in (None, "")]
+    return [str(value)]
+
+
+@dataclass
+class FilterQuery:
+    continents: List[str] = field(default_factory=list)
+    countries: List[str] = field(default_factory=list)
+    min_rating: Optional[float] = None
+    max_rating: Optional[float] = None
+    price_levels: List[int] = field(default_factory=list)
+    max_price_level: Optional[int] = None
+    months: int = 0
+    tags: List[str] = field(default_factory=list)
+    limit: int = DEFAULT_LIMIT
+
+
+def parse_criteria(criteria: dict) -> Tuple[Optional[FilterQuery], List[str]]:
+    """Turn a criteria dict into a FilterQuery plus the keys it ignored.
+
+    The query is None when no key is recognized, so the caller can fall back
+    to a free-text prompt.
+    """
+    criteria = criteria or {}
+    ignored = [key for key, value in criteria.items() if key not in RECOGNIZED and value not in (None, "", [])]
+    if not any(key in RECOGNIZED and value not in (None, "", []) for key, value in criteria.items()):
+        return None, ignored
+
+    query = FilterQuery()
+    query.continents = [c.strip().lower() for c in _as_list(criteria.get("continent")) + _as_list(criteria.get("continents"))]
+    query.countries = [c.strip().lower() for c in _as_list(criteria.get("country")) + _as_list(criteria.get("countries"))]
+    for key in ("min_rating", "minRating", "rating"):
+        if criteria.get(key) not in (None, ""):
+            query.min_rating = float(criteria[key])
+    for key in ("max_rating", "maxRating"):
+        if criteria.get(key) not in (None, ""):
+            query.max_rating = float(criteria[key])
+
+    for value in _as_list(criteria.get("price")):
+        level = price_level(value)
+        if value.strip().startswith("$") and level:
+            query.price_levels.append(level)
+        elif level:
+            query.max_price_level = level
+    for key in ("budget", "max_price", "maxPrice"):
+        for value in _as_list(criteria.get(key)):
+            level = price_level(value)
+            if level and value.strip().lower() in ("luxury", "premium"):
+                query.price_levels.append(3)
+            elif level:
+                query.max_price_level = min(level, query.max_price_level or 3)
+
+    for key in ("month", "months", "time", "travel_month", "season"):
+        for value in _as_list(criteria.get(key)):
+            if value.isdigit() and 1 <= int(value) <= 12:
+                query.months |= 1 << (int(value) - 1)
+            else:
+                mask = month_mask(value)
+                if mask != ALL_MONTHS:
+                    query.months |= mask
+
+    for key in ("tags", "highlights", "interests", "mood"):
+        for value in _as_list(criteria.get(key)):
+            expanded = MOOD_TAGS.get(value.strip().lower())
+            query.tags.extend(expanded if expanded else words(value))
+    query.tags = list(dict.fromkeys(query.tags))
+
+    if criteria.get("limit") not in (None, ""):
+        query.limit = max(1, min(int(criteria["limit"]), MAX_LIMIT))
+    return query, ignored
+
+
+class DestinationFilter:
+    """Columnar copy of the catalog, filtered with vectorized masks"""
+
+    def __init__(self):
+        self._build([])
+
+    def build(self, destinations: Sequence[dict]):
+        """Rebuild the columns from a new catalog pool"""
+        self._build(destinations)
+        logger.info(f"Destination filter indexed {self.size} destinations, {len(self._tags)} tags")
+
+    def _build(self, destinations: Sequence[dict]):
+        rows = [dest for dest in destinations if isinstance(dest, Mapping)]
+        n = len(rows)
+        continents: Dict[str, int] = {}
+        countries: Dict[str, int] = {}
+        rating = np.zeros(n, dtype=np.float32)
+        price = np.zeros(n, dtype=np.int8)
+        months = np.zeros(n, dtype=np.uint16)
+        continent_codes = np.zeros(n, dtype=np.int16)
+        country_codes = np.zeros(n, dtype=np.int16)
+        tag_rows: Dict[str, List[int]] = {}
+        for i, dest in enumerate(rows):
+            try:
+                rating[i] = float(dest.get("rating") or 0)
+            except (TypeError, ValueError):
+                rating[i] = 0
+            price[i] = price_level(dest.get("price"))
+            months[i] = month_mask(str(dest.get("bestTime") or ""))
+            continent_codes[i] = continents.setdefault(str(dest.get("continent") or "").strip().lower(), len(continents))
+            country_codes[i] = countries.setdefault(str(dest.get("country") or "").strip().lower(), len(countries))
+            text = " ".join(str(h) for h in dest.get("highlights") or []) + " " + str(dest.get("description") or "")
+            for tag in set(words(text)):
+                tag_rows.setdefault(tag, []).append(i)
+
+        tags: Dict[str, np.ndarray] = {}
+        for tag, indices in tag_rows.items():
+            bits = np.zeros(n, dtype=bool)
+            bits[indices] = True
+            tags[tag] = np.packbits(bits)
+
+        # Swap everything in at once so a concurrent request sees either the old or the new columns
+        (self._rows, self._rating, self._price, self._months, self._continent_codes, self._country_codes,
+         self._continents, self._countries, self._tags) = (
+            rows, rating, price, months, continent_codes, country_codes, continents, countries, tags)
+
+    @property
+    def size(self) -> int:
+        return len(self._rows)
+
+    def filter(self, query: FilterQuery) -> Tuple[List[dict], int]:
+        """Matching destinations, best first, and the total number of matches"""
+        n = len(self._rows)
+        if not n:
+            return [], 0
+        mask = np.ones(n, dtype=bool)
+        if query.continents:
+            codes = [self._continents[c] for c in query.continents if c in self._continents]
+            mask &= np.isin(self._continent_codes, codes)
+        if query.countries:
+            codes = [self._countries[c] for c in query.countries if c in self._countries]
+            mask &= np.isin(self._country_codes, codes)
+        if query.min_rating is not None:
+            mask &= self._rating >= query.min_rating
+        if query.max_rating is not None:
+            mask &= self._rating <= query.max_rating
+        if query.price_levels:
+            mask &= np.isin(self._price, query.price_levels)
+        if query.max_price_level is not None:
+            # Unknown price (0) passes a budget ceiling
+            mask &= self._price <= query.max_price_level
+        if query.months:
+            mask &= (self._months & np.uint16(query.months)) != 0
+
+        relevance = np.zeros(n, dtype=np.int16)
+        for tag in query.tags:
+            bits = self._tags.get(tag)
+            if bits is not None:
+                relevance += np.unpackbits(bits, count=n).view(bool)
+        if query.tags:
+            mask &= relevance > 0
+
+        matches = np.flatnonzero(mask)
+        # Most tag hits first, then highest rating
+        order = np.lexsort((-self._rating[matches], -relevance[matches]))
+        return [self._rows[i] for i in matches[order[:query.limit]]], len(matches)
+
+    def stats(self) -> dict:
+        return {
+            "destinations": self.size,
+            "continents": len(self._continents),
+            "countries": len(self._countries),
+            "tags": len(self._tags),
+            "tag_bytes": sum(bits.nbytes for bits in self._tags.values()),
+        }
@@ -0,0 +1,254 @@
+"""
+Compact records for destinations held in memory.
+
+The catalog, filter, typeahead and semantic index each hold the same
+destinations for the life of the worker. As plain dicts, each destination
+costs a hash table plus its own copy of every repeated string ("Europe",
+"France", "$$", "Year-round", the default highlights). Endpoints also
+rebuilt them on every request with ``{**dest, ...}`` to fill in defaults.
+
+A DestinationRecord instead:
+
+* stores the known fields in ``__slots__`` (no per-instance dict);
+* interns categorical strings (country, city, continent, price, best time,
+  highlights), so each distinct value is stored once per worker;
+* applies the defaults for rating, price, bestTime and highlights once, when
+  the record is created;
+* caches its own JSON encoding, so a page of records serializes by joining
+  strings rather than building dicts (see ``dumps_payload``).
+
+Records are read-only Mappings, so code that calls ``dest.get(...)`` or
+``{**dest}`` keeps working unchanged.
+
+``python destination_store.py bench --count 100000`` compares worker RSS for
+the same destinations held as dicts and as records.
+"""
+
+import argparse
+import gc
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from collections.abc import Mapping
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+DEFAULT_HIGHLIGHTS = ("Local Attractions", "Cultural Sites", "Natural Beauty", "Local Cuisine")
+DEFAULTS = {"rating": 4.5, "price": "$$", "bestTime": "Year-round", "highlights": DEFAULT_HIGHLIGHTS}
+
+FIELDS = ("id", "name", "country", "city", "continent", "description", "image_url", "rating", "price", "bestTime", "highlights")
+INTERNED = frozenset(("country", "city", "continent", "price", "bestTime"))
+_FIELD_SET = frozenset(FIELDS)
+_MISSING = object()
+
+
+def _dumps(value: Any) -> str:
+    # Same encoding as Starlette's JSONResponse
+    return json.dumps(value, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":"))
+
+
+class DestinationRecord(Mapping):
+    """One destination: known fields in slots, anything else in ``extra``"""
+
+    __slots__ = FIELDS + ("extra", "_json")
+
+    @classmethod
+    def from_dict(cls, dest: Mapping) -> "DestinationRecord":
+        if isinstance(dest, DestinationRecord):
+            return dest
+        record = cls()
+        set_slot = object.__setattr__
+        extra = None
+        for key, value in dest.items():
+            if key not in _FIELD_SET:
+                if extra is None:
+                    extra = {}
+                extra[key] = value
+                continue
+            if key in INTERNED and isinstance(value, str):
+                value = sys.intern(value)
+            elif key == "highlights" and isinstance(value, (list, tuple)):
+                value = tuple(sys.intern(h) if isinstance(h, str) else h for h in value)
+            set_slot(record, key, value)
+        for key, value in DEFAULTS.items():
+            if dest.get(key) is None:
+                set_slot(record, key, value)
+        set_slot(record, "extra", extra)
+        set_slot(record, "_json", None)
+        return record
+
+    @classmethod
+    def from_json(cls, text: str) -> "DestinationRecord":
+        """Record from its own ``.json`` encoding, keeping that text as the cached encoding"""
+        record = cls.from_dict(json.loads(text))
+        object.__setattr__(record, "_json", text)
+        return record
+
+    def __setattr__(self, name: str, value: Any):
+        raise AttributeError("DestinationRecord is read-only; build a new one with from_dict()")
+
+    def __getitem__(self, key: str) -> Any:
+        if key in _FIELD_SET:
+            value = getattr(self, key, _MISSING)
+            if value is not _MISSING:
+                return list(value) if key == "highlights" and isinstance(value, tuple) else value
+        elif self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __iter__(self) -> Iterator[str]:
+        for key in FIELDS:
+            if getattr(self, key, _MISSING) is not _MISSING:
+                yield key
+        if self.extra:
+            yield from self.extra
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"DestinationRecord({self.get('name')!r}, {self.get('country')!r})"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {key: self[key] for key in self}
+
+    @property
+    def json(self) -> str:
+        """JSON object for this destination, encoded once and then reused"""
+        if self._json is None:
+            object.__setattr__(self, "_json", _dumps(self.to_dict()))
+        return self._json
+
+
+def to_records(destinations: Iterable[Mapping]) -> List[DestinationRecord]:
+    return [DestinationRecord.from_dict(dest) for dest in destinations if isinstance(dest, Mapping) and dest.get("name")]
+
+
+def dumps_payload(payload: Dict[str, Any]) -> str:
+    """JSON for a response dict whose values may be lists of records, reusing each record's cached JSON"""
+    parts = []
+    for key, value in payload.items():
+        if isinstance(value, list) and value and all(isinstance(item, DestinationRecord) for item in value):
+            encoded = "[" + ",".join(item.json for item in value) + "]"
+        else:
+            encoded = _dumps(value)
+        parts.append(f"{_dumps(key)}:{encoded}")
+    return "{" + ",".join(parts) + "}"
+
+
+# --- Benchmark ---
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+        # Peak rather than current RSS, but still comparable between runs
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+def _synthetic_rows(count: int, seed: int = 7) -> Iterator[str]:
+    """JSON text for ``count`` destinations, in chunks, shaped like catalog rows"""
+    rng = random.Random(seed)
+    continents = ["Europe", "Asia", "Africa", "North America", "South America", "Oceania"]
+    countries = [f"Country {i}" for i in range(180)]
+    words = "beach museum hiking food old town market castle lake wine island temple park nightlife".split()
+    chunk = []
+    for i in range(count):
+        country = rng.choice(countries)
+        row = {
+            "id": f"{rng.getrandbits(128):032x}",
+            "name": f"Place {i}",
+            "country": country,
+            "city": f"City {rng.randrange(2000)}",
+            "continent": rng.choice(continents),
+            "description": " ".join(rng.choice(words) for _ in range(rng.randrange(12, 30))),
+            "image_url": f"https://images.unsplash.com/photo-{rng.getrandbits(40):010x}?w=800&h=600&fit=crop",
+            "rating": round(rng.uniform(3.5, 5.0), 1),
+        }
+        if rng.random() < 0.5:
+            row["price"] = rng.choice(["$", "$$", "$$$"])
+            row["highlights"] = [w.title() for w in rng.sample(words, 4)]
+        chunk.append(row)
+        if len(chunk) == 1000:
+            yield json.dumps(chunk)
+            chunk = []
+    if chunk:
+        yield json.dumps(chunk)
+
+
+def _measure(mode: str, count: int) -> dict:
+    gc.collect()
+    before = _rss_bytes()
+    held: List[Any] = []
+    for text in _synthetic_rows(count):
+        rows = json.loads(text)
+        if mode == "dict":
+            # What the endpoints used to keep: the row re-decorated with defaults
+            held.extend({
+                **dest,
+                "rating": dest.get("rating", 4.5),
+                "price": dest.get("price", "$$"),
+                "bestTime": dest.get("bestTime", "Year-round"),
+                "highlights": dest.get("highlights", list(DEFAULT_HIGHLIGHTS)),
+            } for dest in rows)
+        else:
+            held.extend(to_records(rows))
+        del rows, text
+    gc.collect()
+    used = _rss_bytes() - before
+
+    page = held[:50]
+    start = time.perf_counter()
+    for _ in range(200):
+        if mode == "dict":
+            _dumps({"success": True, "data": page})
+        else:
+            dumps_payload({"success": True, "data": page})
+    page_us = (time.perf_counter() - start) / 200 * 1e6
+    return {"mode": mode, "count": count, "rss_mb": round(used / 2**20, 1), "bytes_per_destination": round(used / count), "page_json_us": round(page_us, 1)}
+
+
+def _bench(count: int):
+    results = []
+    for mode in ("dict", "record"):
+        # A fresh interpreter per mode so neither run inherits the other's heap
+        out = subprocess.run(
+            [sys.executable, __file__, "measure", mode, str(count)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        results.append(json.loads(out))
+    for result in results:
+        print(f"{result['mode']:>6}: {result['rss_mb']:8.1f} MB RSS for {result['count']} destinations "
+              f"({result['bytes_per_destination']} B each), 50-item page JSON in {result['page_json_us']} us")
+    if results[0]["rss_mb"]:
+        print(f"records use {results[1]['rss_mb'] / results[0]['rss_mb']:.0%} of the dict RSS")
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(description="Destination record memory benchmark")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench = sub.add_parser("bench", help="compare RSS of dicts and records")
+    bench.add_argument("--count", type=int, default=100_000)
+    measure = sub.add_parser("measure")
+    measure.add_argument("mode", choices=["dict", "record"])
+    measure.add_argument("count", type=int)
+    args = parser.parse_args(argv)
+    if args.command == "bench":
+        _bench(args.count)
+    else:
+        print(json.dumps(_measure(args.mode, args.count)))
+
+
+if __name__ == "__main__":
+    main()
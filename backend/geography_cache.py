@@ -0,0 +1,228 @@
+"""
+Tree cache for the travel planner's continent -> country -> city -> area drill-down.
+
+Each level used to be a separate LLM call that the user waited on. Nodes are
+now cached by their place in the tree (level plus name, e.g. countries of
+"Europe") and by the prompt and quality that generated them, so a client's
+custom prompt is only ever served back to requests with the same prompt.
+Each node remembers its children. Whenever a node is served, its
+most likely children are generated in the background, so the next click
+usually finds its node already cached or being generated.
+
+"Most likely" means the children other users opened most often, then the
+order the model listed them in (most popular first). Speculative generation
+is bounded two ways: a concurrency limit and a per-minute budget. A click on
+a child that is still being generated joins that call instead of starting
+another.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+CHILD_LEVEL = {"continents": "countries", "countries": "cities", "cities": "areas"}
+
+TTL_SECONDS = float(os.getenv("GEOGRAPHY_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+MAX_NODES = int(os.getenv("GEOGRAPHY_CACHE_NODES", "2000"))
+PREFETCH_CHILDREN = int(os.getenv("GEOGRAPHY_PREFETCH_CHILDREN", "3"))
+PREFETCH_CONCURRENCY = int(os.getenv("GEOGRAPHY_PREFETCH_CONCURRENCY", "2"))
+PREFETCH_PER_MINUTE = int(os.getenv("GEOGRAPHY_PREFETCH_PER_MINUTE", "30"))
+
+# fetch(level, name, prompt, quality) -> (items or None if unparseable, model)
+Fetcher = Callable[[str, str, Optional[str], Optional[str]], Awaitable[Tuple[Optional[list], str]]]
+# (level, name, variant); the variant is empty for the default prompt and quality
+NodeKey = Tuple[str, str, str]
+
+
+@dataclass
+class GeoNode:
+    level: str
+    name: str
+    items: Optional[list]
+    model: str
+    created: float = field(default_factory=time.monotonic)
+    speculative: bool = False
+    served: int = 0
+
+    @property
+    def children(self) -> List[str]:
+        names = []
+        for item in self.items or []:
+            name = item.get("name") if isinstance(item, dict) else item
+            if isinstance(name, str) and name.strip():
+                names.append(name.strip())
+        return names
+
+
+def node_key(level: str, name: str, prompt: Optional[str] = None, quality: Optional[str] = None) -> NodeKey:
+    variant = ""
+    if prompt or quality:
+        payload = json.dumps([prompt or None, quality], separators=(",", ":"))
+        variant = hashlib.blake2b(payload.encode("utf-8"), digest_size=8).hexdigest()
+    return level, (name or "").strip().lower(), variant
+
+
+class GeographyCache:
+    """Planner nodes keyed by (level, name, prompt variant), with bounded speculative prefetch of children"""
+
+    def __init__(
+        self,
+        fetch: Fetcher,
+        ttl_seconds: float = TTL_SECONDS,
+        max_nodes: int = MAX_NODES,
+        prefetch_children: int = PREFETCH_CHILDREN,
+        prefetch_concurrency: int = PREFETCH_CONCURRENCY,
+        prefetch_per_minute: int = PREFETCH_PER_MINUTE,
+    ):
+        self.fetch = fetch
+        self.ttl_seconds = ttl_seconds
+        self.max_nodes = max_nodes
+        self.prefetch_children = prefetch_children
+        self.prefetch_per_minute = prefetch_per_minute
+        self._nodes: "OrderedDict[NodeKey, GeoNode]" = OrderedDict()
+        self._inflight: Dict[NodeKey, asyncio.Task] = {}
+        self._speculative_keys: Set[NodeKey] = set()
+        # (level, name) -> times opened, whatever the prompt; bounded like the nodes
+        self._demand: "OrderedDict[Tuple[str, str], int]" = OrderedDict()
+        self._prefetch_slots = asyncio.Semaphore(prefetch_concurrency)
+        self._prefetch_times: deque = deque()
+        self._counters = {
+            "hits": 0, "misses": 0, "prefetch_hits": 0, "joined_prefetch": 0,
+            "prefetches": 0, "prefetch_failures": 0, "prefetch_over_budget": 0,
+        }
+
+    async def get(self, level: str, name: str = "", prompt: Optional[str] = None, quality: Optional[str] = None) -> Tuple[GeoNode, bool]:
+        """The node for ``level``/``name`` and whether it came from the cache.
+
+        ``prompt`` and ``quality`` are only used when the node has to be
+        generated, but a node generated from a custom prompt or quality is
+        cached apart from the default one. Serving a node schedules prefetch
+        of its likely children (with the default prompt).
+        """
+        key = node_key(level, name, prompt, quality)
+        self._count_demand(key[:2])
+        node = self._fresh(key)
+        cached = node is not None
+        if node is not None:
+            self._counters["hits"] += 1
+            if node.speculative and not node.served:
+                self._counters["prefetch_hits"] += 1
+        else:
+            task = self._inflight.get(key)
+            if task is not None and key in self._speculative_keys:
+                # The click landed while its prefetch was still running
+                self._counters["joined_prefetch"] += 1
+                cached = True
+            else:
+                self._counters["misses"] += 1
+            if task is None:
+                task = self._start(key, level, name, prompt, quality, speculative=False)
+            node = await asyncio.shield(task)
+        node.served += 1
+        self._prefetch(node)
+        return node, cached
+
+    def _count_demand(self, place: Tuple[str, str]):
+        self._demand[place] = self._demand.get(place, 0) + 1
+        self._demand.move_to_end(place)
+        while len(self._demand) > self.max_nodes:
+            self._demand.popitem(last=False)
+
+    def _fresh(self, key: NodeKey) -> Optional[GeoNode]:
+        node = self._nodes.get(key)
+        if node is None:
+            return None
+        if time.monotonic() - node.created > self.ttl_seconds:
+            del self._nodes[key]
+            return None
+        self._nodes.move_to_end(key)
+        return node
+
+    def _start(self, key: NodeKey, level: str, name: str, prompt: Optional[str], quality: Optional[str], speculative: bool) -> asyncio.Task:
+        task = asyncio.ensure_future(self._load(key, level, name, prompt, quality, speculative))
+        self._inflight[key] = task
+        if speculative:
+            self._speculative_keys.add(key)
+
+        def finished(t: asyncio.Task, k: NodeKey = key):
+            if self._inflight.get(k) is t:
+                del self._inflight[k]
+            self._speculative_keys.discard(k)
+            if not t.cancelled() and t.exception() is not None and speculative:
+                self._counters["prefetch_failures"] += 1
+                logger.warning(f"Geography prefetch of {k[0]} for {k[1]!r} failed: {t.exception()}")
+
+        task.add_done_callback(finished)
+        return task
+
+    async def _load(self, key: NodeKey, level: str, name: str, prompt: Optional[str], quality: Optional[str], speculative: bool) -> GeoNode:
+        if speculative:
+            async with self._prefetch_slots:
+                items, model = await self.fetch(level, name, None, None)
+        else:
+            items, model = await self.fetch(level, name, prompt, quality)
+        node = GeoNode(level=level, name=name, items=items, model=model, speculative=speculative)
+        if items is not None:
+            # Unparseable output is not cached, so the next request retries
+            self._nodes[key] = node
+            self._nodes.move_to_end(key)
+            while len(self._nodes) > self.max_nodes:
+                self._nodes.popitem(last=False)
+        return node
+
+    def _prefetch(self, node: GeoNode):
+        child_level = CHILD_LEVEL.get(node.level)
+        if not child_level or not self.prefetch_children:
+            return
+        children = node.children
+        # Most-opened children first, then the model's own (popularity) order
+        ranked = sorted(
+            range(len(children)),
+            key=lambda i: (-self._demand.get(node_key(child_level, children[i])[:2], 0), i),
+        )
+        scheduled = 0
+        for i in ranked:
+            if scheduled >= self.prefetch_children:
+                break
+            child = children[i]
+            key = node_key(child_level, child)
+            if key in self._inflight or self._fresh(key) is not None:
+                continue
+            if not self._take_budget():
+                self._counters["prefetch_over_budget"] += 1
+                return
+            self._counters["prefetches"] += 1
+            self._start(key, child_level, child, None, None, speculative=True)
+            scheduled += 1
+
+    def _take_budget(self) -> bool:
+        now = time.monotonic()
+        while self._prefetch_times and now - self._prefetch_times[0] > 60:
+            self._prefetch_times.popleft()
+        if len(self._prefetch_times) >= self.prefetch_per_minute:
+            return False
+        self._prefetch_times.append(now)
+        return True
+
+    def stats(self) -> dict:
+        served = self._counters["hits"] + self._counters["misses"] + self._counters["joined_prefetch"]
+        by_level: Dict[str, int] = {}
+        for level, _, _ in self._nodes:
+            by_level[level] = by_level.get(level, 0) + 1
+        return {
+            "nodes": len(self._nodes),
+            "by_level": by_level,
+            "inflight": len(self._inflight),
+            "custom_prompt_nodes": sum(1 for _, _, variant in self._nodes if variant),
+            "demand_keys": len(self._demand),
+            "hit_rate": round((self._counters["hits"] + self._counters["joined_prefetch"]) / served, 4) if served else 0.0,
+            **self._counters,
+        }
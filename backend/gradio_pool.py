@@ -0,0 +1,249 @@
+"""
+Reusable, pre-warmed Gradio clients for the IP-Adapter FaceID Space.
+
+Constructing a gradio_client Client is not free: it resolves the Space,
+downloads its config and API info, and starts a heartbeat thread before it can
+predict anything. The visualization and photo-app endpoints used to pay that
+on every request. A GradioClientPool instead keeps up to GRADIO_POOL_SIZE
+idle clients and lends them out one per call:
+
+* clients are created lazily, on first use, or by ``warm()`` in the
+  background at startup so the first request finds one ready;
+* a client idle for longer than GRADIO_HEALTH_CHECK_SECONDS is checked
+  (a config fetch) before it is lent again, and replaced if the Space does
+  not answer;
+* a client whose call failed or timed out is closed rather than returned,
+  since its session may be the reason for the failure;
+* when every pooled client is busy, an overflow client is created for the
+  call and closed afterwards, so callers never wait on the pool itself.
+
+Every client records how long it took to set up and how long its calls ran,
+so ``stats()`` shows how much of the end-to-end time is setup and how much is
+inference.
+"""
+
+import logging
+import os
+import threading
+import time
+import urllib.parse
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from image_jobs import wait_for_gradio
+
+logger = logging.getLogger(__name__)
+
+FACEID_SPACE = "multimodalart/Ip-Adapter-FaceID"
+POOL_SIZE = int(os.getenv("GRADIO_POOL_SIZE", os.getenv("IMAGE_JOB_WORKERS", "2")))
+HEALTH_CHECK_SECONDS = float(os.getenv("GRADIO_HEALTH_CHECK_SECONDS", "120"))
+# Set to 0 to skip creating clients at startup, e.g. in offline development
+WARM_AT_STARTUP = os.getenv("GRADIO_POOL_WARM", "1") != "0"
+HEALTH_CHECK_TIMEOUT_SECONDS = 5.0
+
+
+@dataclass
+class PooledClient:
+    id: int
+    client: Any
+    setup_seconds: float
+    created: float = field(default_factory=time.time)
+    last_used: float = field(default_factory=time.monotonic)
+    calls: int = 0
+    failures: int = 0
+    inference_seconds: float = 0.0
+    last_inference_seconds: Optional[float] = None
+    health_checks: int = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "setup_ms": round(self.setup_seconds * 1000, 1),
+            "calls": self.calls,
+            "failures": self.failures,
+            "avg_inference_ms": round(self.inference_seconds / self.calls * 1000, 1) if self.calls else None,
+            "last_inference_ms": round(self.last_inference_seconds * 1000, 1) if self.last_inference_seconds is not None else None,
+            "health_checks": self.health_checks,
+            "age_seconds": round(time.time() - self.created, 1),
+        }
+
+
+class GradioClientPool:
+    """Up to ``size`` idle clients for one Space, health-checked and reused across calls"""
+
+    def __init__(
+        self,
+        space: str = FACEID_SPACE,
+        token: Optional[str] = None,
+        size: int = POOL_SIZE,
+        health_check_seconds: float = HEALTH_CHECK_SECONDS,
+        factory: Optional[Callable[[], Any]] = None,
+    ):
+        self.space = space
+        self.token = token
+        self.size = max(1, size)
+        self.health_check_seconds = health_check_seconds
+        self._factory = factory
+        self._idle: List[PooledClient] = []
+        self._busy: Dict[int, PooledClient] = {}
+        self._lock = threading.Lock()
+        self._next_id = 1
+        self._retired: List[dict] = []
+        self._counters = {
+            "created": 0, "setup_failures": 0, "reused": 0, "overflow": 0,
+            "health_checks": 0, "unhealthy": 0, "discarded": 0,
+        }
+
+    def _create(self) -> PooledClient:
+        start = time.perf_counter()
+        try:
+            if self._factory is not None:
+                client = self._factory()
+            else:
+                from gradio_client import Client
+                client = Client(self.space, hf_token=self.token or os.getenv("HUGGINGFACE_TOKEN"), verbose=False)
+        except Exception:
+            with self._lock:
+                self._counters["setup_failures"] += 1
+            raise
+        setup = time.perf_counter() - start
+        with self._lock:
+            pooled = PooledClient(id=self._next_id, client=client, setup_seconds=setup)
+            self._next_id += 1
+            self._counters["created"] += 1
+        logger.info(f"Gradio client {pooled.id} for {self.space} ready in {setup * 1000:.0f} ms")
+        return pooled
+
+    def _healthy(self, pooled: PooledClient) -> bool:
+        """Whether the Space still answers this client's session; only checked after a long idle"""
+        if time.monotonic() - pooled.last_used < self.health_check_seconds:
+            return True
+        import httpx
+        from gradio_client import utils as gradio_utils
+
+        client = pooled.client
+        pooled.health_checks += 1
+        with self._lock:
+            self._counters["health_checks"] += 1
+        try:
+            response = httpx.get(
+                urllib.parse.urljoin(client.src, gradio_utils.CONFIG_URL),
+                headers=getattr(client, "headers", None),
+                cookies=getattr(client, "cookies", None),
+                timeout=HEALTH_CHECK_TIMEOUT_SECONDS,
+            )
+            if response.is_success:
+                return True
+            logger.warning(f"Gradio client {pooled.id} failed health check: HTTP {response.status_code}")
+        except Exception as e:
+            logger.warning(f"Gradio client {pooled.id} failed health check: {e}")
+        with self._lock:
+            self._counters["unhealthy"] += 1
+        return False
+
+    def acquire(self) -> PooledClient:
+        """An idle healthy client, or a new one; blocking, so call it from a worker thread"""
+        while True:
+            with self._lock:
+                pooled = self._idle.pop() if self._idle else None
+            if pooled is None:
+                break
+            if self._healthy(pooled):
+                with self._lock:
+                    self._counters["reused"] += 1
+                    self._busy[pooled.id] = pooled
+                return pooled
+            self._close(pooled)
+        pooled = self._create()
+        with self._lock:
+            if len(self._busy) >= self.size:
+                self._counters["overflow"] += 1
+            self._busy[pooled.id] = pooled
+        return pooled
+
+    def release(self, pooled: PooledClient, ok: bool = True):
+        """Return ``pooled`` for reuse; failed clients and clients beyond the pool size are closed"""
+        pooled.last_used = time.monotonic()
+        with self._lock:
+            self._busy.pop(pooled.id, None)
+            keep = ok and len(self._idle) < self.size
+            if keep:
+                self._idle.append(pooled)
+        if not keep:
+            if not ok:
+                with self._lock:
+                    self._counters["discarded"] += 1
+            self._close(pooled)
+
+    def _close(self, pooled: PooledClient):
+        with self._lock:
+            self._retired.append(pooled.to_dict())
+            del self._retired[:-20]
+        close = getattr(pooled.client, "close", None)
+        if close is not None:
+            try:
+                close()
+            except Exception as e:
+                logger.debug(f"Closing gradio client {pooled.id} failed: {e}")
+
+    def predict(self, timeout: float, progress: Optional[Callable[..., None]] = None, **kwargs) -> Any:
+        """``client.submit(**kwargs)`` on a pooled client, waited on like ``wait_for_gradio``"""
+        pooled = self.acquire()
+        ok = False
+        start = time.perf_counter()
+        try:
+            result = wait_for_gradio(pooled.client.submit(**kwargs), timeout, progress)
+            ok = True
+            return result
+        finally:
+            elapsed = time.perf_counter() - start
+            pooled.calls += 1
+            pooled.inference_seconds += elapsed
+            pooled.last_inference_seconds = elapsed
+            if not ok:
+                pooled.failures += 1
+            self.release(pooled, ok)
+
+    def warm(self, count: Optional[int] = None) -> int:
+        """Fill the pool up to ``count`` (default: its size) idle clients; returns how many were created"""
+        target = self.size if count is None else min(count, self.size)
+        created = 0
+        while True:
+            with self._lock:
+                if len(self._idle) + len(self._busy) >= target:
+                    break
+            try:
+                pooled = self._create()
+            except Exception as e:
+                logger.warning(f"Could not warm gradio client for {self.space}: {e}")
+                break
+            self.release(pooled)
+            created += 1
+        return created
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for pooled in idle:
+            self._close(pooled)
+
+    def stats(self) -> dict:
+        with self._lock:
+            idle = [pooled.to_dict() for pooled in self._idle]
+            busy = [pooled.to_dict() for pooled in self._busy.values()]
+            retired = list(self._retired)
+        clients = idle + busy + retired
+        setup = [c["setup_ms"] for c in clients]
+        calls = sum(c["calls"] for c in clients)
+        inference = sum((c["avg_inference_ms"] or 0) * c["calls"] for c in clients)
+        return {
+            "space": self.space,
+            "size": self.size,
+            "idle": len(idle),
+            "busy": len(busy),
+            "avg_setup_ms": round(sum(setup) / len(setup), 1) if setup else None,
+            "avg_inference_ms": round(inference / calls, 1) if calls else None,
+            "clients": idle + busy,
+            "retired": retired,
+            **self._counters,
+        }
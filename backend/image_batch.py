@@ -0,0 +1,201 @@
+"""
+Paced, concurrent batch image generation.
+
+/api/generate-destination-images used to generate one DALL-E image per
+destination in turn, with a blocking one-second sleep between calls to stay
+under the rate limit. Five destinations took five generations plus five
+seconds of a frozen event loop, so the endpoint was capped at five.
+
+An ImageBatcher runs a batch's generations concurrently, up to
+IMAGE_BATCH_CONCURRENCY at a time. Every call first takes a token from a
+shared TokenBucket that refills at IMAGE_BATCH_PER_MINUTE, so batches from
+all requests together stay within the provider's images-per-minute limit. A
+429 from the provider pauses the bucket for its Retry-After before the call
+is retried. Results are yielded in the order they finish, so an endpoint can
+stream each image as soon as it is ready. The item cap is now just a bound
+on how long one request may occupy the bucket (IMAGE_BATCH_MAX_ITEMS).
+
+A request that waits for the whole batch in one response gets a smaller cap,
+IMAGE_BATCH_BLOCKING_MAX_ITEMS: five by default, as many as that endpoint
+always generated, or the burst if larger. Past the burst every image waits a
+minute / PER_MINUTE for its token, so twenty items at the default pace would
+hold the connection for about three and a half minutes; five take about half
+a minute. Larger batches belong on the streaming endpoint.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+PER_MINUTE = float(os.getenv("IMAGE_BATCH_PER_MINUTE", "5"))
+BURST = int(os.getenv("IMAGE_BATCH_BURST", "3"))
+CONCURRENCY = int(os.getenv("IMAGE_BATCH_CONCURRENCY", "3"))
+MAX_ITEMS = int(os.getenv("IMAGE_BATCH_MAX_ITEMS", "20"))
+# Batches answered in a single blocking response; never fewer than the five it always served
+BLOCKING_MAX_ITEMS = int(os.getenv("IMAGE_BATCH_BLOCKING_MAX_ITEMS", str(max(5, BURST))))
+RATE_LIMIT_RETRIES = 2
+DEFAULT_RETRY_AFTER_SECONDS = 20.0
+
+
+class TokenBucket:
+    """Async token bucket: ``rate_per_minute`` tokens, up to ``burst`` banked, with explicit pauses for 429s"""
+
+    def __init__(self, rate_per_minute: float = PER_MINUTE, burst: int = BURST):
+        self.rate = rate_per_minute / 60.0
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+        self._waited = 0.0
+        self._granted = 0
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        """Wait for a token; callers are served one at a time in arrival order"""
+        start = time.monotonic()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    break
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+        self._granted += 1
+        self._waited += time.monotonic() - start
+
+    def pause(self, seconds: float):
+        """Hold every caller for ``seconds``, e.g. the provider's Retry-After, and drop banked tokens"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+    def stats(self) -> dict:
+        self._refill(time.monotonic())
+        return {
+            "per_minute": round(self.rate * 60, 2),
+            "burst": self.burst,
+            "tokens": round(self._tokens, 2),
+            "paused_for": round(max(0.0, self._paused_until - time.monotonic()), 1),
+            "granted": self._granted,
+            "avg_wait_ms": round(self._waited / self._granted * 1000, 1) if self._granted else 0.0,
+        }
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """Seconds to back off if ``error`` is a provider rate limit (HTTP 429), else None"""
+    response = getattr(error, "response", None)
+    if getattr(error, "status_code", None) != 429 and getattr(response, "status_code", None) != 429:
+        return None
+    header = getattr(response, "headers", {}).get("retry-after") if response is not None else None
+    try:
+        return max(1.0, float(header))
+    except (TypeError, ValueError):
+        return DEFAULT_RETRY_AFTER_SECONDS
+
+
+@dataclass
+class BatchResult:
+    key: str
+    index: int
+    value: Any = None
+    error: Optional[BaseException] = None
+    attempts: int = 0
+    seconds: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class ImageBatcher:
+    """Runs batches of ``generate(prompt)`` calls concurrently, paced by a shared TokenBucket"""
+
+    def __init__(
+        self,
+        generate: Callable[[str], Awaitable[Any]],
+        bucket: Optional[TokenBucket] = None,
+        concurrency: int = CONCURRENCY,
+        max_items: int = MAX_ITEMS,
+    ):
+        self.generate = generate
+        self.bucket = bucket or TokenBucket()
+        self.concurrency = max(1, concurrency)
+        self.max_items = max_items
+        # Shared across batches so concurrent requests do not multiply the provider load
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._running = 0
+        self._counters = {"batches": 0, "items": 0, "succeeded": 0, "failed": 0, "rate_limited": 0, "truncated": 0}
+
+    def limit(self, items: Sequence, max_items: Optional[int] = None) -> list:
+        """``items`` cut to ``max_items`` (default: the batch cap)"""
+        cap = self.max_items if max_items is None else min(max_items, self.max_items)
+        if len(items) > cap:
+            self._counters["truncated"] += len(items) - cap
+            return list(items[:cap])
+        return list(items)
+
+    async def run(self, items: Sequence[Tuple[str, str]]) -> AsyncIterator[BatchResult]:
+        """Generate each (key, prompt) and yield a BatchResult per item as it finishes.
+
+        Items with the same key are generated once. Closing the iterator early
+        cancels whatever has not finished.
+        """
+        unique: Dict[str, Tuple[int, str]] = {}
+        for index, (key, prompt) in enumerate(self.limit(items)):
+            unique.setdefault(key, (index, prompt))
+        self._counters["batches"] += 1
+        self._counters["items"] += len(unique)
+        tasks = [asyncio.ensure_future(self._one(key, index, prompt)) for key, (index, prompt) in unique.items()]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                yield await finished
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _one(self, key: str, index: int, prompt: str) -> BatchResult:
+        result = BatchResult(key=key, index=index)
+        start = time.monotonic()
+        async with self._slots:
+            self._running += 1
+            try:
+                while True:
+                    await self.bucket.acquire()
+                    result.attempts += 1
+                    try:
+                        result.value = await self.generate(prompt)
+                        break
+                    except Exception as e:
+                        backoff = retry_after_seconds(e)
+                        if backoff is None or result.attempts > RATE_LIMIT_RETRIES:
+                            result.error = e
+                            break
+                        self._counters["rate_limited"] += 1
+                        logger.warning(f"Image generation for {key!r} rate limited, pausing {backoff:.0f}s")
+                        self.bucket.pause(backoff)
+            finally:
+                self._running -= 1
+        result.seconds = time.monotonic() - start
+        self._counters["succeeded" if result.ok else "failed"] += 1
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "max_items": self.max_items,
+            "running": self._running,
+            "bucket": self.bucket.stats(),
+            **self._counters,
+        }
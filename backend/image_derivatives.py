@@ -0,0 +1,182 @@
+"""
+Multi-resolution WebP/AVIF derivatives for uploaded photos.
+
+An upload used to be stored as one 1200px JPEG, which the gallery cards then
+downloaded at full size to show a few hundred pixels. Each upload now also
+gets a derivative at each of IMAGE_DERIVATIVE_WIDTHS (never wider than the
+original) in WebP, and in AVIF when this Pillow build can write it. They are
+stored next to the original, in the same Supabase bucket or local directory.
+
+Encoding takes a few hundred milliseconds per photo, so it runs after the
+response: the upload returns a manifest straight away, built from the
+names the derivatives will have, and a DerivativePipeline encodes them in a
+thread pool, IMAGE_DERIVATIVE_CONCURRENCY uploads at a time. The manifest's
+``sources`` map onto <picture><source type srcset> elements, AVIF first. Its
+``src`` (the original JPEG) is the fallback, and it stays valid while the
+derivatives are still being written.
+"""
+
+import asyncio
+import io
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from PIL import Image, features
+
+logger = logging.getLogger(__name__)
+
+WIDTHS = tuple(sorted({int(w) for w in os.getenv("IMAGE_DERIVATIVE_WIDTHS", "160,480,1200").split(",") if w.strip()}))
+AVIF_ENABLED = os.getenv("IMAGE_DERIVATIVE_AVIF", "1") != "0"
+CONCURRENCY = int(os.getenv("IMAGE_DERIVATIVE_CONCURRENCY", "2"))
+# Card-sized by default; pages with larger images pass their own sizes attribute
+DEFAULT_SIZES = "(max-width: 600px) 100vw, 480px"
+MAX_TRACKED = 1000
+
+# format -> (Pillow format, MIME type, save options)
+FORMATS = {
+    "avif": ("AVIF", "image/avif", {"quality": 55, "speed": 6}),
+    "webp": ("WEBP", "image/webp", {"quality": 80, "method": 4}),
+}
+
+# store(name, data, content_type)
+Store = Callable[[str, bytes, str], Awaitable[None]]
+
+
+def available_formats() -> List[str]:
+    """Derivative formats this Pillow build can write, most compact first"""
+    formats = []
+    if AVIF_ENABLED and features.check("avif"):
+        formats.append("avif")
+    if features.check("webp"):
+        formats.append("webp")
+    return formats
+
+
+def derivative_widths(original_width: int, widths: Tuple[int, ...] = WIDTHS) -> List[int]:
+    """Target widths for an original of ``original_width``; smaller originals are never upscaled"""
+    chosen = [w for w in widths if w < original_width]
+    if widths and original_width <= widths[-1]:
+        chosen.append(original_width)
+    return chosen
+
+
+def derivative_name(base: str, width: int, fmt: str) -> str:
+    return f"{base}_{width}w.{fmt}"
+
+
+def build_manifest(base: str, original_url: str, size: Tuple[int, int], url_for: Callable[[str], str], formats: Optional[List[str]] = None) -> dict:
+    """srcset-style description of the derivatives ``base`` will have once encoded"""
+    width, height = size
+    formats = available_formats() if formats is None else formats
+    widths = derivative_widths(width)
+    return {
+        "src": original_url,
+        "width": width,
+        "height": height,
+        "sizes": DEFAULT_SIZES,
+        "sources": [
+            {
+                "type": FORMATS[fmt][1],
+                "srcset": ", ".join(f"{url_for(derivative_name(base, w, fmt))} {w}w" for w in widths),
+            }
+            for fmt in formats
+        ],
+    }
+
+
+def encode_derivatives(content: bytes, base: str, formats: List[str]) -> List[Tuple[str, bytes, str]]:
+    """(name, data, content type) for every width and format of the image in ``content``"""
+    with Image.open(io.BytesIO(content)) as img:
+        img.load()
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGB")
+        outputs = []
+        # Largest first, each resized from the previous one: cheaper and visually equivalent
+        source = img
+        for width in sorted(derivative_widths(img.width), reverse=True):
+            height = max(1, round(img.height * width / img.width))
+            resized = source if source.width == width else source.resize((width, height), Image.Resampling.LANCZOS)
+            for fmt in formats:
+                pil_format, content_type, options = FORMATS[fmt]
+                buffer = io.BytesIO()
+                resized.save(buffer, format=pil_format, **options)
+                outputs.append((derivative_name(base, width, fmt), buffer.getvalue(), content_type))
+            source = resized
+        return outputs
+
+
+class DerivativePipeline:
+    """Encodes and stores upload derivatives in the background, a bounded number at a time"""
+
+    def __init__(self, concurrency: int = CONCURRENCY):
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.concurrency = max(1, concurrency)
+        self._status: "OrderedDict[str, dict]" = OrderedDict()
+        self._tasks: set = set()
+        self._counters = {"submitted": 0, "ready": 0, "failed": 0, "files": 0, "original_bytes": 0, "derivative_bytes": 0}
+        self._encode_seconds = 0.0
+
+    def submit(self, base: str, content: bytes, store: Store, formats: Optional[List[str]] = None):
+        """Schedule the derivatives of ``content``, writing each through ``store``; returns immediately"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+        formats = available_formats() if formats is None else formats
+        self._track(base, {"status": "pending", "files": []})
+        self._counters["submitted"] += 1
+        task = asyncio.create_task(self._run(base, content, store, formats))
+        # Keep a reference so the task is not garbage collected mid-run
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, base: str, content: bytes, store: Store, formats: List[str]):
+        async with self._slots:
+            start = time.perf_counter()
+            try:
+                outputs = await asyncio.get_running_loop().run_in_executor(None, encode_derivatives, content, base, formats)
+                self._encode_seconds += time.perf_counter() - start
+                for name, data, content_type in outputs:
+                    await store(name, data, content_type)
+            except Exception as e:
+                logger.warning(f"Derivatives for {base} failed: {e}")
+                self._counters["failed"] += 1
+                self._track(base, {"status": "failed", "error": str(e), "files": []})
+                return
+        size = sum(len(data) for _, data, _ in outputs)
+        self._counters["ready"] += 1
+        self._counters["files"] += len(outputs)
+        self._counters["original_bytes"] += len(content)
+        self._counters["derivative_bytes"] += size
+        self._track(base, {
+            "status": "ready",
+            "files": [{"name": name, "bytes": len(data), "type": content_type} for name, data, content_type in outputs],
+            "seconds": round(time.perf_counter() - start, 3),
+        })
+        logger.info(f"Stored {len(outputs)} derivatives for {base} ({size} bytes from a {len(content)} byte original)")
+
+    def _track(self, base: str, status: dict):
+        self._status[base] = status
+        self._status.move_to_end(base)
+        while len(self._status) > MAX_TRACKED:
+            self._status.popitem(last=False)
+
+    def status(self, base: str) -> Optional[dict]:
+        return self._status.get(base)
+
+    async def drain(self):
+        """Wait for derivatives still being written, e.g. on shutdown"""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        ready = self._counters["ready"]
+        return {
+            "formats": available_formats(),
+            "widths": list(WIDTHS),
+            "concurrency": self.concurrency,
+            "pending": len(self._tasks),
+            "avg_encode_ms": round(self._encode_seconds / ready * 1000, 1) if ready else None,
+            **self._counters,
+        }
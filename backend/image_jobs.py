@@ -0,0 +1,273 @@
+"""
+Background job queue for image generation.
+
+Face-swap visualizations and photo-app images wait on a Hugging Face Gradio
+queue and then on the DALL-E fallback, which often takes over a minute.
+Holding the HTTP request open for that long gets it cut by proxies, and the
+client's retries pile more work on the Space. Endpoints now submit a job
+and return its id at once. A fixed number of workers run jobs in order, so
+concurrency is bounded by the worker count and the queue depth, not by how
+many sockets are open.
+
+Each job reports a stage and progress as it runs. For the Gradio call this
+comes from the Space's status updates: queue position and ETA while
+waiting, then the step counter while generating. Clients poll
+GET /api/image-jobs/{id} or follow GET /api/image-jobs/{id}/events (SSE).
+Finished jobs keep their result for IMAGE_JOB_TTL_SECONDS.
+"""
+
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+WORKERS = int(os.getenv("IMAGE_JOB_WORKERS", "2"))
+MAX_QUEUED = int(os.getenv("IMAGE_JOB_QUEUE_DEPTH", "32"))
+TTL_SECONDS = float(os.getenv("IMAGE_JOB_TTL_SECONDS", "3600"))
+GRADIO_POLL_SECONDS = 0.5
+
+TERMINAL = ("succeeded", "failed")
+
+
+class QueueFull(Exception):
+    """Too many image jobs are already waiting"""
+
+
+class JobFailed(Exception):
+    """A job ended with an error; carries the HTTP status the endpoint would have returned"""
+
+    def __init__(self, detail: str, status_code: int = 500):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+
+
+@dataclass
+class ImageJob:
+    id: str
+    kind: str
+    status: str = "queued"
+    stage: str = "queued"
+    progress: Optional[float] = None
+    message: Optional[str] = None
+    result: Any = None
+    error: Optional[str] = None
+    status_code: Optional[int] = None
+    created: float = field(default_factory=time.time)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    version: int = 0
+    _changed: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+
+    @property
+    def done(self) -> bool:
+        return self.status in TERMINAL
+
+    def update(self, stage: Optional[str] = None, progress: Optional[float] = None, message: Optional[str] = None):
+        if stage is not None:
+            self.stage = stage
+        if progress is not None:
+            self.progress = round(max(0.0, min(1.0, progress)), 3)
+        self.message = message
+        self._notify()
+
+    def _notify(self):
+        self.version += 1
+        # Wake everyone waiting on this version, then arm a fresh event for the next change
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": self.progress,
+            "message": self.message,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created,
+            "started_at": self.started,
+            "finished_at": self.finished,
+        }
+
+
+# Runs with a progress callback: progress(stage, fraction=None, message=None)
+JobFn = Callable[[Callable[..., None]], Awaitable[Any]]
+
+
+class ImageJobQueue:
+    """FIFO of image jobs run by a fixed pool of workers, with results kept for a TTL"""
+
+    def __init__(self, workers: int = WORKERS, max_queued: int = MAX_QUEUED, ttl_seconds: float = TTL_SECONDS):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.ttl_seconds = ttl_seconds
+        self._jobs: "OrderedDict[str, ImageJob]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: list = []
+        self._running_jobs = 0
+        self._counters = {"submitted": 0, "succeeded": 0, "failed": 0, "rejected": 0}
+
+    def start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+    def submit(self, kind: str, fn: JobFn) -> ImageJob:
+        """Queue ``fn``; raises QueueFull when IMAGE_JOB_QUEUE_DEPTH jobs are already waiting"""
+        if self._queue is None:
+            self.start()
+        self._expire()
+        if self._queue.qsize() >= self.max_queued:
+            self._counters["rejected"] += 1
+            raise QueueFull(f"{self._queue.qsize()} image jobs already queued")
+        job = ImageJob(id=uuid.uuid4().hex, kind=kind)
+        self._jobs[job.id] = job
+        self._queue.put_nowait((job, fn))
+        self._counters["submitted"] += 1
+        job.update(message=f"Position {self._queue.qsize()} in queue")
+        return job
+
+    def get(self, job_id: str) -> Optional[ImageJob]:
+        self._expire()
+        return self._jobs.get(job_id)
+
+    async def wait(self, job: ImageJob) -> Any:
+        """Result of ``job`` once it finishes; raises JobFailed if it failed"""
+        async for _ in self.watch(job):
+            pass
+        if job.status == "failed":
+            raise JobFailed(job.error or "Image job failed", job.status_code or 500)
+        return job.result
+
+    async def watch(self, job: ImageJob, heartbeat: Optional[float] = None) -> AsyncIterator[Optional[ImageJob]]:
+        """Yield ``job`` now and after each change until it finishes; None every ``heartbeat`` seconds of silence"""
+        seen = -1
+        while True:
+            changed = job._changed
+            if job.version != seen:
+                seen = job.version
+                yield job
+                if job.done:
+                    return
+                continue
+            try:
+                await asyncio.wait_for(changed.wait(), heartbeat)
+            except asyncio.TimeoutError:
+                yield None
+
+    async def _worker(self, number: int):
+        while True:
+            job, fn = await self._queue.get()
+            self._announce_positions()
+            self._running_jobs += 1
+            job.status, job.started = "running", time.time()
+            job.update(stage="starting", message=None)
+            try:
+                job.result = await fn(job.update)
+                job.status = "succeeded"
+                self._counters["succeeded"] += 1
+            except asyncio.CancelledError:
+                job.status, job.error = "failed", "Server shutting down"
+                raise
+            except JobFailed as e:
+                job.status, job.error, job.status_code = "failed", e.detail, e.status_code
+                self._counters["failed"] += 1
+            except Exception as e:
+                logger.error(f"Image job {job.id} ({job.kind}) failed: {e}")
+                job.status, job.error, job.status_code = "failed", str(e), 500
+                self._counters["failed"] += 1
+            finally:
+                self._running_jobs -= 1
+                job.finished = time.time()
+                job.update(stage="done" if job.status == "succeeded" else "failed", progress=1.0 if job.status == "succeeded" else None)
+                self._queue.task_done()
+                logger.info(f"Image job {job.id} ({job.kind}) {job.status} in {job.finished - job.created:.1f}s")
+
+    def _announce_positions(self):
+        for position, (queued, _) in enumerate(self._queue._queue, start=1):
+            queued.update(message=f"Position {position} in queue")
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl_seconds
+        while self._jobs:
+            job = next(iter(self._jobs.values()))
+            if not job.done or job.finished > cutoff:
+                # Jobs finish roughly in submission order; an unfinished head stops the sweep
+                break
+            self._jobs.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "running": self._running_jobs,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "max_queued": self.max_queued,
+            "retained": len(self._jobs),
+            "ttl_seconds": self.ttl_seconds,
+            **self._counters,
+        }
+
+
+def from_thread(progress: Callable[..., None]) -> Callable[..., None]:
+    """Wrap a job's progress callback so a worker thread can call it; create it on the event loop"""
+    loop = asyncio.get_running_loop()
+    return lambda *args: loop.call_soon_threadsafe(lambda: progress(*args))
+
+
+def wait_for_gradio(job, timeout: float, progress: Optional[Callable[..., None]] = None, stage: str = "generating"):
+    """Block until a gradio_client Job finishes, reporting its status updates through ``progress``.
+
+    ``progress`` is called from this (worker) thread and must be thread-safe.
+    """
+    deadline = time.monotonic() + timeout
+    last = None
+    while not job.done():
+        if time.monotonic() > deadline:
+            job.cancel()
+            raise TimeoutError(f"Gradio job did not finish within {timeout:.0f}s")
+        if progress:
+            update = describe_gradio_status(job.status(), stage)
+            if update != last:
+                last = update
+                progress(*update)
+        time.sleep(GRADIO_POLL_SECONDS)
+    return job.result()
+
+
+def describe_gradio_status(status, stage: str = "generating"):
+    """(stage, fraction or None, message) for a gradio_client StatusUpdate"""
+    code = getattr(getattr(status, "code", None), "name", "").lower()
+    if code in ("starting", "joining_queue", "in_queue", "queue_full"):
+        rank, size, eta = getattr(status, "rank", None), getattr(status, "queue_size", None), getattr(status, "eta", None)
+        message = "Waiting for the image model"
+        if rank is not None:
+            message += f": position {rank + 1}" + (f" of {size}" if size else "")
+        if eta:
+            message += f", about {eta:.0f}s"
+        return f"{stage}:queued", None, message
+    for unit in getattr(status, "progress_data", None) or []:
+        if unit.progress is not None:
+            return stage, float(unit.progress), unit.desc
+        if unit.index is not None and unit.length:
+            return stage, (unit.index + 1) / unit.length, f"{unit.index + 1}/{unit.length} {unit.unit or 'steps'}"
+    return stage, None, None
@@ -0,0 +1,203 @@
+"""
+Content-addressed cache for selfie + prompt image generations.
+
+Users often regenerate the same destination with the same selfie. Each time
+used to mean another Hugging Face (or DALL-E) generation and another set of
+``generated_*_{timestamp}`` files in the uploads directory. Results are now
+keyed by a hash of the selfie bytes, the normalized prompt and the model
+parameters, so a repeat is answered from disk at once. Callers that want a new
+take pass ``variation`` and skip the lookup; the new result then replaces the
+cached one.
+
+Image files are content-addressed as well: each one is stored once, as
+``<sha256>.<ext>`` under IMAGE_RESULT_CACHE_DIR, however many results refer to
+it. A SQLite index maps result keys to their files and tracks when each
+result was last served. When the files pass IMAGE_RESULT_CACHE_MAX_MB, the
+least recently served results are dropped, along with any file no remaining
+result refers to.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = Path(os.getenv("IMAGE_RESULT_CACHE_DIR", Path(__file__).parent / "backend" / "static" / "uploads" / "results"))
+INDEX_PATH = os.getenv("IMAGE_RESULT_CACHE_PATH", str(Path(__file__).parent / "data" / "image_results.sqlite3"))
+MAX_BYTES = int(float(os.getenv("IMAGE_RESULT_CACHE_MAX_MB", "500")) * 2**20)
+# URL prefix under which CACHE_DIR is served
+URL_PREFIX = "/static/uploads/results"
+
+_CHUNK = 1 << 20
+
+
+def _normalize_text(text) -> str:
+    return " ".join(str(text).split()).lower() if text is not None else ""
+
+
+def make_result_key(selfie: bytes, prompt: str, params: dict) -> str:
+    """Stable key for one generation: the selfie's bytes, the normalized prompt and the model parameters"""
+    normalized = {
+        "selfie": hashlib.sha256(selfie).hexdigest(),
+        "prompt": _normalize_text(prompt),
+        "params": params,
+    }
+    payload = json.dumps(normalized, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def file_digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ImageResultCache:
+    """Result key -> content-addressed image files, bounded by total file size with LRU eviction"""
+
+    def __init__(self, directory: Path = CACHE_DIR, index_path: str = INDEX_PATH, max_bytes: int = MAX_BYTES, url_prefix: str = URL_PREFIX):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.url_prefix = url_prefix.rstrip("/")
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, list] = {}  # key -> [lock, holders and waiters]
+        self._counters = {"hits": 0, "misses": 0, "variations": 0, "writes": 0, "deduplicated_files": 0, "evicted_results": 0, "evicted_files": 0}
+        self._db: Optional[sqlite3.Connection] = None
+        self._total_bytes = 0
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            Path(index_path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(index_path, check_same_thread=False, timeout=5.0)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, files TEXT NOT NULL, created REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_results_last_access ON results(last_access)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS files (name TEXT PRIMARY KEY, size INTEGER NOT NULL, refs INTEGER NOT NULL)")
+            self._db.commit()
+            self._total_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM files").fetchone()[0]
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f"Image result cache unavailable, every generation will run: {e}")
+            self._db = None
+
+    @property
+    def enabled(self) -> bool:
+        return self._db is not None
+
+    @asynccontextmanager
+    async def single_flight(self, key: str):
+        """Hold while generating ``key`` so an identical concurrent request waits and then hits the cache"""
+        entry = self._inflight.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._inflight[key]
+
+    def get(self, key: str) -> Optional[List[str]]:
+        """URLs of the cached result for ``key``, or None; a result whose files went missing counts as a miss"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            row = self._db.execute("SELECT files FROM results WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                names = json.loads(row[0])
+                if all((self.directory / name).exists() for name in names):
+                    self._db.execute("UPDATE results SET last_access = ? WHERE key = ?", (time.time(), key))
+                    self._db.commit()
+                    self._counters["hits"] += 1
+                    return [f"{self.url_prefix}/{name}" for name in names]
+                self._drop(key, names)
+                self._db.commit()
+            self._counters["misses"] += 1
+            return None
+
+    def note_variation(self):
+        with self._lock:
+            self._counters["variations"] += 1
+
+    def put(self, key: str, paths: Sequence[Path]) -> List[str]:
+        """Move the generated files at ``paths`` into the store as the result for ``key``; returns their URLs.
+
+        A file whose content is already stored is deleted instead of kept twice.
+        """
+        if not self.enabled:
+            raise RuntimeError("image result cache is unavailable")
+        names = []
+        with self._lock:
+            for path in paths:
+                path = Path(path)
+                name = f"{file_digest(path)}{path.suffix.lower() or '.png'}"
+                target = self.directory / name
+                row = self._db.execute("SELECT size FROM files WHERE name = ?", (name,)).fetchone()
+                if row is not None and target.exists():
+                    path.unlink()
+                    self._counters["deduplicated_files"] += 1
+                else:
+                    shutil.move(str(path), target)
+                    size = target.stat().st_size
+                    if row is None:
+                        self._db.execute("INSERT INTO files (name, size, refs) VALUES (?, ?, 0)", (name, size))
+                        self._total_bytes += size
+                names.append(name)
+            # Count the new references before releasing the old ones, so shared files survive
+            self._db.executemany("UPDATE files SET refs = refs + 1 WHERE name = ?", [(name,) for name in names])
+            old = self._db.execute("SELECT files FROM results WHERE key = ?", (key,)).fetchone()
+            if old is not None:
+                self._drop(key, json.loads(old[0]))
+            now = time.time()
+            self._db.execute("INSERT INTO results (key, files, created, last_access) VALUES (?, ?, ?, ?)", (key, json.dumps(names), now, now))
+            self._counters["writes"] += 1
+            self._evict(keep=key)
+            self._db.commit()
+        return [f"{self.url_prefix}/{name}" for name in names]
+
+    def _drop(self, key: str, names: List[str]):
+        self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+        self._db.executemany("UPDATE files SET refs = refs - 1 WHERE name = ?", [(name,) for name in names])
+        for name, size in self._db.execute("SELECT name, size FROM files WHERE refs <= 0").fetchall():
+            (self.directory / name).unlink(missing_ok=True)
+            self._db.execute("DELETE FROM files WHERE name = ?", (name,))
+            self._total_bytes -= size
+            self._counters["evicted_files"] += 1
+
+    def _evict(self, keep: str):
+        while self._total_bytes > self.max_bytes:
+            row = self._db.execute(
+                "SELECT key, files FROM results WHERE key != ? ORDER BY last_access LIMIT 1", (keep,)
+            ).fetchone()
+            if row is None:
+                break
+            self._drop(row[0], json.loads(row[1]))
+            self._counters["evicted_results"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            results = self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0] if self.enabled else 0
+            files = self._db.execute("SELECT COUNT(*) FROM files").fetchone()[0] if self.enabled else 0
+        lookups = self._counters["hits"] + self._counters["misses"]
+        return {
+            "enabled": self.enabled,
+            "results": results,
+            "files": files,
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "hit_rate": round(self._counters["hits"] / lookups, 4) if lookups else 0.0,
+            **self._counters,
+        }
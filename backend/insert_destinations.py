@@ -1,29 +1,71 @@
 #!/usr/bin/env python3
 """
 Fully GPT-powered destination generator and Supabase uploader
+
+Seeds the Supabase ``destinations`` table in bulk:
+
+* generation batches run concurrently (bounded by --concurrency), each
+  asking for destinations on one continent and theme, and told which
+  names that continent already has so batches don't repeat each other;
+* rows are normalized and deduplicated on (name, country), including
+  against what is already in the table;
+* rows are upserted in chunks (--chunk-size) with ids derived from
+  (name, country), so writing the same row twice is harmless;
+* generated rows go to a spool file, and a checkpoint records how many
+  of them were written. An interrupted run picks up where it stopped
+  when started again with the same --count and --state-dir (use --fresh to
+  discard it).
+
+    python insert_destinations.py --count 10000 --concurrency 16
 """
 
+import argparse
+import asyncio
+import json
 import os
+import random
+import time
 import uuid
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
 from dotenv import load_dotenv
-from supabase import create_client
-from openai import OpenAI
-import json
+from openai import AsyncOpenAI
+
+from destination_catalog import CONTINENTS
+from llm_json import extract_json, salvage_objects
+from typeahead import normalize, split_label
 
 # Load env vars
 load_dotenv()
 
-# Setup clients
-supabase = create_client(
-    os.getenv("SUPABASE_URL"),
-    os.getenv("SUPABASE_KEY")
-)
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+STATE_DIR = Path(os.getenv("INGEST_STATE_DIR", Path(__file__).parent / "data" / "ingest"))
+MODEL = os.getenv("INGEST_MODEL", "gpt-4o")
+THEMES = [
+    "major cities",
+    "natural wonders",
+    "beaches and islands",
+    "cultural and historic sites",
+    "adventure and the outdoors",
+    "hidden gems and emerging destinations",
+    "food and wine regions",
+    "mountains and lakes",
+    "small towns and villages",
+    "national parks and wildlife",
+]
+EXCLUDE_LIMIT = 60  # names per continent sent as "do not repeat"
+MAX_EMPTY_BATCHES = 2  # a continent/theme that yields nothing new this often is retired
+MAX_FAILED_BATCHES = 20  # in a row, before giving up on generation
+# Fixed namespace so the same (name, country) always gets the same row id
+ID_NAMESPACE = uuid.UUID("6f1c8f1e-3c1a-4f7e-9a55-2f0d5b7c1d42")
+_CONTINENTS_BY_KEY = {normalize(continent): continent for continent in CONTINENTS}
+
 
 # 1️⃣ GPT prompt to create destinations
-def generate_destinations_via_gpt(num=5):
+async def generate_destinations_via_gpt(client: AsyncOpenAI, num: int, continent: str, theme: str, exclude: List[str]) -> List[dict]:
+    exclude_note = f"\nDo NOT include any of these, they already exist: {', '.join(exclude)}." if exclude else ""
     prompt = f"""
-Create {num} unique travel destinations around the world.
+Create {num} unique travel destinations in {continent}, focusing on {theme}.
 For each, return:
 - name
 - country
@@ -32,39 +74,311 @@ For each, return:
 - description (1-2 catchy sentences)
 - highlights (list of 3-5)
 - Unsplash-style image_url (fake if needed)
-
-Return ONLY valid JSON list.
+{exclude_note}
+Return ONLY valid JSON as {{"destinations": [...]}}.
 """
-    response = client.chat.completions.create(
-        model="gpt-4o",
+    response = await client.chat.completions.create(
+        model=MODEL,
         messages=[
             {"role": "system", "content": "You are a helpful travel data API that returns strict JSON."},
             {"role": "user", "content": prompt}
-        ]
+        ],
+        response_format={"type": "json_object"},
+        # Roughly 150 tokens per destination, so a batch is not cut off mid-array
+        max_tokens=min(4000, 150 * num + 200),
+        temperature=0.9,
     )
-    # Extract and parse JSON safely
-    text = response.choices[0].message.content.strip()
-    try:
-        data = json.loads(text)
-    except Exception as e:
-        print("❌ Failed to parse GPT response as JSON!")
-        print("Raw GPT output:\n", text)
-        raise e
-    return data
-
-# 2️⃣ Insert into Supabase
-def insert_destinations(destinations):
-    for dest in destinations:
-        dest["id"] = str(uuid.uuid4())
+    # Extract and parse JSON safely, keeping whole objects from a truncated reply
+    text = response.choices[0].message.content or ""
+    data = extract_json(text, expect="object")
+    if isinstance(data, dict) and isinstance(data.get("destinations"), list):
+        return [dest for dest in data["destinations"] if isinstance(dest, dict)]
+    return salvage_objects(text, required_key="name")
+
+
+def destination_key(name: str, country: str) -> Tuple[str, str]:
+    """Dedupe key: accent- and case-insensitive, and "Kyoto, Japan" equals "Kyoto" in Japan"""
+    label_name, label_country = split_label(name)
+    if label_country and normalize(label_country) == normalize(country):
+        name = label_name
+    return normalize(name), normalize(country)
+
+
+def normalize_destination(dest: dict, continent: str) -> Optional[dict]:
+    """A row with exactly the table's columns, or None if it lacks a name or country"""
+    name = str(dest.get("name") or "").strip()
+    country = str(dest.get("country") or "").strip()
+    if not name or not country:
+        return None
+    key = destination_key(name, country)
+    if not all(key):
+        return None
+    highlights = dest.get("highlights")
+    if isinstance(highlights, str):
+        highlights = [h.strip() for h in highlights.split(",")]
+    highlights = [str(h).strip() for h in highlights or [] if str(h).strip()][:5]
+    image_url = str(dest.get("image_url") or "").strip()
+    return {
+        "id": str(uuid.uuid5(ID_NAMESPACE, "|".join(key))),
+        "name": name,
+        "country": country,
+        "city": str(dest.get("city") or "").strip() or split_label(name)[0],
+        "continent": _CONTINENTS_BY_KEY.get(normalize(str(dest.get("continent") or "")), continent),
+        "description": str(dest.get("description") or "").strip(),
+        "highlights": highlights,
+        "image_url": image_url or f"https://images.unsplash.com/photo-{uuid.uuid4().hex[:8]}?w=800&h=600&fit=crop",
+    }
+
+
+class IngestState:
+    """Spool of generated rows plus a checkpoint of how many were written"""
+
+    def __init__(self, state_dir: Path):
+        self.state_dir = state_dir
+        self.spool_path = state_dir / "spool.jsonl"
+        self.checkpoint_path = state_dir / "checkpoint.json"
+        self.rows: List[dict] = []
+        self.written = 0
+        self.batches = 0
+        self.failed_batches = 0
+
+    def load(self) -> "IngestState":
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        if self.spool_path.exists():
+            with open(self.spool_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self.rows.append(json.loads(line))
+                    except ValueError:
+                        # A line cut off by a crash mid-write; the rows before it are intact
+                        break
+        if self.checkpoint_path.exists():
+            with open(self.checkpoint_path, encoding="utf-8") as f:
+                checkpoint = json.load(f)
+            self.written = min(checkpoint.get("written", 0), len(self.rows))
+            self.batches = checkpoint.get("batches", 0)
+            self.failed_batches = checkpoint.get("failed_batches", 0)
+        # Rewrite the spool so a torn last line does not stay in the file
+        self._rewrite_spool()
+        return self
+
+    def clear(self):
+        for path in (self.spool_path, self.checkpoint_path):
+            if path.exists():
+                path.unlink()
+
+    def append(self, rows: List[dict]):
+        with open(self.spool_path, "a", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self.rows.extend(rows)
+
+    def save(self):
+        tmp = self.checkpoint_path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({
+                "spooled": len(self.rows),
+                "written": self.written,
+                "batches": self.batches,
+                "failed_batches": self.failed_batches,
+                "updated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            }, f)
+        os.replace(tmp, self.checkpoint_path)
+
+    def _rewrite_spool(self):
+        tmp = self.spool_path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            for row in self.rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+        os.replace(tmp, self.spool_path)
+
+
+class IngestPipeline:
+    """Concurrent generation feeding a chunked upsert writer"""
+
+    def __init__(self, client: Optional[AsyncOpenAI], supabase, state: IngestState, count: int,
+                 concurrency: int, batch_size: int, chunk_size: int):
+        self.client = client
+        self.supabase = supabase
+        self.state = state
+        self.count = count
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self.seen: Set[Tuple[str, str]] = set()
+        self.names_by_continent: Dict[str, List[str]] = {continent: [] for continent in CONTINENTS}
+        self.empty_batches: Dict[Tuple[str, str], int] = {}
+        self.cells = [(continent, theme) for continent in CONTINENTS for theme in THEMES]
+        self.new_rows = 0
+        self.duplicates = 0
+        self.requested = 0  # destinations asked for by batches still in flight
+        self.failures_in_row = 0
+        self.writer_failed = False
+        self.queue: asyncio.Queue = asyncio.Queue()
+
+    @property
+    def remaining(self) -> int:
+        return self.count - self.new_rows
+
+    def _remember(self, row: dict):
+        self.seen.add(destination_key(row["name"], row["country"]))
+        self.names_by_continent.setdefault(row["continent"], []).append(row["name"])
+
+    async def run(self):
+        start = time.perf_counter()
+        if self.supabase:
+            await self._load_existing_keys()
+        for row in self.state.rows:
+            self._remember(row)
+        self.new_rows = len(self.state.rows)
+        pending = self.state.rows[self.state.written:]
+        if pending:
+            print(f"↩️  Resuming: {len(pending)} generated rows still to write")
+            self.queue.put_nowait(pending)
+
+        writer = asyncio.create_task(self._writer())
+        workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
         try:
-            result = supabase.table("destinations").insert(dest).execute()
-            print(f"✅ Inserted: {dest['name']}")
-        except Exception as e:
-            print(f"❌ Failed to insert {dest['name']}: {e}")
+            await asyncio.gather(*workers)
+        finally:
+            self.queue.put_nowait(None)
+            await writer
+            self.state.save()
+        elapsed = time.perf_counter() - start
+        print(f"\nDone! {self.new_rows} destinations generated, {self.state.written} written, "
+              f"{self.duplicates} duplicates skipped, {self.state.failed_batches} failed batches in {elapsed:.0f}s.\n")
+
+    async def _load_existing_keys(self):
+        page, offset = 1000, 0
+        while True:
+            result = await asyncio.to_thread(
+                self.supabase.table("destinations").select("name,country,continent").range(offset, offset + page - 1).execute
+            )
+            rows = result.data or []
+            for row in rows:
+                if row.get("name") and row.get("country"):
+                    self._remember({"name": row["name"], "country": row["country"], "continent": row.get("continent") or ""})
+            if len(rows) < page:
+                break
+            offset += page
+        print(f"📚 {len(self.seen)} destinations already in Supabase")
+
+    async def _worker(self):
+        backoff = 1.0
+        while self.remaining > 0 and self.cells:
+            if self.writer_failed:
+                return
+            if self.failures_in_row >= MAX_FAILED_BATCHES:
+                print("❌ Too many failed batches in a row, stopping generation")
+                return
+            if self.requested >= self.remaining:
+                # Batches in flight should cover what is left; wait to see what they bring
+                await asyncio.sleep(0.2)
+                continue
+            num = min(self.batch_size, max(5, self.remaining - self.requested))
+            continent, theme = random.choice(self.cells)
+            names = self.names_by_continent.get(continent, [])
+            exclude = random.sample(names, min(EXCLUDE_LIMIT, len(names)))
+            self.requested += num
+            try:
+                generated = await generate_destinations_via_gpt(self.client, num, continent, theme, exclude)
+            except Exception as e:
+                self.state.failed_batches += 1
+                self.failures_in_row += 1
+                print(f"❌ Batch for {continent} / {theme} failed: {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(30.0, backoff * 2)
+                continue
+            finally:
+                self.requested -= num
+            self.state.batches += 1
+            self.failures_in_row = 0
+            backoff = 1.0
+            fresh = []
+            for dest in generated:
+                row = normalize_destination(dest, continent)
+                if row is None:
+                    continue
+                if destination_key(row["name"], row["country"]) in self.seen:
+                    self.duplicates += 1
+                    continue
+                self._remember(row)
+                fresh.append(row)
+            fresh = fresh[:max(0, self.remaining)]
+            if not fresh:
+                # This continent/theme is running dry; stop spending batches on it
+                cell = (continent, theme)
+                self.empty_batches[cell] = self.empty_batches.get(cell, 0) + 1
+                if self.empty_batches[cell] >= MAX_EMPTY_BATCHES and cell in self.cells:
+                    self.cells.remove(cell)
+                continue
+            self.state.append(fresh)
+            self.new_rows += len(fresh)
+            self.queue.put_nowait(fresh)
+            print(f"✅ {continent} / {theme}: +{len(fresh)} ({self.new_rows}/{self.count})")
+
+    async def _writer(self):
+        buffer: List[dict] = []
+        done = False
+        while not done:
+            rows = await self.queue.get()
+            if rows is None:
+                done = True
+            else:
+                buffer.extend(rows)
+            while len(buffer) >= self.chunk_size or (done and buffer):
+                chunk, buffer = buffer[:self.chunk_size], buffer[self.chunk_size:]
+                await self._upsert(chunk)
+
+    async def _upsert(self, chunk: List[dict]):
+        if self.supabase:
+            for attempt in range(3):
+                try:
+                    await asyncio.to_thread(self.supabase.table("destinations").upsert(chunk).execute)
+                    break
+                except Exception as e:
+                    if attempt == 2:
+                        # Leave the checkpoint where it is; the next run retries these rows
+                        print(f"❌ Failed to upsert {len(chunk)} destinations: {e}")
+                        self.writer_failed = True
+                        raise
+                    await asyncio.sleep(2 ** attempt)
+        self.state.written += len(chunk)
+        self.state.save()
+        print(f"💾 Upserted {len(chunk)} destinations ({self.state.written} written)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate destinations with GPT and upsert them into Supabase")
+    parser.add_argument("--count", type=int, default=5, help="new destinations to add")
+    parser.add_argument("--concurrency", type=int, default=16, help="generation batches in flight")
+    parser.add_argument("--batch-size", type=int, default=20, help="destinations asked for per batch")
+    parser.add_argument("--chunk-size", type=int, default=500, help="rows per Supabase upsert")
+    parser.add_argument("--state-dir", type=Path, default=STATE_DIR, help="where the spool and checkpoint live")
+    parser.add_argument("--fresh", action="store_true", help="discard the spool and checkpoint of a previous run")
+    parser.add_argument("--dry-run", action="store_true", help="generate and spool, but do not write to Supabase")
+    args = parser.parse_args()
+
+    # Setup clients
+    supabase = None
+    if not args.dry_run:
+        from supabase import create_client
+        supabase = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
+    client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+    state = IngestState(args.state_dir)
+    if args.fresh:
+        state.clear()
+    state.load()
+    pipeline = IngestPipeline(
+        client, supabase, state,
+        count=args.count,
+        concurrency=max(1, args.concurrency),
+        batch_size=max(1, args.batch_size),
+        chunk_size=max(1, args.chunk_size),
+    )
+    asyncio.run(pipeline.run())
 
-    print(f"\nDone! Inserted {len(destinations)} destinations.\n")
 
 if __name__ == "__main__":
-    generated = generate_destinations_via_gpt(num=5)
-    print(json.dumps(generated, indent=2))  # See what GPT made
-    insert_destinations(generated)
+    main()
@@ -0,0 +1,299 @@
+"""
+Fan-out planner for long itineraries.
+
+A single completion cannot hold every day of a two-week or month-long trip
+within max_tokens. Long trips are therefore planned in two phases: a short
+skeleton call outlines each day, then blocks of days (and the trip-level
+sections) are generated by bounded parallel calls and merged back into one
+itinerary. Wall-clock time is roughly the skeleton call plus the slowest
+block, so it stays flat as the trip grows instead of growing with it.
+
+Shorter trips stay a single completion, which the streaming endpoint can
+send token by token. Up to PLANNER_MIN_DAYS that call gets TOKENS_PER_DAY
+per day plus room for the trip-level sections, which fits in the model's
+output cap; only beyond it does the extra skeleton round trip pay off.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+
+from llm_gateway import LLMGateway
+from llm_json import extract_json
+from llm_schemas import ResponseSchema
+
+logger = logging.getLogger(__name__)
+
+PLANNER_MIN_DAYS = int(os.getenv("ITINERARY_PLANNER_MIN_DAYS", "10"))
+DAYS_PER_BLOCK = int(os.getenv("ITINERARY_DAYS_PER_BLOCK", "3"))
+MAX_PARALLEL_CALLS = int(os.getenv("ITINERARY_MAX_PARALLEL_CALLS", "6"))
+MAX_TRIP_DAYS = 30
+TOKENS_PER_DAY = 350
+# Trip-level sections (overview, budget, tips, hotels, restaurants) of a one-call itinerary
+SECTIONS_TOKENS = 900
+# Output cap of the itinerary model (gpt-3.5-turbo)
+SINGLE_CALL_MAX_TOKENS = 4096
+
+_NUMBER_WORDS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10, "eleven": 11,
+    "twelve": 12, "fourteen": 14, "twenty": 20, "thirty": 30,
+}
+_UNIT_DAYS = {"day": 1, "night": 1, "week": 7, "fortnight": 14, "month": 30}
+# Values of the trip duration <select> on the planner pages
+_NAMED_DURATIONS = {"weekend": 3, "week": 7, "two-weeks": 14, "month": 30, "long-term": 30}
+_DURATION_RE = re.compile(
+    r"\b(\d+|" + "|".join(_NUMBER_WORDS) + r")\s*-?\s*(day|night|week|fortnight|month)s?\b",
+    re.IGNORECASE,
+)
+
+
+def parse_duration_days(duration) -> Optional[int]:
+    """Number of days in a duration such as 7, "10 days", "two-weeks" or "month"."""
+    if isinstance(duration, bool) or duration is None:
+        return None
+    if isinstance(duration, (int, float)):
+        days = int(duration)
+    else:
+        text = str(duration).strip().lower()
+        if text in _NAMED_DURATIONS:
+            days = _NAMED_DURATIONS[text]
+        elif text.isdigit():
+            days = int(text)
+        else:
+            match = _DURATION_RE.search(text.replace("-", " "))
+            if not match:
+                return None
+            count = match.group(1).lower()
+            days = (int(count) if count.isdigit() else _NUMBER_WORDS[count]) * _UNIT_DAYS[match.group(2).lower()]
+    if days <= 0:
+        return None
+    return min(days, MAX_TRIP_DAYS)
+
+
+def single_call_max_tokens(days: Optional[int]) -> int:
+    """max_tokens for an itinerary of ``days`` days generated in one completion"""
+    return min(SINGLE_CALL_MAX_TOKENS, SECTIONS_TOKENS + TOKENS_PER_DAY * (days or 7))
+
+
+@dataclass
+class ItineraryPlan:
+    """A trip to plan, described in the JSON shapes of the caller's response.
+
+    Each call's output is given either as a response schema, which is put in
+    the prompt as an outline, requested in JSON mode and validated, or as an
+    example JSON blob for formats that have no schema.
+    """
+    destination: str
+    days: int
+    details: str
+    fallback_day: Callable[[dict], dict]
+    day_example: dict = field(default_factory=dict)
+    overview_example: dict = field(default_factory=dict)
+    sections_example: dict = field(default_factory=dict)
+    # tripOverview-style keys plus an "outline" list of {day, theme, area}
+    skeleton_schema: Optional[ResponseSchema] = None
+    # a "days" list
+    days_schema: Optional[ResponseSchema] = None
+    sections_schema: Optional[ResponseSchema] = None
+    model: str = "gpt-3.5-turbo"
+    system_prompt: str = "You are a travel expert. Generate detailed itineraries in JSON format."
+
+
+def _format_text(schema: Optional[ResponseSchema], example: dict) -> str:
+    if schema is not None:
+        return schema.instructions()
+    return f"Return only JSON in this format:\n\n{json.dumps(example, indent=2)}"
+
+
+def _parse(schema: Optional[ResponseSchema], content: str) -> dict:
+    """Completion as a dict, validated against ``schema`` when there is one; {} when unusable"""
+    if schema is not None:
+        value = schema.parse(content)
+        return schema.dump(value) if value is not None else {}
+    data = extract_json(content, expect="object")
+    return data if isinstance(data, dict) else {}
+
+
+class ItineraryPlanner:
+    """Plan long trips as a skeleton plus day blocks generated in parallel"""
+
+    def __init__(
+        self,
+        gateway: LLMGateway,
+        days_per_block: int = DAYS_PER_BLOCK,
+        max_parallel_calls: int = MAX_PARALLEL_CALLS,
+    ):
+        self.gateway = gateway
+        self.days_per_block = max(1, days_per_block)
+        self.max_parallel_calls = max(1, max_parallel_calls)
+
+    async def plan(self, plan: ItineraryPlan, cache_namespace: Optional[str] = None) -> Tuple[dict, List[dict]]:
+        """Return the trip-level sections and the full list of days"""
+        sections = {}
+        days = []
+        async for kind, payload in self.iter_plan(plan, cache_namespace):
+            if kind == "days":
+                days.extend(payload)
+            else:
+                sections.update(payload)
+        return sections, days
+
+    async def iter_plan(self, plan: ItineraryPlan, cache_namespace: Optional[str] = None) -> AsyncIterator[Tuple[str, object]]:
+        """Yield ("sections", dict) and ("days", list) results as they complete.
+
+        Day blocks are yielded in trip order. Failures of the skeleton call
+        propagate; a failed block or sections call falls back to outline-based
+        days or is skipped, so one slow or broken call never sinks the trip.
+        """
+        overview, outline = await self._skeleton(plan, cache_namespace)
+        if overview:
+            yield "sections", overview
+
+        semaphore = asyncio.Semaphore(self.max_parallel_calls)
+
+        async def bounded(coro):
+            async with semaphore:
+                return await coro
+
+        sections_task = None
+        if plan.sections_schema or plan.sections_example:
+            sections_task = asyncio.ensure_future(bounded(self._sections(plan, outline, cache_namespace)))
+        blocks = [outline[i:i + self.days_per_block] for i in range(0, len(outline), self.days_per_block)]
+        block_tasks = [
+            asyncio.ensure_future(bounded(self._day_block(plan, outline, block, cache_namespace)))
+            for block in blocks
+        ]
+        logger.info(f"Planning {plan.days}-day trip to {plan.destination} in {len(blocks)} parallel blocks")
+        try:
+            for task in block_tasks:
+                yield "days", await task
+            if sections_task:
+                sections = await sections_task
+                if sections:
+                    yield "sections", sections
+        finally:
+            # The consumer may stop early, e.g. when a streaming client disconnects
+            for task in block_tasks + ([sections_task] if sections_task else []):
+                task.cancel()
+
+    async def _skeleton(self, plan: ItineraryPlan, cache_namespace: Optional[str]) -> Tuple[dict, List[dict]]:
+        example = {
+            **plan.overview_example,
+            "outline": [{"day": 1, "theme": "Short theme for the day", "area": "Neighbourhood or nearby town"}],
+        }
+        prompt = f"""Outline a {plan.days}-day trip to {plan.destination}. {plan.details}
+
+{_format_text(plan.skeleton_schema, example)}
+
+The outline must have exactly {plan.days} entries, one per day, in order, with a distinct theme for each day."""
+        result = await self.gateway.complete(
+            model=plan.model,
+            messages=[
+                {"role": "system", "content": plan.system_prompt},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=300 + 40 * plan.days,
+            temperature=0.7,
+            timeout=30,
+            cache_namespace=cache_namespace,
+            response_format=plan.skeleton_schema.response_format if plan.skeleton_schema else None,
+            validate=lambda content: bool(_parse(plan.skeleton_schema, content))
+        )
+        data = _parse(plan.skeleton_schema, result.content)
+        raw_outline = data.pop("outline", None)
+        raw_outline = raw_outline if isinstance(raw_outline, list) else []
+
+        outline = []
+        for day in range(1, plan.days + 1):
+            entry = raw_outline[day - 1] if day <= len(raw_outline) and isinstance(raw_outline[day - 1], dict) else {}
+            outline.append({
+                "day": day,
+                "theme": str(entry.get("theme") or f"Exploring {plan.destination}"),
+                "area": str(entry.get("area") or plan.destination),
+            })
+        overview = data if plan.skeleton_schema else {key: data[key] for key in plan.overview_example if key in data}
+        return overview, outline
+
+    async def _day_block(self, plan: ItineraryPlan, outline: List[dict], block: List[dict], cache_namespace: Optional[str]) -> List[dict]:
+        first, last = block[0]["day"], block[-1]["day"]
+        prompt = f"""{plan.days}-day trip to {plan.destination}. {plan.details}
+
+Outline of the whole trip:
+{self._outline_text(outline)}
+
+Write days {first} to {last} in full, following the outline, with exactly {len(block)} entries in "days".
+
+{_format_text(plan.days_schema, {"days": [plan.day_example]})}"""
+        try:
+            result = await self.gateway.complete(
+                model=plan.model,
+                messages=[
+                    {"role": "system", "content": plan.system_prompt},
+                    {"role": "user", "content": prompt}
+                ],
+                max_tokens=TOKENS_PER_DAY * len(block) + 100,
+                temperature=0.7,
+                timeout=60,
+                cache_namespace=cache_namespace,
+                response_format=plan.days_schema.response_format if plan.days_schema else None,
+                validate=lambda content: bool(_parse(plan.days_schema, content))
+            )
+            generated = _parse(plan.days_schema, result.content).get("days")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Itinerary block days {first}-{last} failed: {e}")
+            generated = None
+
+        generated = [day for day in generated if isinstance(day, dict)] if isinstance(generated, list) else []
+        days = []
+        for index, entry in enumerate(block):
+            day = generated[index] if index < len(generated) else plan.fallback_day(entry)
+            if plan.days_schema or "day" in plan.day_example:
+                day["day"] = entry["day"]
+            days.append(day)
+        if len(generated) < len(block):
+            logger.warning(f"Itinerary block days {first}-{last} returned {len(generated)} of {len(block)} days")
+        return days
+
+    async def _sections(self, plan: ItineraryPlan, outline: List[dict], cache_namespace: Optional[str]) -> dict:
+        prompt = f"""{plan.days}-day trip to {plan.destination}. {plan.details}
+
+Outline of the whole trip:
+{self._outline_text(outline)}
+
+Write the trip-level sections covering all {plan.days} days.
+
+{_format_text(plan.sections_schema, plan.sections_example)}"""
+        try:
+            result = await self.gateway.complete(
+                model=plan.model,
+                messages=[
+                    {"role": "system", "content": plan.system_prompt},
+                    {"role": "user", "content": prompt}
+                ],
+                max_tokens=1500,
+                temperature=0.7,
+                timeout=60,
+                cache_namespace=cache_namespace,
+                response_format=plan.sections_schema.response_format if plan.sections_schema else None,
+                validate=lambda content: bool(_parse(plan.sections_schema, content))
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Itinerary sections for {plan.destination} failed: {e}")
+            return {}
+        data = _parse(plan.sections_schema, result.content)
+        if plan.sections_schema:
+            return data
+        return {key: data[key] for key in plan.sections_example if key in data}
+
+    @staticmethod
+    def _outline_text(outline: List[dict]) -> str:
+        return "\n".join(f"Day {entry['day']}: {entry['theme']} ({entry['area']})" for entry in outline)
@@ -0,0 +1,220 @@
+"""
+Two-tier cache for LLM responses.
+
+Entries live in an in-process LRU and in an on-disk SQLite store so repeated
+prompts are answered without calling OpenAI, even after a worker restart.
+An entry that turns out to be unusable can be dropped from both with delete().
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize_text(text) -> str:
+    return " ".join(str(text).split()) if text is not None else ""
+
+
+def make_cache_key(
+    model: str,
+    messages: List[dict],
+    temperature: float,
+    max_tokens: Optional[int],
+    response_format: Optional[dict] = None,
+) -> str:
+    """Build a stable key from the normalized completion parameters"""
+    normalized = {
+        "model": (model or "").strip().lower(),
+        "messages": [
+            {"role": m.get("role", ""), "content": _normalize_text(m.get("content"))}
+            for m in messages
+        ],
+        "temperature": round(float(temperature), 3),
+        "max_tokens": int(max_tokens) if max_tokens is not None else None,
+    }
+    if response_format is not None:
+        # JSON-mode and free-text answers to the same messages differ; only added when set
+        # so keys of plain completions cached before this stay valid
+        normalized["response_format"] = response_format
+    payload = json.dumps(normalized, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """In-process LRU in front of a size-bounded SQLite store, with per-namespace TTLs"""
+
+    def __init__(
+        self,
+        path: str,
+        ttls: Optional[Dict[str, float]] = None,
+        max_memory_entries: int = 512,
+        max_disk_entries: int = 10000,
+    ):
+        self.path = path
+        self.ttls = dict(ttls or {})
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._counters = defaultdict(lambda: {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "deletes": 0})
+        self._evictions = {"memory": 0, "disk": 0}
+        self._db: Optional[sqlite3.Connection] = None
+        try:
+            self._db = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache(last_access)")
+            self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"LLM cache disk store unavailable, using memory only: {e}")
+            self._db = None
+
+    def ttl_for(self, namespace: Optional[str]) -> float:
+        return float(self.ttls.get(namespace, 0)) if namespace else 0.0
+
+    async def get(self, key: str, namespace: str = "default") -> Optional[dict]:
+        """Return a cached value, checking memory first and then disk"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._counters[namespace]["memory_hits"] += 1
+                    return value
+                del self._memory[key]
+
+        value = await asyncio.to_thread(self._disk_get, key, now) if self._db else None
+        with self._lock:
+            if value is None:
+                self._counters[namespace]["misses"] += 1
+                return None
+            self._counters[namespace]["disk_hits"] += 1
+            self._remember(key, value[0], value[1])
+        return value[1]
+
+    async def set(self, key: str, value: dict, namespace: str = "default", ttl: Optional[float] = None):
+        """Store a value in both tiers"""
+        ttl = self.ttl_for(namespace) if ttl is None else ttl
+        if ttl <= 0:
+            return
+        expires_at = time.time() + ttl
+        with self._lock:
+            self._remember(key, expires_at, value)
+            self._counters[namespace]["writes"] += 1
+        if self._db:
+            await asyncio.to_thread(self._disk_set, key, value, expires_at)
+
+    async def delete(self, key: str, namespace: str = "default"):
+        """Drop a value from both tiers, e.g. a completion its caller could not use"""
+        with self._lock:
+            self._memory.pop(key, None)
+            self._counters[namespace]["deletes"] += 1
+        if self._db:
+            await asyncio.to_thread(self._disk_delete, key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            namespaces = {name: dict(counts) for name, counts in self._counters.items()}
+            memory_entries = len(self._memory)
+        totals = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "deletes": 0}
+        for counts in namespaces.values():
+            for name in totals:
+                totals[name] += counts[name]
+        lookups = totals["memory_hits"] + totals["disk_hits"] + totals["misses"]
+        return {
+            **totals,
+            "hit_rate": round((totals["memory_hits"] + totals["disk_hits"]) / lookups, 4) if lookups else 0.0,
+            "memory_entries": memory_entries,
+            "disk_entries": self._disk_count(),
+            "evictions": dict(self._evictions),
+            "namespaces": namespaces,
+            "ttls": dict(self.ttls),
+        }
+
+    def _remember(self, key: str, expires_at: float, value: dict):
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self._evictions["memory"] += 1
+
+    def _disk_get(self, key: str, now: float):
+        try:
+            with self._db_lock:
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                if row[1] <= now:
+                    self._db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                    self._db.commit()
+                    return None
+                self._db.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+                self._db.commit()
+            return row[1], json.loads(row[0])
+        except (sqlite3.Error, ValueError) as e:
+            logger.warning(f"LLM cache disk read failed: {e}")
+            return None
+
+    def _disk_set(self, key: str, value: dict, expires_at: float):
+        try:
+            with self._db_lock:
+                now = time.time()
+                self._db.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value), expires_at, now),
+                )
+                count = self._db.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+                if count > self.max_disk_entries:
+                    self._db.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,))
+                    count = self._db.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+                    excess = count - self.max_disk_entries
+                    if excess > 0:
+                        self._db.execute(
+                            "DELETE FROM llm_cache WHERE key IN "
+                            "(SELECT key FROM llm_cache ORDER BY last_access ASC LIMIT ?)",
+                            (excess,),
+                        )
+                        self._evictions["disk"] += excess
+                self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"LLM cache disk write failed: {e}")
+
+    def _disk_delete(self, key: str):
+        try:
+            with self._db_lock:
+                self._db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"LLM cache disk delete failed: {e}")
+
+    def _disk_count(self) -> int:
+        if not self._db:
+            return 0
+        try:
+            with self._db_lock:
+                return self._db.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        except sqlite3.Error:
+            return 0
+
+    def close(self):
+        if self._db:
+            with self._db_lock:
+                self._db.close()
+            self._db = None
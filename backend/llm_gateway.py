@@ -0,0 +1,264 @@
+"""
+Shared async gateway for OpenAI chat completions.
+
+All LLM-backed endpoints go through a single AsyncOpenAI client so that
+requests share one pooled HTTP connection set and never block the event loop.
+"""
+
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, List, Optional
+
+import httpx
+from openai import AsyncOpenAI, BadRequestError, RateLimitError, UnprocessableEntityError
+
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from llm_cache import LLMCache, make_cache_key
+from model_router import LatencyTracker
+from singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Rejected prompts are the caller's problem and a 429 is the provider pacing us; neither
+# is a sign that OpenAI is down
+NOT_OUTAGES = (BadRequestError, UnprocessableEntityError, RateLimitError)
+
+DEFAULT_TIMEOUT_SECONDS = float(os.getenv("OPENAI_TIMEOUT_SECONDS", "60"))
+MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "20"))
+
+
+@dataclass
+class LLMResult:
+    """Text returned by a chat completion plus the model that produced it"""
+    content: str
+    model: str
+    latency_ms: float
+    cached: bool = False
+    finish_reason: Optional[str] = None
+
+
+class LLMGateway:
+    """Async OpenAI chat-completion client with pooled connections and per-call timeouts"""
+
+    def __init__(
+        self,
+        api_key: Optional[str],
+        cache: Optional[LLMCache] = None,
+        latency_tracker: Optional[LatencyTracker] = None,
+        default_timeout: float = DEFAULT_TIMEOUT_SECONDS,
+        max_connections: int = MAX_CONNECTIONS,
+        max_keepalive_connections: int = MAX_KEEPALIVE_CONNECTIONS,
+    ):
+        self.default_timeout = default_timeout
+        self.cache = cache
+        self.latency_tracker = latency_tracker
+        self.singleflight = SingleFlight()
+        self.breaker = CircuitBreaker("openai", is_failure=lambda e: not isinstance(e, NOT_OUTAGES))
+        # Image generation has its own limits and failure modes, so it must not open the chat breaker
+        self.image_breaker = CircuitBreaker("openai-images", is_failure=lambda e: not isinstance(e, NOT_OUTAGES))
+        self._http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+            ),
+            timeout=httpx.Timeout(default_timeout, connect=10.0),
+        )
+        self.client = AsyncOpenAI(
+            api_key=api_key,
+            http_client=self._http_client,
+            timeout=default_timeout,
+            max_retries=1,
+        )
+
+    @property
+    def api_key(self) -> Optional[str]:
+        return self.client.api_key
+
+    async def complete(
+        self,
+        messages: List[dict],
+        model: str = "gpt-3.5-turbo",
+        max_tokens: Optional[int] = None,
+        temperature: float = 0.7,
+        timeout: Optional[float] = None,
+        cache_namespace: Optional[str] = None,
+        response_format: Optional[dict] = None,
+        validate: Optional[Callable[[str], bool]] = None,
+    ) -> LLMResult:
+        """Run a chat completion and return its text content.
+
+        ``response_format`` (e.g. {"type": "json_object"}) is passed through
+        to constrain the output. When ``cache_namespace`` has a TTL configured
+        on the cache, identical requests are answered from the cache instead
+        of calling OpenAI. Concurrent identical requests share a single
+        upstream call. Raises CircuitOpenError without calling OpenAI while
+        its breaker is open. The cache and in-flight key covers every
+        parameter that shapes the answer, ``response_format`` included.
+
+        Only usable answers are cached: not ones cut off at ``max_tokens``,
+        and not ones ``validate(content)`` rejects (e.g. a reply the caller
+        cannot parse). A cached answer ``validate`` rejects is dropped and
+        requested again.
+        """
+        key = make_cache_key(model, messages, temperature, max_tokens, response_format)
+        use_cache = bool(self.cache) and self.cache.ttl_for(cache_namespace) > 0
+        if use_cache:
+            cached = await self._cached(key, cache_namespace, validate)
+            if cached is not None:
+                return LLMResult(content=cached["content"], model=cached["model"], latency_ms=0.0, cached=True)
+
+        params = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "timeout": timeout or self.default_timeout,
+        }
+        if max_tokens is not None:
+            params["max_tokens"] = max_tokens
+        if response_format is not None:
+            params["response_format"] = response_format
+
+        async def call_upstream() -> LLMResult:
+            start = time.perf_counter()
+            try:
+                response = await self.breaker.call(lambda: self.client.chat.completions.create(**params))
+            except CircuitOpenError:
+                raise
+            except Exception:
+                # A timeout or error after a long wait is still a tail-latency sample for this model
+                self._record_latency(model, (time.perf_counter() - start) * 1000)
+                raise
+            latency_ms = (time.perf_counter() - start) * 1000
+            self._record_latency(model, latency_ms)
+
+            content = response.choices[0].message.content or ""
+            finish_reason = response.choices[0].finish_reason
+            served_by = response.model or model
+            logger.info(f"LLM completion from {served_by} in {latency_ms:.0f} ms")
+            if use_cache and self._cacheable(content, finish_reason, validate, cache_namespace):
+                await self.cache.set(key, {"content": content, "model": served_by}, cache_namespace)
+            return LLMResult(content=content, model=served_by, latency_ms=latency_ms, finish_reason=finish_reason)
+
+        return await self.singleflight.do(key, call_upstream)
+
+    async def stream(
+        self,
+        messages: List[dict],
+        model: str = "gpt-3.5-turbo",
+        max_tokens: Optional[int] = None,
+        temperature: float = 0.7,
+        timeout: Optional[float] = None,
+        cache_namespace: Optional[str] = None,
+        response_format: Optional[dict] = None,
+        validate: Optional[Callable[[str], bool]] = None,
+    ) -> AsyncIterator[str]:
+        """Yield completion text as it is generated.
+
+        A cached completion is yielded in one piece; a freshly streamed one is
+        written to the cache once the stream finishes, under the same rules
+        as ``complete``.
+        """
+        key = make_cache_key(model, messages, temperature, max_tokens, response_format)
+        use_cache = bool(self.cache) and self.cache.ttl_for(cache_namespace) > 0
+        if use_cache:
+            cached = await self._cached(key, cache_namespace, validate)
+            if cached is not None:
+                yield cached["content"]
+                return
+
+        params = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "timeout": timeout or self.default_timeout,
+            "stream": True,
+        }
+        if max_tokens is not None:
+            params["max_tokens"] = max_tokens
+        if response_format is not None:
+            params["response_format"] = response_format
+
+        start = time.perf_counter()
+        served_by = model
+        finish_reason = None
+        parts = []
+        self.breaker.before_call()
+        try:
+            response = await self.client.chat.completions.create(**params)
+            async for chunk in response:
+                served_by = chunk.model or served_by
+                if not chunk.choices:
+                    continue
+                finish_reason = chunk.choices[0].finish_reason or finish_reason
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        except Exception as e:
+            self.breaker.record_failure(e)
+            raise
+        except BaseException:
+            # Cancelled or closed by the consumer: no verdict on OpenAI's health
+            self.breaker.release()
+            raise
+        self.breaker.record_success()
+
+        content = "".join(parts)
+        logger.info(f"LLM stream from {served_by} finished in {(time.perf_counter() - start) * 1000:.0f} ms")
+        if use_cache and self._cacheable(content, finish_reason, validate, cache_namespace):
+            await self.cache.set(key, {"content": content, "model": served_by}, cache_namespace)
+
+    async def _cached(self, key: str, namespace: Optional[str], validate: Optional[Callable[[str], bool]]) -> Optional[dict]:
+        cached = await self.cache.get(key, namespace)
+        if cached is not None and validate is not None and not validate(cached["content"]):
+            # Written before the caller validated, or by a caller with looser rules
+            await self.cache.delete(key, namespace)
+            return None
+        return cached
+
+    @staticmethod
+    def _cacheable(content: str, finish_reason: Optional[str], validate: Optional[Callable[[str], bool]], namespace: Optional[str]) -> bool:
+        if not content.strip():
+            return False
+        if finish_reason == "length":
+            logger.warning(f"Not caching {namespace} completion cut off at max_tokens")
+            return False
+        if validate is not None and not validate(content):
+            logger.warning(f"Not caching {namespace} completion that failed validation")
+            return False
+        return True
+
+    async def generate_image(
+        self,
+        prompt: str,
+        model: str = "dall-e-3",
+        size: str = "1024x1024",
+        quality: str = "standard",
+        n: int = 1,
+        timeout: Optional[float] = None,
+    ) -> List[str]:
+        """Generate images with DALL-E and return their URLs; guarded by ``image_breaker``"""
+        start = time.perf_counter()
+        response = await self.image_breaker.call(lambda: self.client.images.generate(
+            model=model,
+            prompt=prompt,
+            size=size,
+            quality=quality,
+            n=n,
+            timeout=timeout or self.default_timeout,
+        ))
+        urls = [image.url for image in (response.data or []) if image.url]
+        logger.info(f"{model} returned {len(urls)} images in {(time.perf_counter() - start) * 1000:.0f} ms")
+        return urls
+
+    def _record_latency(self, model: str, latency_ms: float):
+        if self.latency_tracker:
+            self.latency_tracker.record(model, latency_ms)
+
+    async def aclose(self):
+        await self.client.close()
+        if self.cache:
+            self.cache.close()
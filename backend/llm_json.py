@@ -0,0 +1,478 @@
+"""
+JSON extraction for LLM output.
+
+Model completions wrap JSON in markdown fences, leave trailing commas, and get
+cut off at max_tokens. Everything here works from one tokenizer that only
+stops on structural characters (strings are skipped in C by the regex), so a
+completion is scanned once, without the repeated copies a chain of
+``re.sub`` repair passes makes.
+"""
+
+import json
+import logging
+import re
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# A string literal up to, but not including, its closing quote
+_STRING = r'"[^"\\]*(?:\\.[^"\\]*)*'
+
+# A complete or unterminated string literal, or a single structural character.
+# Group 1 is set only when the string has its closing quote.
+_TOKEN_RE = re.compile(_STRING + r'(?:(")|\\?\Z)|[{}\[\],:]', re.DOTALL)
+
+# Extractor scan: only brackets and commas that need repair (followed by
+# nothing but whitespace and then ``,``, a closing bracket, or the end of the
+# text) are interesting. The fast form finds them with a plain character
+# search and decides whether each hit is inside a string by counting quotes
+# since the previous hit. The exact form skips strings in the regex itself and
+# is used when the text has an escaped backslash before a quote, where quote
+# counting breaks down. Exact groups: 1 bracket, 2 comma, 3 unterminated string.
+_FAST_SCAN_RE = re.compile(r'[,{}\[\]](?:(?<!,)|(?=\s*(?:[,}\]]|\Z)))')
+# Possessive ``\s*+`` (Python 3.11+) keeps the search from backtracking at every comma
+_STRAY_COMMA_RE = re.compile(r',\s*+[,}\]]')
+_EXACT_SCAN_RE = re.compile(
+    r'(?:[^"{}\[\],]+|' + _STRING + r'"|,(?!\s*(?:[,}\]]|\Z)))*'
+    r'(?:([{}\[\]])|(,)|(' + _STRING + r'\\?\Z)|\Z)',
+    re.DOTALL,
+)
+_SPACE_RE = re.compile(r"\s*")
+_CLOSERS = {"{": "}", "[": "]"}
+_OPENERS = {"object": "{", "array": "["}
+
+
+def _blank(text: str, start: int, end: int) -> bool:
+    """True if text[start:end] is only whitespace, without slicing it"""
+    return _SPACE_RE.match(text, start, end).end() >= end
+
+
+def _in_string(text: str, start: int, end: int) -> bool:
+    """Whether an odd number of unescaped quotes lies in text[start:end]"""
+    return bool((text.count('"', start, end) - text.count('\\"', start, end)) & 1)
+
+
+def _drop_stray_commas(text: str, start: int, end: int) -> Optional[str]:
+    """text[start:end] without trailing or doubled commas.
+
+    Returns None when the text has an escaped backslash before a quote, where
+    counting quotes cannot tell whether a comma sits inside a string.
+    """
+    if '\\\\"' in text:
+        return None
+    pieces = []
+    cursor = last = start
+    in_string = False
+    for match in _STRAY_COMMA_RE.finditer(text, start, end):
+        comma = match.start()
+        in_string ^= _in_string(text, last, comma)
+        last = comma
+        if not in_string:
+            pieces.append(text[cursor:comma])
+            cursor = comma + 1
+    if not pieces:
+        return None
+    pieces.append(text[cursor:end])
+    return "".join(pieces)
+
+
+def _find_start(text: str, expect: Optional[str], start: int = 0) -> int:
+    if expect:
+        return text.find(_OPENERS[expect], start)
+    positions = [p for p in (text.find("{", start), text.find("[", start)) if p >= 0]
+    return min(positions) if positions else -1
+
+
+class JSONExtractor:
+    """Single-pass, bracket-aware JSON scanner that accepts text in chunks.
+
+    While scanning it drops trailing and doubled commas, remembers where the
+    last container closed so truncated output can be cut and closed cleanly,
+    and records the spans of complete objects in the shallowest array so they
+    can be salvaged.
+    """
+
+    def __init__(self, expect: Optional[str] = None):
+        self.expect = expect
+        self.text = ""
+        self.start = -1
+        self.end = -1
+        self._reset()
+
+    def _reset(self, exact: bool = False):
+        self._exact = exact
+        self._pos = max(self.start, 0)
+        self._last = self._pos
+        self._in_string = False
+        self._stack: List[str] = []
+        self._open_positions: List[int] = []
+        self._drops: List[int] = []
+        self._safe_end = -1
+        self._safe_stack = ""
+        self._elements: List[Tuple[int, int]] = []
+        self._element_depth = 0
+
+    @property
+    def complete(self) -> bool:
+        return self.end >= 0
+
+    def feed(self, chunk: str) -> "JSONExtractor":
+        checked = max(len(self.text) - 2, 0)
+        self.text += chunk
+        if self.complete:
+            return self
+        if self.start < 0:
+            self.start = _find_start(self.text, self.expect, self._pos)
+            if self.start < 0:
+                self._pos = len(self.text)
+                return self
+            self._pos = self._last = self.start
+            checked = self.start
+        if not self._exact and '\\\\"' in self.text[checked:]:
+            self._reset(exact=True)
+        if self._exact:
+            self._scan_exact()
+        else:
+            self._scan_fast()
+        return self
+
+    def _scan_fast(self):
+        text = self.text
+        last = self._last
+        in_string = self._in_string
+        for match in _FAST_SCAN_RE.finditer(text, self._pos):
+            i = match.start()
+            in_string ^= _in_string(text, last, i)
+            last = i
+            if in_string:
+                continue
+            ch = text[i]
+            if ch == ",":
+                if not self._comma(i):
+                    break
+            elif self._bracket(ch, i):
+                i += 1
+                break
+        else:
+            i = len(text)
+        # Quotes after ``last`` are counted again on the next chunk
+        self._pos = i
+        self._last = last
+        self._in_string = in_string
+
+    def _scan_exact(self):
+        text = self.text
+        pos = self._pos
+        for match in _EXACT_SCAN_RE.finditer(text, pos):
+            ch = match.group(1)
+            if ch is not None:
+                pos = match.start(1)
+                if self._bracket(ch, pos):
+                    pos += 1
+                    break
+            elif match.group(2) is not None:
+                pos = match.start(2)
+                if not self._comma(pos):
+                    break
+            else:
+                # End of the text, or an unterminated string to finish on the next chunk
+                pos = match.start(3) if match.group(3) is not None else match.end()
+                break
+            pos = match.end()
+        self._pos = pos
+
+    def _comma(self, i: int) -> bool:
+        """Drop a trailing or doubled comma; False if more text is needed to tell"""
+        if _blank(self.text, i + 1, len(self.text)):
+            return False
+        self._drops.append(i)
+        return True
+
+    def _bracket(self, ch: str, i: int) -> bool:
+        """Track one bracket; True once the top-level value has closed"""
+        stack = self._stack
+        if ch == "{" or ch == "[":
+            stack.append(ch)
+            self._open_positions.append(i)
+            return False
+        if not stack:
+            return False
+        stack.pop()
+        opened_at = self._open_positions.pop()
+        if not stack:
+            self.end = i + 1
+            return True
+        if ch == "}" and stack[-1] == "[":
+            depth = len(stack)
+            if not self._elements or depth < self._element_depth:
+                self._elements = [(opened_at, i + 1)]
+                self._element_depth = depth
+            elif depth == self._element_depth:
+                self._elements.append((opened_at, i + 1))
+        self._safe_end = i + 1
+        self._safe_stack = "".join(stack)
+        return False
+
+    def _truncation_point(self) -> Tuple[int, str]:
+        """Where to cut a truncated document, and the brackets left open there.
+
+        Only the tail after the last closed container is tokenized in full:
+        the cut goes before its last comma, or right after that container.
+        """
+        end, open_brackets = self._safe_end, self._safe_stack
+        if end > 0:
+            cursor, stack = end, list(self._safe_stack)
+        else:
+            cursor, stack = self.start, []
+        for match in _TOKEN_RE.finditer(self.text, cursor):
+            ch = self.text[match.start()]
+            if ch == '"':
+                if match.group(1) is None:
+                    break
+            elif ch == "{" or ch == "[":
+                stack.append(ch)
+            elif ch == "," and stack and match.start() not in self._drops:
+                end, open_brackets = match.start(), "".join(stack)
+        return end, open_brackets
+
+    def _render(self, end: int) -> str:
+        """Source text from the first bracket to ``end`` with dropped commas removed"""
+        drops = [d for d in self._drops if d < end]
+        if not drops:
+            return self.text[self.start:end]
+        pieces = []
+        cursor = self.start
+        for d in drops:
+            pieces.append(self.text[cursor:d])
+            cursor = d + 1
+        pieces.append(self.text[cursor:end])
+        return "".join(pieces)
+
+    def result(self) -> Optional[Any]:
+        """Parsed document, closing truncated output at its last clean point"""
+        if self.start < 0:
+            return None
+        if self.complete:
+            try:
+                return json.loads(self._render(self.end))
+            except json.JSONDecodeError as e:
+                logger.debug(f"Repaired JSON still invalid: {e}")
+                return None
+        end, open_brackets = self._truncation_point()
+        if end > self.start:
+            closers = "".join(_CLOSERS[c] for c in reversed(open_brackets))
+            try:
+                return json.loads(self._render(end) + closers)
+            except json.JSONDecodeError as e:
+                logger.debug(f"Could not close truncated JSON: {e}")
+        return None
+
+    def salvage(self, required_key: Optional[str] = None) -> List[dict]:
+        """Complete objects from the shallowest array, even if the document is broken"""
+        objects = []
+        for start, end in self._elements:
+            raw = self.text[start:end]
+            try:
+                value = json.loads(raw)
+            except json.JSONDecodeError:
+                value = _repair_span(raw)
+            if isinstance(value, dict) and (required_key is None or required_key in value):
+                objects.append(value)
+        return objects
+
+
+def _repair_span(raw: str) -> Optional[Any]:
+    extractor = JSONExtractor().feed(raw)
+    return extractor.result() if extractor.complete else None
+
+
+def extract_json(text: Optional[str], expect: Optional[str] = None) -> Optional[Any]:
+    """Parse the JSON object or array embedded in an LLM completion.
+
+    ``expect`` is "object", "array" or None for whichever comes first. Returns
+    None when nothing parseable is found.
+    """
+    if not text:
+        return None
+    start = _find_start(text, expect)
+    if start < 0:
+        return None
+    closer = _CLOSERS[text[start]]
+    end = text.rfind(closer) + 1
+    if end > start:
+        try:
+            return json.loads(text[start:end])
+        except json.JSONDecodeError:
+            pass
+        # Stray commas are by far the most common defect; try dropping just those
+        repaired = _drop_stray_commas(text, start, end)
+        if repaired is not None:
+            try:
+                return json.loads(repaired)
+            except json.JSONDecodeError:
+                pass
+    # Truncated or otherwise broken: run the full bracket scan
+    return JSONExtractor(expect).feed(text).result()
+
+
+def has_json(expect: str) -> Callable[[Optional[str]], bool]:
+    """Completion check (e.g. for LLMGateway ``validate``): whether a JSON ``expect`` can be extracted"""
+    kind = dict if expect == "object" else list
+    return lambda text: isinstance(extract_json(text, expect=expect), kind)
+
+
+def salvage_objects(text: Optional[str], required_key: Optional[str] = None, expect: Optional[str] = None) -> List[dict]:
+    """Recover every complete object from a malformed or truncated JSON array"""
+    if not text:
+        return []
+    return JSONExtractor(expect).feed(text).salvage(required_key)
+
+
+def loads_lenient(raw: str) -> Any:
+    """json.loads with the extractor's repairs as a fallback"""
+    try:
+        return json.loads(raw)
+    except json.JSONDecodeError:
+        value = extract_json(raw)
+        if value is None:
+            raise
+        return value
+
+
+class JSONSectionStream:
+    """Emit top-level sections of a streamed JSON object as soon as each one is complete.
+
+    Feed raw completion text chunk by chunk. ``feed`` returns ``(key, value)``
+    pairs for every top-level member that finished in that chunk. Arrays named
+    in ``split_arrays`` are emitted element by element instead, as
+    ``(key, element)`` pairs. Text before the first ``{`` (for example a
+    markdown fence) is ignored.
+    """
+
+    def __init__(self, split_arrays: Iterable[str] = ()):
+        self.split_arrays = set(split_arrays)
+        self.text = ""
+        self.sections = {}
+        self.finished = False
+        self._pos = 0
+        self._started = False
+        self._depth = 0
+        self._open_positions: List[int] = []
+        self._state = "key"  # key -> colon -> value -> key
+        self._key: Optional[str] = None
+        self._value_start = 0
+        self._splitting = False
+        self._element_start = -1
+        self._element_delim = 0
+
+    def feed(self, chunk: str) -> List[Tuple[str, object]]:
+        self.text += chunk
+        events: List[Tuple[str, object]] = []
+        if self.finished:
+            return events
+        text = self.text
+        pos = self._pos
+        if not self._started:
+            start = text.find("{", pos)
+            if start < 0:
+                self._pos = len(text)
+                return events
+            self._started = True
+            self._depth = 1
+            pos = start + 1
+
+        for match in _TOKEN_RE.finditer(text, pos):
+            tok_start = match.start()
+            ch = text[tok_start]
+            depth = self._depth
+            if ch == '"':
+                if match.group(1) is None:
+                    pos = tok_start
+                    break
+                if depth == 1:
+                    if self._state == "key":
+                        self._key = json.loads(match.group())
+                        self._state = "colon"
+                    elif self._state == "value":
+                        self._emit_section(match.group(), events)
+            elif ch == "{" or ch == "[":
+                if depth == 2 and self._splitting and self._element_start < 0:
+                    self._element_start = tok_start
+                if depth == 1 and self._state == "value":
+                    self._value_start = tok_start
+                    if ch == "[" and self._key in self.split_arrays:
+                        self._splitting = True
+                        self._element_start = -1
+                        self._element_delim = tok_start + 1
+                        self.sections[self._key] = []
+                self._open_positions.append(tok_start)
+                self._depth = depth + 1
+            elif ch == "}" or ch == "]":
+                self._depth = depth - 1
+                opened_at = self._open_positions.pop() if self._open_positions else tok_start
+                if depth == 1:
+                    # The top-level object closed; flush a trailing scalar member
+                    if self._state == "value" and not _blank(text, self._value_start, tok_start):
+                        self._emit_section(text[self._value_start:tok_start], events)
+                    self.finished = True
+                    pos = tok_start + 1
+                    break
+                if depth == 2:
+                    if self._splitting:
+                        self._flush_scalar_element(tok_start, events)
+                        self._splitting = False
+                        self._key = None
+                        self._state = "key"
+                    else:
+                        self._emit_section(text[opened_at:tok_start + 1], events)
+                elif depth == 3 and self._splitting and self._element_start == opened_at:
+                    self._emit_element(text[opened_at:tok_start + 1], events)
+            elif ch == ",":
+                if depth == 1:
+                    if self._state == "value" and not _blank(text, self._value_start, tok_start):
+                        self._emit_section(text[self._value_start:tok_start], events)
+                    self._state = "key"
+                    self._key = None
+                elif depth == 2 and self._splitting:
+                    self._flush_scalar_element(tok_start, events)
+            elif ch == ":":
+                if depth == 1 and self._state == "colon":
+                    self._state = "value"
+                    self._value_start = tok_start + 1
+            pos = match.end()
+        else:
+            pos = len(text)
+
+        self._pos = pos
+        return events
+
+    def _flush_scalar_element(self, end: int, events: list):
+        """Emit a scalar element ended by ``,`` or the array's ``]``"""
+        start = self._element_delim
+        self._element_delim = end + 1
+        if self._element_start >= 0:
+            # A container element, already emitted when it closed
+            self._element_start = -1
+        elif not _blank(self.text, start, end):
+            self._emit_element(self.text[start:end], events)
+
+    def _emit_element(self, raw: str, events: list):
+        try:
+            value = loads_lenient(raw.strip())
+        except json.JSONDecodeError:
+            logger.debug(f"Skipping unparseable element in {self._key}")
+            return
+        self.sections[self._key].append(value)
+        events.append((self._key, value))
+
+    def _emit_section(self, raw: str, events: list):
+        key = self._key
+        self._key = None
+        self._state = "key"
+        try:
+            value = loads_lenient(raw.strip())
+        except json.JSONDecodeError:
+            logger.debug(f"Skipping unparseable section {key}")
+            return
+        self.sections[key] = value
+        events.append((key, value))
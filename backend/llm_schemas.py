@@ -0,0 +1,354 @@
+"""
+Response schemas for structured LLM output.
+
+Each JSON-producing endpoint describes its output as a pydantic model. The
+model is used three ways: a compact type outline of it goes into the prompt
+instead of a long example JSON blob, the request is sent in JSON mode so the
+completion is always a bare JSON object, and the completion is validated in
+one pass by a TypeAdapter compiled once at import. Defaults on the models
+fill the fields the endpoints used to patch up by hand.
+"""
+
+import json
+import logging
+import uuid
+from typing import Any, Dict, Generic, List, Optional, Type, TypeVar, Union
+
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, ValidationError, model_validator
+from pydantic.json_schema import SkipJsonSchema
+
+from llm_json import extract_json
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T", bound=BaseModel)
+
+JSON_MODE = {"type": "json_object"}
+
+Number = Union[int, float]
+
+# Filled in by the server; left out of the prompt so the model does not spend tokens on it
+ServerId = SkipJsonSchema[str]
+
+
+class LLMOutput(BaseModel):
+    """Base for model output: unknown keys are kept so nothing the model adds is lost"""
+    model_config = ConfigDict(extra="allow")
+
+
+class ResponseSchema(Generic[T]):
+    """A pydantic output model plus its compiled validator and prompt outline"""
+
+    def __init__(self, model: Type[T]):
+        self.model = model
+        self.adapter = TypeAdapter(model)
+        self.outline = describe(model.model_json_schema())
+
+    @property
+    def response_format(self) -> dict:
+        return JSON_MODE
+
+    def instructions(self) -> str:
+        """Prompt text asking for JSON in this schema"""
+        return f"Respond with only a JSON object of this shape (types shown in place of values):\n{self.outline}"
+
+    def parse(self, content: Optional[str]) -> Optional[T]:
+        """Validate a completion; returns None when it cannot be made to fit the schema.
+
+        JSON-mode output is validated straight from the string. Anything else
+        (code fences, trailing commas, output cut off at max_tokens) goes
+        through the lenient extractor first.
+        """
+        if not content:
+            return None
+        try:
+            return self.adapter.validate_json(content)
+        except ValidationError as e:
+            if not all(error["type"] == "json_invalid" for error in e.errors()):
+                logger.warning(f"{self.model.__name__} output failed validation: {e.error_count()} errors")
+                return None
+        data = extract_json(content)
+        if data is None:
+            return None
+        try:
+            return self.adapter.validate_python(data)
+        except ValidationError as e:
+            logger.warning(f"{self.model.__name__} output failed validation: {e.error_count()} errors")
+            return None
+
+    def accepts(self, content: Optional[str]) -> bool:
+        """Whether a completion fits the schema (e.g. for LLMGateway ``validate``)"""
+        return self.parse(content) is not None
+
+    def validate(self, data: Any) -> Optional[T]:
+        """Validate already-decoded data, e.g. an itinerary merged from several completions"""
+        try:
+            return self.adapter.validate_python(data)
+        except ValidationError as e:
+            logger.warning(f"{self.model.__name__} data failed validation: {e.error_count()} errors")
+            return None
+
+    def dump(self, value: T) -> dict:
+        return self.adapter.dump_python(value, mode="json", by_alias=True)
+
+
+def describe(schema: dict) -> str:
+    """Render a JSON Schema as a compact JSON-like outline, one top-level key per line"""
+    defs = schema.get("$defs", {})
+    properties = schema.get("properties", {})
+    lines = [f'  "{name}": {_describe(prop, defs)}' for name, prop in properties.items()]
+    return "{\n" + ",\n".join(lines) + "\n}"
+
+
+def _describe(schema: dict, defs: dict) -> str:
+    if "$ref" in schema:
+        text = _describe(defs[schema["$ref"].rsplit("/", 1)[-1]], defs)
+    elif "anyOf" in schema:
+        options = [_describe(option, defs) for option in schema["anyOf"] if option.get("type") != "null"]
+        if set(options) == {"int", "number"}:
+            options = ["number"]
+        text = " | ".join(options)
+    elif "enum" in schema:
+        text = " | ".join(json.dumps(value) for value in schema["enum"])
+    else:
+        kind = schema.get("type")
+        if kind == "object":
+            properties = schema.get("properties")
+            if properties:
+                text = "{" + ", ".join(f'"{name}": {_describe(prop, defs)}' for name, prop in properties.items()) + "}"
+            elif isinstance(schema.get("additionalProperties"), dict):
+                text = "{string: " + _describe(schema["additionalProperties"], defs) + "}"
+            else:
+                text = "object"
+        elif kind == "array":
+            text = "[" + _describe(schema.get("items", {}), defs) + "]"
+        elif kind == "integer":
+            text = "int"
+        elif kind:
+            text = kind
+        else:
+            text = "any"
+    description = schema.get("description")
+    return f"{text} ({description})" if description else text
+
+
+# --- Personalized recommendations ---
+
+DEFAULT_HIGHLIGHTS = ["Local Attractions", "Cultural Sites", "Natural Beauty", "Local Cuisine"]
+
+
+class RecommendedDestination(LLMOutput):
+    id: ServerId = Field(default_factory=lambda: str(uuid.uuid4()))
+    name: str
+    country: str = ""
+    description: str = Field("", description="2-3 sentences")
+    image_url: str = Field("", description="https://images.unsplash.com/photo-<id>?w=800&h=600&fit=crop")
+    rating: float = Field(4.5, description="4.0-5.0")
+    price: str = Field("$$", description="$, $$ or $$$")
+    highlights: List[str] = Field(default_factory=lambda: list(DEFAULT_HIGHLIGHTS), description="4 key attractions")
+
+
+class PersonalizedRecommendations(LLMOutput):
+    destinations: List[RecommendedDestination] = Field(description="10 destinations")
+    itinerary: List[Any] = Field(description="one entry per day")
+    travelTips: List[Any]
+    budgetBreakdown: Dict[str, Any]
+
+
+# --- Detailed itinerary ---
+
+class TripOverview(LLMOutput):
+    title: str = ""
+    destination: str = ""
+    duration: str = ""
+    travelers: Union[int, str] = 2
+    bestTime: str = ""
+    weather: str = ""
+    summary: str = ""
+
+
+class DetailedDay(LLMOutput):
+    day: int
+    title: str = ""
+    morning: List[str] = Field(default_factory=list)
+    afternoon: List[str] = Field(default_factory=list)
+    evening: List[str] = Field(default_factory=list)
+    accommodation: str = ""
+    meals: List[str] = Field(default_factory=list)
+    transportation: str = ""
+
+
+class CostItem(LLMOutput):
+    total: Number = 0
+    breakdown: Dict[str, Number] = Field(default_factory=dict)
+
+
+class AccommodationCost(CostItem):
+    perNight: Number = 0
+    type: str = Field("", description="e.g. 3-star hotel")
+    description: str = ""
+
+
+class MealsCost(CostItem):
+    perDay: Number = 0
+
+
+class BudgetBreakdown(LLMOutput):
+    accommodation: AccommodationCost = Field(default_factory=AccommodationCost)
+    meals: MealsCost = Field(default_factory=MealsCost)
+    activities: CostItem = Field(default_factory=CostItem)
+    transportation: CostItem = Field(default_factory=CostItem)
+    miscellaneous: CostItem = Field(default_factory=CostItem)
+    totalTripCost: Number = 0
+    costPerPerson: Number = 0
+    currency: str = "USD"
+
+
+class TipCategory(LLMOutput):
+    category: str
+    tips: List[str] = Field(default_factory=list)
+
+
+class AccommodationOption(LLMOutput):
+    name: str
+    type: str = ""
+    location: str = ""
+    amenities: List[str] = Field(default_factory=list)
+    price: str = Field("", description="e.g. 50/night")
+    rating: float = 4.0
+    pros: List[str] = Field(default_factory=list)
+    cons: List[str] = Field(default_factory=list)
+
+
+class RestaurantOption(LLMOutput):
+    name: str
+    cuisine: str = ""
+    specialty: str = ""
+    priceRange: str = Field("$$", description="$, $$ or $$$")
+    location: str = ""
+    rating: float = 4.0
+    bestDishes: List[str] = Field(default_factory=list)
+    reservationRequired: bool = False
+
+
+class DetailedItinerary(LLMOutput):
+    tripOverview: TripOverview
+    dailyItinerary: List[DetailedDay] = Field(description="one entry per day")
+    budgetBreakdown: BudgetBreakdown = Field(default_factory=BudgetBreakdown)
+    travelTips: List[TipCategory] = Field(default_factory=list, description="Packing, Local Customs, Safety")
+    accommodations: List[AccommodationOption] = Field(default_factory=list)
+    restaurants: List[RestaurantOption] = Field(default_factory=list)
+
+
+# Pieces of a long itinerary, generated by separate planner calls (see itinerary_planner)
+
+class OutlineDay(LLMOutput):
+    day: int
+    theme: str = Field("", description="short theme for the day")
+    area: str = Field("", description="neighbourhood or nearby town")
+
+
+class DetailedItinerarySkeleton(LLMOutput):
+    tripOverview: TripOverview
+    outline: List[OutlineDay] = Field(description="one entry per day, in order")
+
+
+class DetailedDayBlock(LLMOutput):
+    days: List[DetailedDay]
+
+
+class DetailedItinerarySections(LLMOutput):
+    budgetBreakdown: BudgetBreakdown = Field(default_factory=BudgetBreakdown)
+    travelTips: List[TipCategory] = Field(default_factory=list, description="Packing, Local Customs, Safety")
+    accommodations: List[AccommodationOption] = Field(default_factory=list)
+    restaurants: List[RestaurantOption] = Field(default_factory=list)
+
+
+# --- Booking search ---
+
+class FlightOption(LLMOutput):
+    id: ServerId = Field(default_factory=lambda: str(uuid.uuid4()))
+    airline: str
+    flightNumber: str = ""
+    from_: str = Field("", alias="from")
+    to: str = ""
+    departureTime: str = Field("", description="HH:MM AM/PM")
+    departureDate: str = Field("", description="YYYY-MM-DD")
+    duration: str = Field("", description="Xh Ym")
+    price: Number
+    aircraft: str = ""
+    stops: int = 0
+    class_: str = Field("", alias="class")
+
+
+class HotelOption(LLMOutput):
+    id: ServerId = Field(default_factory=lambda: str(uuid.uuid4()))
+    name: str
+    location: str = Field("", description="City, Country")
+    rating: float = Field(4.5, description="4.0-5.0")
+    price: Number
+    amenities: List[str] = Field(default_factory=list)
+    description: str = ""
+    image: str = Field("", description="Unsplash URL")
+    distance: str = Field("", description="e.g. 0.5 km from center")
+
+
+class ActivityOption(LLMOutput):
+    id: ServerId = Field(default_factory=lambda: str(uuid.uuid4()))
+    name: str
+    location: str = Field("", description="City, Country")
+    rating: float = 4.5
+    price: Number
+    duration: str = Field("", description="e.g. 3 hours")
+    description: str = ""
+    image: str = Field("", description="Unsplash URL")
+    category: str = Field("", description="Adventure, Culture, Food, ...")
+
+
+class PackageOption(LLMOutput):
+    id: ServerId = Field(default_factory=lambda: str(uuid.uuid4()))
+    name: str
+    from_: str = Field("", alias="from")
+    to: str = ""
+    duration: str = Field("", description="e.g. 7 days")
+    price: Number
+    description: str = ""
+    inclusions: List[str] = Field(default_factory=list)
+    image: str = Field("", description="Unsplash URL")
+
+
+class _BookingResults(LLMOutput):
+    @model_validator(mode="before")
+    @classmethod
+    def wrap_bare_list(cls, data):
+        # Older cached completions and non-JSON-mode replies are a bare array
+        return {"results": data} if isinstance(data, list) else data
+
+
+class FlightResults(_BookingResults):
+    results: List[FlightOption] = Field(description="6 options")
+
+
+class HotelResults(_BookingResults):
+    results: List[HotelOption] = Field(description="6 options")
+
+
+class ActivityResults(_BookingResults):
+    results: List[ActivityOption] = Field(description="6 options")
+
+
+class PackageResults(_BookingResults):
+    results: List[PackageOption] = Field(description="6 options")
+
+
+PERSONALIZED_RECOMMENDATIONS = ResponseSchema(PersonalizedRecommendations)
+DETAILED_ITINERARY = ResponseSchema(DetailedItinerary)
+DETAILED_ITINERARY_SKELETON = ResponseSchema(DetailedItinerarySkeleton)
+DETAILED_DAY_BLOCK = ResponseSchema(DetailedDayBlock)
+DETAILED_ITINERARY_SECTIONS = ResponseSchema(DetailedItinerarySections)
+BOOKING_RESULTS = {
+    "flights": ResponseSchema(FlightResults),
+    "hotels": ResponseSchema(HotelResults),
+    "activities": ResponseSchema(ActivityResults),
+    "packages": ResponseSchema(PackageResults),
+}
@@ -0,0 +1,153 @@
+"""
+Latency-aware model routing for LLM endpoints.
+
+Each routed endpoint has a chain of models, best quality first, and a p95
+latency target. The gateway reports the latency of every upstream call; the
+router keeps a rolling window of those samples per model and sends each
+request to the first model in the chain whose p95 is within the endpoint's
+target. Samples age out of the window, so a model that was shed gets traffic
+back once its slow samples expire. A per-request quality hint can pin the
+best ("high") or the fastest ("fast") model.
+"""
+
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+WINDOW_SECONDS = float(os.getenv("LLM_LATENCY_WINDOW_SECONDS", "600"))
+WINDOW_SAMPLES = int(os.getenv("LLM_LATENCY_WINDOW_SAMPLES", "200"))
+MIN_SAMPLES = int(os.getenv("LLM_LATENCY_MIN_SAMPLES", "10"))
+
+QUALITY_HINTS = ("high", "balanced", "fast")
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an unsorted list"""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class LatencyTracker:
+    """Rolling per-model latency samples, bounded by age and count"""
+
+    def __init__(self, window_seconds: float = WINDOW_SECONDS, max_samples: int = WINDOW_SAMPLES):
+        self.window_seconds = window_seconds
+        self.max_samples = max_samples
+        self._samples: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def record(self, model: str, latency_ms: float):
+        with self._lock:
+            samples = self._samples.setdefault(model, deque(maxlen=self.max_samples))
+            samples.append((time.monotonic(), latency_ms))
+
+    def latencies(self, model: str) -> List[float]:
+        with self._lock:
+            samples = self._samples.get(model)
+            if not samples:
+                return []
+            cutoff = time.monotonic() - self.window_seconds
+            while samples and samples[0][0] < cutoff:
+                samples.popleft()
+            return [latency for _, latency in samples]
+
+    def p95(self, model: str, min_samples: int = 1) -> Optional[float]:
+        latencies = self.latencies(model)
+        if len(latencies) < max(1, min_samples):
+            return None
+        return percentile(latencies, 95)
+
+    def stats(self) -> dict:
+        with self._lock:
+            models = list(self._samples)
+        result = {}
+        for model in models:
+            latencies = self.latencies(model)
+            if latencies:
+                result[model] = {
+                    "samples": len(latencies),
+                    "p50_ms": round(percentile(latencies, 50)),
+                    "p95_ms": round(percentile(latencies, 95)),
+                }
+        return result
+
+
+@dataclass
+class Route:
+    """Models an endpoint may use, best quality first, and its p95 latency target"""
+    models: List[str]
+    target_p95_ms: float
+
+
+class ModelRouter:
+    """Pick a model per request from rolling p95 latency and the caller's quality hint"""
+
+    def __init__(self, routes: Dict[str, Route], tracker: Optional[LatencyTracker] = None, min_samples: int = MIN_SAMPLES):
+        self.routes = routes
+        self.tracker = tracker or LatencyTracker()
+        self.min_samples = min_samples
+        self._choices: Dict[str, Dict[str, int]] = {}
+        self._current: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def choose(self, endpoint: str, quality: Optional[str] = None) -> str:
+        route = self.routes[endpoint]
+        if quality == "high":
+            model = route.models[0]
+        elif quality == "fast":
+            model = route.models[-1]
+        else:
+            model = self._within_target(route)
+            if model != self._current.get(endpoint, route.models[0]):
+                logger.warning(f"Routing {endpoint} to {model} (p95 target {route.target_p95_ms:.0f} ms)")
+            self._current[endpoint] = model
+        with self._lock:
+            counts = self._choices.setdefault(endpoint, {})
+            counts[model] = counts.get(model, 0) + 1
+        return model
+
+    def _within_target(self, route: Route) -> str:
+        p95s = {model: self.tracker.p95(model, self.min_samples) for model in route.models}
+        for model in route.models:
+            # Too few recent samples counts as healthy, so shed models get retried once their samples age out
+            if p95s[model] is None or p95s[model] <= route.target_p95_ms:
+                return model
+        # Every model is over target: take the fastest
+        return min(route.models, key=lambda m: p95s[m])
+
+    def stats(self) -> dict:
+        with self._lock:
+            choices = {endpoint: dict(counts) for endpoint, counts in self._choices.items()}
+        return {
+            "models": self.tracker.stats(),
+            "routes": {
+                endpoint: {
+                    "models": route.models,
+                    "target_p95_ms": route.target_p95_ms,
+                    "current": self._within_target(route),
+                    "chosen": choices.get(endpoint, {}),
+                }
+                for endpoint, route in self.routes.items()
+            },
+        }
+
+
+def parse_targets(raw: Optional[str]) -> Dict[str, float]:
+    """Parse "continents=6000,areas=4000" into per-endpoint targets in ms"""
+    targets = {}
+    for item in (raw or "").split(","):
+        name, _, value = item.partition("=")
+        if name.strip() and value.strip():
+            try:
+                targets[name.strip()] = float(value)
+            except ValueError:
+                logger.warning(f"Ignoring latency target {item!r}")
+    return targets
@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+Offline semantic search over destinations.
+
+Queries like "quiet beach with good food" are answered locally instead of by
+an LLM call. Each destination's name, place, highlights and description are
+embedded with a network-free model:
+
+* features are word unigrams and bigrams;
+* each feature is weighted by sublinear TF times IDF, with document
+  frequencies counted in hashed buckets;
+* a sparse random projection (each feature adds +-weight to a few
+  hash-chosen dimensions) maps the features into a dense float32 vector,
+  which is L2-normalized.
+
+The vectors live in a memory-mapped float32 matrix on disk. A top-k query is
+one matrix-vector product plus an argpartition. New or changed destinations
+are embedded and written in place; the IDF they were embedded with drifts as
+the corpus grows, so `reindex --full` re-embeds everything from scratch.
+
+    python semantic_index.py reindex [--full] [--source all|supabase|gazetteer]
+    python semantic_index.py search "quiet beach with good food" [-k 10]
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections.abc import Mapping
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from destination_filter import words
+from typeahead import read_gazetteer
+
+logger = logging.getLogger(__name__)
+
+DIM = int(os.getenv("SEMANTIC_INDEX_DIM", "256"))
+INDEX_DIR = Path(os.getenv("SEMANTIC_INDEX_DIR", str(Path(__file__).parent / "data" / "semantic_index")))
+IDF_BUCKETS = 1 << 18
+HASHES_PER_FEATURE = 4
+INITIAL_CAPACITY = 1024
+
+# Repetition weight of each field in a destination's text
+FIELD_WEIGHTS = {"name": 2.0, "highlights": 1.5, "description": 1.0, "place": 1.0}
+
+
+def features(text: str) -> List[str]:
+    tokens = words(text)
+    return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+
+@lru_cache(maxsize=200_000)
+def _projection(feature: str) -> Tuple[int, Tuple[int, ...], Tuple[float, ...]]:
+    """IDF bucket plus the dimensions and signs one feature projects onto"""
+    h = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+    dims = tuple(((h >> (12 * j)) & 0xFFF) % DIM for j in range(HASHES_PER_FEATURE))
+    signs = tuple(1.0 if (h >> (48 + j)) & 1 else -1.0 for j in range(HASHES_PER_FEATURE))
+    return h % IDF_BUCKETS, dims, signs
+
+
+def destination_id(dest: dict) -> str:
+    return f"{str(dest.get('name', '')).strip().lower()}|{str(dest.get('country', '')).strip().lower()}"
+
+
+def destination_fields(dest: dict) -> Dict[str, str]:
+    return {
+        "name": str(dest.get("name") or ""),
+        "place": " ".join(str(dest.get(key) or "") for key in ("city", "country", "continent")),
+        "highlights": " ".join(str(h) for h in dest.get("highlights") or dest.get("tags") or []),
+        "description": str(dest.get("description") or ""),
+    }
+
+
+def content_hash(dest: dict) -> str:
+    return hashlib.blake2b(json.dumps(destination_fields(dest), sort_keys=True).encode(), digest_size=8).hexdigest()
+
+
+class SemanticIndex:
+    """Memory-mapped float32 embedding matrix with hashed TF-IDF features"""
+
+    def __init__(self, path: Path = INDEX_DIR, dim: int = DIM):
+        self.path = Path(path)
+        self.dim = dim
+        self._lock = threading.Lock()
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._hashes: List[str] = []
+        self._docs: List[dict] = []
+        self._df = np.zeros(IDF_BUCKETS, dtype=np.int32)
+        self._n_docs = 0
+        self._matrix: Optional[np.memmap] = None
+        self._capacity = 0
+
+    @property
+    def count(self) -> int:
+        return len(self._ids)
+
+    # --- Persistence ---
+
+    def open(self) -> "SemanticIndex":
+        """Load the index from disk, or start an empty one"""
+        meta_path = self.path / "meta.json"
+        if meta_path.exists():
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("dim") == self.dim:
+                self._ids, self._hashes, self._docs = meta["ids"], meta["hashes"], meta["docs"]
+                self._rows = {doc_id: row for row, doc_id in enumerate(self._ids)}
+                self._n_docs = meta["n_docs"]
+                self._capacity = meta["capacity"]
+                self._df = np.load(self.path / "df.npy")
+                self._matrix = np.memmap(self.path / "vectors.f32", dtype=np.float32, mode="r+", shape=(self._capacity, self.dim))
+                logger.info(f"Semantic index opened with {self.count} destinations")
+                return self
+            logger.warning(f"Semantic index at {self.path} has dim {meta.get('dim')}, expected {self.dim}; starting empty")
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._grow(INITIAL_CAPACITY)
+        return self
+
+    def _grow(self, needed: int):
+        """Replace the vector file with a larger one; readers holding the old map keep working"""
+        capacity = max(needed, self._capacity * 2, INITIAL_CAPACITY)
+        tmp = self.path / "vectors.f32.tmp"
+        matrix = np.memmap(tmp, dtype=np.float32, mode="w+", shape=(capacity, self.dim))
+        if self._matrix is not None and self.count:
+            matrix[:self.count] = self._matrix[:self.count]
+        matrix.flush()
+        os.replace(tmp, self.path / "vectors.f32")
+        self._matrix, self._capacity = matrix, capacity
+
+    def _save(self):
+        self._matrix.flush()
+        tmp = self.path / "df.npy.tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, self._df)
+        os.replace(tmp, self.path / "df.npy")
+        meta = {
+            "dim": self.dim,
+            "capacity": self._capacity,
+            "n_docs": self._n_docs,
+            "ids": self._ids,
+            "hashes": self._hashes,
+            "docs": self._docs,
+        }
+        tmp = self.path / "meta.json.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            # Catalog destinations are Mappings (DestinationRecord), not dicts
+            json.dump(meta, f, default=dict)
+        os.replace(tmp, self.path / "meta.json")
+
+    # --- Embedding ---
+
+    def _idf(self, bucket: int) -> float:
+        return math.log((1 + self._n_docs) / (1 + self._df[bucket])) + 1.0
+
+    def embed(self, fields: Dict[str, str], known_only: bool = False) -> np.ndarray:
+        """L2-normalized embedding; ``known_only`` drops features no indexed document has (query noise)"""
+        tf: Dict[str, float] = {}
+        for field, text in fields.items():
+            weight = FIELD_WEIGHTS.get(field, 1.0)
+            for feature in features(text):
+                tf[feature] = tf.get(feature, 0.0) + weight
+        dims: List[int] = []
+        values: List[float] = []
+        for feature, count in tf.items():
+            bucket, feature_dims, signs = _projection(feature)
+            if known_only and not self._df[bucket]:
+                continue
+            weight = (1.0 + math.log(count)) * self._idf(bucket)
+            dims.extend(feature_dims)
+            values.extend(sign * weight for sign in signs)
+        vector = np.zeros(self.dim, dtype=np.float32)
+        if dims:
+            np.add.at(vector, dims, values)
+            norm = np.linalg.norm(vector)
+            if norm:
+                vector /= norm
+        return vector
+
+    # --- Indexing ---
+
+    def add(self, destinations: Iterable[dict]) -> int:
+        """Embed destinations that are new or whose text changed; returns how many were written"""
+        with self._lock:
+            pending = []
+            for dest in destinations:
+                if not isinstance(dest, Mapping) or not dest.get("name"):
+                    continue
+                doc_id = destination_id(dest)
+                digest = content_hash(dest)
+                row = self._rows.get(doc_id)
+                if row is not None and self._hashes[row] == digest:
+                    continue
+                pending.append((doc_id, digest, dest, row))
+                if row is None:
+                    # Count document frequency once per new document
+                    self._n_docs += 1
+                    buckets = {_projection(f)[0] for text in destination_fields(dest).values() for f in features(text)}
+                    self._df[list(buckets)] += 1
+            if not pending:
+                return 0
+            new_rows = sum(1 for *_, row in pending if row is None)
+            if self.count + new_rows > self._capacity:
+                self._grow(self.count + new_rows)
+            for doc_id, digest, dest, row in pending:
+                vector = self.embed(destination_fields(dest))
+                if row is None:
+                    row = self.count
+                    self._matrix[row] = vector
+                    # Publish the row only after its vector is written, so readers never score a blank row
+                    self._hashes.append(digest)
+                    self._docs.append(dest)
+                    self._rows[doc_id] = row
+                    self._ids.append(doc_id)
+                else:
+                    self._matrix[row] = vector
+                    self._hashes[row], self._docs[row] = digest, dest
+            self._save()
+            logger.info(f"Semantic index wrote {len(pending)} destinations ({new_rows} new), {self.count} total")
+            return len(pending)
+
+    def rebuild(self, destinations: Sequence[dict]) -> int:
+        """Re-embed everything with fresh document frequencies"""
+        with self._lock:
+            self._ids, self._rows, self._hashes, self._docs = [], {}, [], []
+            self._df = np.zeros(IDF_BUCKETS, dtype=np.int32)
+            self._n_docs = 0
+            self._matrix, self._capacity = None, 0
+            self._grow(max(INITIAL_CAPACITY, len(destinations)))
+        return self.add(destinations)
+
+    # --- Querying ---
+
+    def search(self, query: str, k: int = 10, continent: Optional[str] = None) -> List[Tuple[dict, float]]:
+        """Top-k destinations by cosine similarity to a free-text query"""
+        # Snapshot so a concurrent add cannot change the shapes mid-query. The count is read
+        # first: rows below it are in every matrix from then on, even after a _grow(). The
+        # clamp covers a rebuild() swapping in a smaller matrix and docs list in between.
+        count = self.count
+        matrix, docs = self._matrix, self._docs
+        if matrix is None:
+            return []
+        count = min(count, matrix.shape[0], len(docs))
+        if not count:
+            return []
+        vector = self.embed({"description": query}, known_only=True)
+        if not vector.any():
+            return []
+        scores = matrix[:count] @ vector
+        if continent:
+            wanted = continent.strip().lower()
+            mask = np.fromiter((str(doc.get("continent", "")).lower() == wanted for doc in docs[:count]), dtype=bool, count=count)
+            scores = np.where(mask, scores, -np.inf)
+        k = min(k, count)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(docs[i], float(scores[i])) for i in top if scores[i] > 0]
+
+    def stats(self) -> dict:
+        return {
+            "destinations": self.count,
+            "capacity": self._capacity,
+            "dim": self.dim,
+            "matrix_bytes": self._capacity * self.dim * 4,
+            "path": str(self.path),
+        }
+
+
+def gazetteer_destinations() -> List[dict]:
+    return [
+        {"name": row["name"], "country": row["country"], "continent": row["continent"], "kind": row["kind"], "highlights": row["tags"]}
+        for row in read_gazetteer()
+    ]
+
+
+def supabase_destinations() -> List[dict]:
+    from dotenv import load_dotenv
+    from supabase import create_client
+
+    load_dotenv()
+    url, key = os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY")
+    if not url or not key:
+        logger.warning("Supabase credentials not found, skipping stored destinations")
+        return []
+    return create_client(url, key).table("destinations").select("*").execute().data or []
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Build and query the semantic destination index")
+    commands = parser.add_subparsers(dest="command", required=True)
+    reindex = commands.add_parser("reindex", help="embed new and changed destinations")
+    reindex.add_argument("--full", action="store_true", help="re-embed everything with fresh IDF")
+    reindex.add_argument("--source", choices=["all", "supabase", "gazetteer"], default="all")
+    search = commands.add_parser("search", help="run a query against the index")
+    search.add_argument("query")
+    search.add_argument("-k", type=int, default=10)
+    search.add_argument("--continent")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    index = SemanticIndex().open()
+    if args.command == "reindex":
+        destinations = []
+        if args.source in ("all", "gazetteer"):
+            destinations += gazetteer_destinations()
+        if args.source in ("all", "supabase"):
+            destinations += supabase_destinations()
+        start = time.perf_counter()
+        written = index.rebuild(destinations) if args.full else index.add(destinations)
+        print(f"Indexed {written} of {len(destinations)} destinations in {time.perf_counter() - start:.2f}s; {index.count} in index")
+    else:
+        start = time.perf_counter()
+        results = index.search(args.query, args.k, args.continent)
+        elapsed = (time.perf_counter() - start) * 1000
+        for dest, score in results:
+            print(f"{score:.3f}  {dest.get('name')}, {dest.get('country', '')}")
+        print(f"{len(results)} results in {elapsed:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+In-flight request registry.
+
+Concurrent callers asking for the same key share one upstream call: the first
+caller starts it and every duplicate awaits the same task.
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key into a single awaitable"""
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._leaders = 0
+        self._followers = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """Run ``fn`` once per key; concurrent duplicates await the same result"""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            self._leaders += 1
+            task.add_done_callback(lambda t, k=key: self._finish(k, t))
+        else:
+            self._followers += 1
+            logger.debug(f"Joining in-flight request {key[:12]}")
+        # Shield so one caller disconnecting does not cancel the call for everyone else
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Mark the exception as retrieved even if every waiter went away
+            task.exception()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._inflight),
+            "upstream_calls": self._leaders,
+            "coalesced_calls": self._followers,
+        }
@@ -0,0 +1,361 @@
+"""
+Typeahead engine for /api/destination-suggestions.
+
+Suggestions come from a local index instead of an LLM call per keystroke.
+The index is built from the bundled gazetteer (data/gazetteer.tsv) and the
+destinations in the catalog, and it has three parts:
+
+* a compressed (radix) trie over place names, every word suffix of a name
+  ("york" finds New York) and theme tags ("beach"). Each trie node keeps its
+  most popular entries, so a prefix lookup costs one walk down the trie.
+* a trigram index that catches typos ("barcelnoa") when the prefix lookup
+  comes up short.
+* popularity ranking: entries carry a popularity score, and each kind of
+  match (full name, word, tag, fuzzy) scales it.
+
+When a query finds too little, the LLM is asked for suggestions in the
+background and its answers are added to the index for the next keystroke.
+The request itself never waits for it.
+"""
+
+import asyncio
+import bisect
+import logging
+import os
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+GAZETTEER_PATH = Path(__file__).parent / "data" / "gazetteer.tsv"
+
+TOP_K = 24  # entries kept per trie node; enough for one page of suggestions plus dedupe
+MIN_RESULTS = int(os.getenv("TYPEAHEAD_MIN_RESULTS", "3"))
+MAX_PENDING_ENRICHMENTS = int(os.getenv("TYPEAHEAD_MAX_PENDING_ENRICHMENTS", "4"))
+ENRICHED_QUERIES = 2048  # queries already sent to the LLM, not asked again
+FUZZY_MIN_SIMILARITY = 0.45
+
+# How much of an entry's popularity each kind of match keeps
+NAME_WEIGHT = 1.0
+WORD_WEIGHT = 0.8
+TAG_WEIGHT = 0.5
+
+Enricher = Callable[[str], Awaitable[List[str]]]
+
+
+def normalize(text: str) -> str:
+    """Lower-case, strip accents and punctuation, collapse whitespace"""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return " ".join(re.sub(r"[^0-9a-z]+", " ", text.lower()).split())
+
+
+def trigrams(text: str, pad_end: bool = True) -> Set[str]:
+    padded = f"  {text} " if pad_end else f"  {text}"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+@dataclass
+class Place:
+    label: str
+    name: str
+    country: str
+    kind: str
+    popularity: float
+    tags: Tuple[str, ...] = ()
+    source: str = "gazetteer"
+
+
+class _Node:
+    __slots__ = ("label", "children", "top")
+
+    def __init__(self, label: str = ""):
+        self.label = label
+        self.children: Dict[str, "_Node"] = {}
+        self.top: List[Tuple[float, int]] = []  # (-score, place id), best first
+
+
+class RadixTrie:
+    """Compressed prefix tree; every node keeps the ids of its best-scoring entries"""
+
+    def __init__(self, top_k: int = TOP_K):
+        self.root = _Node()
+        self.top_k = top_k
+        self.nodes = 1
+
+    def insert(self, key: str, place_id: int, score: float):
+        node, i = self.root, 0
+        while True:
+            self._push(node, place_id, score)
+            if i == len(key):
+                return
+            child = node.children.get(key[i])
+            if child is None:
+                leaf = _Node(key[i:])
+                self._push(leaf, place_id, score)
+                node.children[key[i]] = leaf
+                self.nodes += 1
+                return
+            common = _common_prefix(child.label, key, i)
+            if common < len(child.label):
+                # Split the edge so the shared part becomes its own node
+                middle = _Node(child.label[:common])
+                middle.top = list(child.top)
+                child.label = child.label[common:]
+                middle.children[child.label[0]] = child
+                node.children[key[i]] = middle
+                self.nodes += 1
+                child = middle
+            node, i = child, i + common
+
+    def search(self, prefix: str) -> List[Tuple[float, int]]:
+        """Best (-score, place id) pairs for keys starting with ``prefix``"""
+        node, i = self.root, 0
+        while i < len(prefix):
+            child = node.children.get(prefix[i])
+            if child is None:
+                return []
+            rest = prefix[i:]
+            if rest.startswith(child.label):
+                node, i = child, i + len(child.label)
+            elif child.label.startswith(rest):
+                return child.top
+            else:
+                return []
+        return node.top
+
+    def _push(self, node: _Node, place_id: int, score: float):
+        top = node.top
+        for index, (neg_score, existing) in enumerate(top):
+            if existing == place_id:
+                if -neg_score >= score:
+                    return
+                del top[index]
+                break
+        if len(top) >= self.top_k and -score >= top[-1][0]:
+            return
+        bisect.insort(top, (-score, place_id))
+        del top[self.top_k:]
+
+
+def _common_prefix(label: str, key: str, start: int) -> int:
+    n = 0
+    limit = min(len(label), len(key) - start)
+    while n < limit and label[n] == key[start + n]:
+        n += 1
+    return n
+
+
+class TypeaheadIndex:
+    """Prefix, fuzzy and popularity-ranked suggestions over a growing set of places"""
+
+    def __init__(self, enrich: Optional[Enricher] = None, min_results: int = MIN_RESULTS):
+        self.enrich = enrich
+        self.min_results = min_results
+        self.places: List[Place] = []
+        self._ids: Dict[Tuple[str, str], int] = {}
+        self._trie = RadixTrie()
+        self._trigrams: Dict[str, List[int]] = {}
+        self._enriched: "OrderedDict[str, None]" = OrderedDict()
+        self._pending: Set[asyncio.Task] = set()
+        self._counters = {"queries": 0, "fuzzy": 0, "misses": 0, "enrichments": 0, "enriched_places": 0}
+
+    # --- Building ---
+
+    def add(self, place: Place) -> bool:
+        """Index a place; returns False if it is already indexed"""
+        name = normalize(place.name)
+        if not name:
+            return False
+        key = (name, normalize(place.country))
+        if key in self._ids:
+            return False
+        place_id = len(self.places)
+        self.places.append(place)
+        self._ids[key] = place_id
+
+        self._trie.insert(name, place_id, place.popularity * NAME_WEIGHT)
+        words = name.split(" ")
+        for i in range(1, len(words)):
+            self._trie.insert(" ".join(words[i:]), place_id, place.popularity * WORD_WEIGHT)
+        for tag in place.tags:
+            tag = normalize(tag)
+            if tag and tag != name:
+                self._trie.insert(tag, place_id, place.popularity * TAG_WEIGHT)
+        for gram in trigrams(name):
+            self._trigrams.setdefault(gram, []).append(place_id)
+        return True
+
+    def load_gazetteer(self, path: Path = GAZETTEER_PATH) -> int:
+        added = 0
+        for row in read_gazetteer(path):
+            added += self.add(Place(
+                label=format_label(row["name"], row["country"], row["kind"]),
+                name=row["name"],
+                country=row["country"],
+                kind=row["kind"],
+                popularity=row["popularity"],
+                tags=tuple(row["tags"]),
+            ))
+        logger.info(f"Typeahead loaded {added} gazetteer places from {path.name}")
+        return added
+
+    def add_destinations(self, destinations: Iterable[dict], source: str = "catalog") -> int:
+        """Index catalog destinations; popularity follows their rating"""
+        added = 0
+        for dest in destinations:
+            name, country = split_label(str(dest.get("name", "")))
+            country = str(dest.get("country") or country)
+            if not name:
+                continue
+            rating = dest.get("rating")
+            popularity = 40 + 5 * float(rating) if isinstance(rating, (int, float)) else 55
+            added += self.add(Place(
+                label=format_label(name, country, "destination"),
+                name=name,
+                country=country,
+                kind="destination",
+                popularity=popularity,
+                tags=tuple(str(h) for h in dest.get("highlights") or [] if isinstance(h, str))[:4],
+                source=source,
+            ))
+        return added
+
+    # --- Querying ---
+
+    def suggest(self, query: str, limit: int = 12) -> List[str]:
+        """Suggestion labels for a partial query, best first"""
+        self._counters["queries"] += 1
+        q = normalize(query)
+        if not q:
+            return []
+        scored: Dict[int, float] = {}
+        for neg_score, place_id in self._trie.search(q):
+            scored[place_id] = -neg_score
+        if len(scored) < limit and len(q) >= 3:
+            self._counters["fuzzy"] += 1
+            for place_id, score in self._fuzzy(q, limit):
+                scored.setdefault(place_id, score)
+        ranked = sorted(scored.items(), key=lambda item: -item[1])
+        labels = _unique(self.places[place_id].label for place_id, _ in ranked)[:limit]
+        if len(labels) < self.min_results:
+            self._counters["misses"] += 1
+            self._schedule_enrichment(q)
+        return labels
+
+    def _fuzzy(self, q: str, limit: int) -> List[Tuple[int, float]]:
+        # The query is usually a partial word, so its end is not padded
+        grams = trigrams(q, pad_end=False)
+        shared: Dict[int, int] = {}
+        for gram in grams:
+            for place_id in self._trigrams.get(gram, ()):
+                shared[place_id] = shared.get(place_id, 0) + 1
+        matches = []
+        for place_id, count in shared.items():
+            similarity = count / len(grams)
+            if similarity >= FUZZY_MIN_SIMILARITY:
+                # Fuzzy hits rank below prefix hits of similar popularity
+                matches.append((place_id, similarity * self.places[place_id].popularity * TAG_WEIGHT))
+        matches.sort(key=lambda item: -item[1])
+        return matches[:limit]
+
+    # --- LLM enrichment ---
+
+    def _schedule_enrichment(self, q: str):
+        if not self.enrich or q in self._enriched or len(self._pending) >= MAX_PENDING_ENRICHMENTS:
+            return
+        self._enriched[q] = None
+        while len(self._enriched) > ENRICHED_QUERIES:
+            self._enriched.popitem(last=False)
+        try:
+            task = asyncio.get_running_loop().create_task(self._enrich(q))
+        except RuntimeError:
+            return
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _enrich(self, q: str):
+        start = time.perf_counter()
+        try:
+            labels = await self.enrich(q)
+        except Exception as e:
+            logger.warning(f"Typeahead enrichment for {q!r} failed: {e}")
+            return
+        added = 0
+        for rank, label in enumerate(labels or []):
+            if not isinstance(label, str):
+                continue
+            name, country = split_label(label)
+            added += self.add(Place(
+                label=label.strip(),
+                name=name,
+                country=country,
+                kind="suggestion",
+                popularity=max(20.0, 50.0 - rank),
+                source="openai",
+            ))
+        self._counters["enrichments"] += 1
+        self._counters["enriched_places"] += added
+        logger.info(f"Typeahead enriched {q!r} with {added} places in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    def stats(self) -> dict:
+        sources: Dict[str, int] = {}
+        for place in self.places:
+            sources[place.source] = sources.get(place.source, 0) + 1
+        return {
+            "places": len(self.places),
+            "sources": sources,
+            "trie_nodes": self._trie.nodes,
+            "trigrams": len(self._trigrams),
+            "pending_enrichments": len(self._pending),
+            **self._counters,
+        }
+
+
+def read_gazetteer(path: Path = GAZETTEER_PATH) -> List[dict]:
+    """Rows of the bundled gazetteer: name, country, kind, popularity, tags, continent"""
+    rows = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip() or line.startswith("#"):
+                continue
+            name, country, kind, popularity, tags, continent = (line.rstrip("\n").split("\t") + [""] * 6)[:6]
+            rows.append({
+                "name": name,
+                "country": country,
+                "kind": kind,
+                "popularity": float(popularity or 50),
+                "tags": [tag.strip() for tag in tags.split(",") if tag.strip()],
+                "continent": continent,
+            })
+    return rows
+
+
+def format_label(name: str, country: str, kind: str) -> str:
+    if kind == "country" or not country or normalize(country) == normalize(name):
+        return name
+    return f"{name}, {country}"
+
+
+def split_label(label: str) -> Tuple[str, str]:
+    """'Paris, France' -> ('Paris', 'France'); a label without a comma has no country"""
+    name, _, country = label.rpartition(",")
+    if not name:
+        return label.strip(), ""
+    return name.strip(), country.strip()
+
+
+def _unique(labels: Iterable[str]) -> List[str]:
+    seen = set()
+    result = []
+    for label in labels:
+        key = normalize(label)
+        if key not in seen:
+            seen.add(key)
+            result.append(label)
+    return result
@@ -555,19 +555,30 @@ class APIService {
   }
 
   // Add the missing generatePhotoAppImage method
-  async generatePhotoAppImage(file, prompt) {
+  async generatePhotoAppImage(file, prompt, onProgress) {
     try {
       const formData = new FormData();
       formData.append("selfie", file);
       formData.append("prompt", prompt);
 
-      const response = await fetch(`${this.baseURL}/generate-photo-app-image`, {
-        method: "POST",
-        body: formData,
-      });
+      // Queue the job and follow its progress instead of holding the request open
+      const response = await fetch(
+        `${this.baseURL}/generate-photo-app-image?wait=false`,
+        {
+          method: "POST",
+          body: formData,
+        }
+      );
 
       if (response.ok) {
-        return await response.json();
+        const job = await response.json();
+        if (!job.job_id) {
+          return job;
+        }
+        const finished = await this.waitForImageJob(job.job_id, onProgress);
+        return finished.status === "succeeded"
+          ? finished.result
+          : { success: false, error: finished.error };
       } else {
         throw new Error("Failed to generate photo app image");
       }
@@ -576,4 +587,85 @@ class APIService {
       throw error;
     }
   }
+
+  // Put the user into a destination scene via the image job queue
+  async generateVisualization(
+    userPhotoUrl,
+    destinationId = null,
+    prompt = null,
+    onProgress
+  ) {
+    try {
+      const data = { user_photo_url: userPhotoUrl, prompt: prompt || "" };
+      if (destinationId) data.destination_id = destinationId;
+
+      // Queue the job and follow its progress instead of holding the request open
+      const response = await fetch(
+        `${this.baseURL}/generate-visualization?wait=false`,
+        {
+          method: "POST",
+          headers: { "Content-Type": "application/json" },
+          body: JSON.stringify(data),
+        }
+      );
+
+      if (response.ok) {
+        const job = await response.json();
+        if (!job.job_id) {
+          return job;
+        }
+        const finished = await this.waitForImageJob(job.job_id, onProgress);
+        return finished.status === "succeeded"
+          ? finished.result
+          : { success: false, error: finished.error };
+      } else {
+        throw new Error("Failed to generate visualization");
+      }
+    } catch (error) {
+      console.error("Visualization generation error:", error);
+      throw error;
+    }
+  }
+
+  // Resolve with an image job's final state, reporting progress along the way
+  waitForImageJob(jobId, onProgress) {
+    const statusUrl = `${this.baseURL}/image-jobs/${jobId}`;
+    const poll = async () => {
+      while (true) {
+        const response = await fetch(statusUrl);
+        if (!response.ok) {
+          throw new Error("Image job not found");
+        }
+        const job = await response.json();
+        if (onProgress) onProgress(job);
+        if (job.status === "succeeded" || job.status === "failed") {
+          return job;
+        }
+        await new Promise((resolve) => setTimeout(resolve, 2000));
+      }
+    };
+    if (typeof EventSource === "undefined") {
+      return poll();
+    }
+    return new Promise((resolve, reject) => {
+      const source = new EventSource(`${statusUrl}/events`);
+      const finish = (event) => {
+        source.close();
+        resolve(JSON.parse(event.data));
+      };
+      source.addEventListener("progress", (event) => {
+        if (onProgress) onProgress(JSON.parse(event.data));
+      });
+      source.addEventListener("complete", finish);
+      source.addEventListener("error", (event) => {
+        if (event.data) {
+          finish(event);
+        } else {
+          // Stream dropped: fall back to polling the job status
+          source.close();
+          poll().then(resolve, reject);
+        }
+      });
+    });
+  }
 }
@@ -481,7 +481,7 @@ class RecommendationsPage {
       const userPrefs = this.getFormData();
 
       const response = await fetch(
-        "http://localhost:8000/api/generate-detailed-itinerary",
+        "http://localhost:8000/api/generate-detailed-itinerary/stream",
         {
           method: "POST",
           headers: {
@@ -496,15 +496,30 @@ class RecommendationsPage {
         }
       );
 
-      if (!response.ok) {
+      if (!response.ok || !response.body) {
         throw new Error(`HTTP error! status: ${response.status}`);
       }
 
-      const data = await response.json();
+      // Render each section as soon as the server finishes it
+      const partialItinerary = { dailyItinerary: [] };
+      let completed = false;
+      await this.readEventStream(response, (event, payload) => {
+        if (event === "complete") {
+          completed = true;
+          this.displayDetailedItinerary(payload.data, dest);
+        } else if (event === "error") {
+          throw new Error(payload.detail || "Failed to generate itinerary");
+        } else {
+          if (event === "dailyItinerary") {
+            partialItinerary.dailyItinerary.push(payload);
+          } else {
+            partialItinerary[event] = payload;
+          }
+          this.displayDetailedItinerary(partialItinerary, dest);
+        }
+      });
 
-      if (data.success && data.data) {
-        this.displayDetailedItinerary(data.data, dest);
-      } else {
+      if (!completed) {
         throw new Error("Failed to generate itinerary");
       }
     } catch (error) {
@@ -514,6 +529,32 @@ class RecommendationsPage {
     }
   }
 
+  async readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      let boundary;
+      while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+        const message = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+
+        let event = "message";
+        let data = "";
+        message.split("\n").forEach((line) => {
+          if (line.startsWith("event:")) event = line.slice(6).trim();
+          else if (line.startsWith("data:")) data += line.slice(5).trim();
+        });
+        if (data) onEvent(event, JSON.parse(data));
+      }
+    }
+  }
+
   getBudgetLevel(budgetRange) {
     if (budgetRange <= 1000) return "budget";
     if (budgetRange <= 3000) return "mid-range";